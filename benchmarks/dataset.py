@@ -0,0 +1,129 @@
+import argparse
+import hashlib
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from utils.database import InvoiceRepository
+from utils.pdf_store import PdfStore
+
+# 报销内容：中英文混合
+CONTENTS = (
+    '办公用品', '打印纸 A4', '服务器租用', '咖啡豆', '出租车费', '高铁票 北京-上海', '会议室预订',
+    '显示器 Dell U2723QE', '键盘 Keychron K2', 'USB-C 扩展坞', 'AWS 账单', 'GitHub Copilot 订阅',
+    '午餐 team building', '快递费 顺丰', '域名续费 example.com', '培训课程 Python', '云服务器 ECS',
+    'MacBook 充电器', '团建聚餐', '酒店住宿 Hilton',
+)
+PLATFORMS = ('京东', '淘宝', '天猫', '拼多多', '美团', '滴滴', '12306', 'Amazon', 'Apple Store', '')
+NOTES = ('', '', '', '加急', '项目A', 'project B', '已开专票', '发票后补')
+
+# 生成的数据覆盖的时间范围（天）
+DATE_RANGE_DAYS = 3 * 365
+
+
+def make_pdf(text):
+    """生成一个只有一页、包含一行文字的最小PDF"""
+    stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode('latin-1')
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R '
+        b'/Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref_offset = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        output += b'%010d 00000 n \n' % offset
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+    return bytes(output)
+
+
+def write_pdfs(store, count, rng):
+    """在存储中生成 count 个不同的PDF，返回存储路径列表"""
+    paths = []
+    for number in range(count):
+        data = make_pdf(f'Invoice No. {rng.randrange(10 ** 8):08d}  Seller ACME-{number}  Total {rng.randrange(10 ** 5)}')
+        path = store.path_for(hashlib.sha256(data).hexdigest())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def generate_rows(count, pdf_paths, pdf_ratio, rng):
+    """逐行生成插入参数（与 SQL_INSERT 的参数顺序一致）"""
+    now = datetime.now()
+    for _ in range(count):
+        created_at = now - timedelta(seconds=rng.randrange(DATE_RANGE_DAYS * 24 * 60 * 60))
+        content = rng.choice(CONTENTS)
+        if rng.random() < 0.5:
+            content += f' #{rng.randrange(10000)}'
+        yield (
+            content,
+            rng.choice(PLATFORMS),
+            rng.choice(('垫付', '自费')),
+            round(rng.lognormvariate(4, 1.2), 2),
+            rng.choice(NOTES),
+            rng.choice(pdf_paths) if pdf_paths and rng.random() < pdf_ratio else None,
+            rng.random() < 0.6,
+            created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        )
+
+
+def generate_dataset(db_path, rows, pdf_dir=None, pdf_ratio=0.3, max_pdfs=2000, seed=0, progress=None):
+    """生成包含 rows 条发票的数据库（一个事务内分批写入），返回生成的PDF文件数"""
+    rng = random.Random(seed)
+    pdf_paths = []
+    if pdf_dir and pdf_ratio > 0:
+        pdf_paths = write_pdfs(PdfStore(pdf_dir), min(max_pdfs, max(1, int(rows * pdf_ratio))), rng)
+
+    repo = InvoiceRepository(db_path)
+    try:
+        batch = []
+        with repo.conn:
+            for number, params in enumerate(generate_rows(rows, pdf_paths, pdf_ratio, rng), start=1):
+                batch.append(params)
+                if len(batch) >= 10000:
+                    repo.insert_many(batch, repo.conn)
+                    batch = []
+                    if progress:
+                        progress(number, rows)
+            if batch:
+                repo.insert_many(batch, repo.conn)
+        repo.conn.execute('ANALYZE')
+    finally:
+        repo.close()
+    return len(pdf_paths)
+
+
+def main(argv=None):
+    """生成基准测试用的数据库"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.dataset', description='生成合成发票数据')
+    parser.add_argument('rows', type=int, help='发票数量（如 1000 到 1000000）')
+    parser.add_argument('--db', default='bench_invoices.db', help='输出数据库文件（不能已存在）')
+    parser.add_argument('--pdf-dir', default='./bench_invoices_pdf', help='PDF存储目录')
+    parser.add_argument('--pdf-ratio', type=float, default=0.3, help='带PDF附件的发票比例')
+    parser.add_argument('--max-pdfs', type=int, default=2000, help='最多生成的不同PDF文件数')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        parser.error(f"数据库文件已存在：{args.db}")
+    pdf_count = generate_dataset(
+        args.db, args.rows, args.pdf_dir, args.pdf_ratio, args.max_pdfs, args.seed,
+        progress=lambda done, total: print(f"\r{done}/{total}", end='', file=sys.stderr))
+    print(f"\n已生成 {args.rows} 条发票，{pdf_count} 个PDF：{args.db}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,378 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.dataset import generate_dataset
+from utils.database import InvoiceRepository, InvoiceFilter, DEFAULT_SORT_KEYS
+from utils.invoice_cache import InvoiceCache
+
+# 注册的基准测试：[(名称, 函数, 是否需要图形界面), ...]
+BENCHMARKS = []
+
+# 模拟逐字输入的搜索词（每次按键查询一次）
+SEARCH_TERMS = ('keychron', '高铁票 北京', 'aws')
+
+# 点击表头时轮流使用的排序
+SORT_SEQUENCE = (
+    [('amount', True)],
+    [('content', False)],
+    [('platform', False), ('amount', True)],
+    [('created_at', True)],
+    [('reimbursed', False), ('expense_type', False), ('amount', True)],
+)
+
+PAGE_SIZE = 100
+
+
+def benchmark(name, gui=False):
+    """注册基准测试：函数接收 BenchContext，返回每次调用执行一次被测操作的函数"""
+    def register(function):
+        BENCHMARKS.append((name, function, gui))
+        return function
+    return register
+
+
+class BenchContext:
+    """基准测试共用的数据库、目录和计数器"""
+
+    def __init__(self, db_path, pdf_dir, work_dir):
+        self.db_path = db_path
+        self.pdf_dir = pdf_dir
+        self.work_dir = work_dir
+        self.repo = InvoiceRepository(db_path)
+        self.rows = self.repo.get_summary()['count']
+        self.max_id = self.repo.conn.execute('SELECT MAX(id) FROM invoices').fetchone()[0] or 0
+        self.counter = 0
+        # 测试结束、删除临时目录前需要执行的清理
+        self.cleanups = []
+
+    def next(self):
+        """每次调用递增，用于在输入之间轮换"""
+        self.counter += 1
+        return self.counter
+
+    def close(self):
+        for cleanup in self.cleanups:
+            cleanup()
+        self.repo.close()
+
+
+def keystrokes(term):
+    """逐字输入 term 时依次出现的搜索框内容"""
+    return [term[:length] for length in range(1, len(term) + 1)]
+
+
+@benchmark('refresh_invoice_list')
+def bench_refresh(context):
+    def run():
+        # 与 InvoiceManager.refresh_invoice_list 的后台查询相同：第一页 + 统计 + 汇总
+        context.repo.list_page('', DEFAULT_SORT_KEYS, None, PAGE_SIZE)
+        context.repo.get_statistics('')
+        context.repo.get_summary()
+    return run
+
+
+@benchmark('search_keystroke')
+def bench_search(context):
+    inputs = [text for term in SEARCH_TERMS for text in keystrokes(term)]
+
+    def run():
+        text = inputs[context.next() % len(inputs)]
+        context.repo.list_page(text, DEFAULT_SORT_KEYS, None, PAGE_SIZE)
+        context.repo.get_statistics(text)
+    return run
+
+
+@benchmark('sort_column')
+def bench_sort(context):
+    def run():
+        sort_keys = SORT_SEQUENCE[context.next() % len(SORT_SEQUENCE)]
+        context.repo.list_page('', sort_keys, None, PAGE_SIZE)
+    return run
+
+
+@benchmark('load_next_page')
+def bench_next_page(context):
+    # 从第一页开始连续向下滚动（键集分页）
+    state = {'after': None}
+
+    def run():
+        rows = context.repo.list_page('', SORT_SEQUENCE[0], state['after'], PAGE_SIZE)
+        state['after'] = rows[-1] if len(rows) == PAGE_SIZE else None
+    return run
+
+
+@benchmark('filter_unreimbursed_quarter')
+def bench_filter(context):
+    # "最近一个季度还有哪些没报销"：第一页 + 筛选后的统计
+    today = datetime.now().date()
+    filters = InvoiceFilter(today - timedelta(days=91), today, reimbursed=False)
+
+    def run():
+        context.repo.list_page('', DEFAULT_SORT_KEYS, None, PAGE_SIZE, filters=filters)
+        context.repo.get_statistics('', filters=filters)
+    return run
+
+
+@benchmark('update_statistics')
+def bench_statistics(context):
+    def run():
+        context.repo.get_summary()
+        context.repo.get_statistics('')
+    return run
+
+
+@benchmark('update_statistics_search')
+def bench_statistics_search(context):
+    def run():
+        context.repo.get_summary()
+        context.repo.get_statistics(SEARCH_TERMS[context.next() % len(SEARCH_TERMS)])
+    return run
+
+
+@benchmark('on_select')
+def bench_select(context):
+    cache = InvoiceCache(context.repo)
+
+    def run():
+        # 跳到任意一行：详情缓存未命中，读取该行并预取上下各一页
+        invoice_id = context.next() * 7919 % context.max_id + 1
+        cache.clear()
+        cache.get(invoice_id)
+        cache.prefetch(range(max(1, invoice_id - 100), invoice_id + 101))
+    return run
+
+
+@benchmark('on_select_arrow_key')
+def bench_select_arrow(context):
+    # 按住方向键逐行移动：与主窗口相同，接近已缓存范围的边缘时预取下一页
+    cache = InvoiceCache(context.repo)
+    state = {'id': context.max_id}
+
+    def run():
+        invoice_id = state['id'] = state['id'] - 1 if state['id'] > 1 else context.max_id
+        cache.get(invoice_id)
+        if cache.missing(range(max(1, invoice_id - 10), invoice_id + 11)):
+            cache.prefetch(range(max(1, invoice_id - 100), invoice_id + 101))
+    return run
+
+
+@benchmark('save_invoice')
+def bench_save(context):
+    def run():
+        context.repo.insert_invoice({
+            'content': f'基准测试 benchmark {context.next()}',
+            'platform': '京东',
+            'expense_type': '垫付',
+            'amount': 123.45,
+            'note': '',
+            'pdf_path': None,
+            'reimbursed': False,
+        }, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    return run
+
+
+@benchmark('create_backup')
+def bench_backup(context):
+    from utils.backup import BackupManager
+
+    backup_dir = os.path.join(context.work_dir, 'backups')
+    manager = BackupManager(context.db_path, backup_dir, context.pdf_dir, auto_start=False)
+    # 第一次是完整备份，不计入结果；之后测量的是日常的增量备份
+    manager.create_backup()
+    context.cleanups.append(lambda: manager.verify_thread and manager.verify_thread.join())
+
+    def run():
+        # 上一次备份的后台校验结束后再开始，避免互相影响
+        manager.verify_thread.join()
+        started = time.perf_counter()
+        manager.create_backup()
+        return time.perf_counter() - started
+    return run
+
+
+@benchmark('treeview_sort_column', gui=True)
+def bench_treeview_sort(context):
+    import tkinter as tk
+    from components.treeview import InvoiceTreeview
+
+    root = tk.Tk()
+    root.withdraw()
+    tree = InvoiceTreeview(root)
+
+    def reload(sort_keys):
+        # 与主窗口相同：重新查询第一页并替换表格内容（这里的分页查询同步执行）
+        def load_page(anchor, backward, limit, on_done):
+            if backward:
+                on_done(context.repo.list_page('', sort_keys, None, limit, before=anchor))
+            else:
+                on_done(context.repo.list_page('', sort_keys, anchor, limit))
+        tree.set_page_loader(load_page, context.repo.list_page('', sort_keys, None, tree.PAGE_SIZE))
+
+    tree.sort_callback = reload
+    context.cleanups.append(root.destroy)
+    columns = ('amount', 'content', 'platform', 'created_at', 'id')
+
+    def run():
+        tree.sort_column(columns[context.next() % len(columns)])
+        root.update_idletasks()
+    return run
+
+
+def time_benchmark(function, context, repeat, warmup):
+    """执行 warmup 次预热后计时 repeat 次，返回每次的毫秒数"""
+    run = function(context)
+    for _ in range(warmup):
+        run()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        measured = run()
+        # 被测函数可以返回自己测得的耗时（排除等待等准备工作）
+        elapsed = measured if measured is not None else time.perf_counter() - started
+        samples.append(elapsed * 1000)
+    return samples
+
+
+def summarize(name, samples):
+    ordered = sorted(samples)
+    return {
+        'name': name,
+        'runs': len(samples),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def git_revision():
+    """当前提交，用于跨提交比较结果"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def gui_available():
+    try:
+        import tkinter as tk
+        tk.Tk().destroy()
+        return True
+    except Exception:
+        return False
+
+
+def compare(results, baseline_path):
+    """与之前保存的结果比较中位数，返回输出行"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    lines = []
+    for dataset in results['datasets']:
+        previous = next((d for d in baseline['datasets'] if d['rows'] == dataset['rows']), None)
+        if previous is None:
+            continue
+        previous_results = {r['name']: r for r in previous['results']}
+        for result in dataset['results']:
+            old = previous_results.get(result['name'])
+            if old and old['median_ms'] > 0:
+                ratio = result['median_ms'] / old['median_ms']
+                lines.append(f"{dataset['rows']:>8}  {result['name']:<26}{old['median_ms']:>10.3f}"
+                             f"{result['median_ms']:>10.3f}{ratio:>8.2f}x")
+    return lines
+
+
+def run_suite(sizes, repeat, warmup, selected=None, gui=False, keep_dir=None, progress=None):
+    """对每个数据量生成数据库并运行所有基准测试，返回可序列化为JSON的结果"""
+    results = {
+        'revision': git_revision(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'datasets': [],
+    }
+    run_gui = gui and gui_available()
+    for rows in sizes:
+        work_dir = tempfile.mkdtemp(prefix=f'invoice_bench_{rows}_', dir=keep_dir)
+        try:
+            db_path = os.path.join(work_dir, 'invoices.db')
+            pdf_dir = os.path.join(work_dir, 'invoices_pdf')
+            started = time.perf_counter()
+            generate_dataset(db_path, rows, pdf_dir)
+            dataset = {'rows': rows, 'generate_s': round(time.perf_counter() - started, 3), 'results': []}
+
+            context = BenchContext(db_path, pdf_dir, work_dir)
+            try:
+                for name, function, needs_gui in BENCHMARKS:
+                    if selected and name not in selected:
+                        continue
+                    if needs_gui and not run_gui:
+                        continue
+                    if progress:
+                        progress(rows, name)
+                    # 备份每次耗时较长，减少次数
+                    runs = max(1, repeat // 10) if name == 'create_backup' else repeat
+                    samples = time_benchmark(function, context, runs, 0 if name == 'create_backup' else warmup)
+                    dataset['results'].append(summarize(name, samples))
+            finally:
+                context.close()
+            results['datasets'].append(dataset)
+        finally:
+            if keep_dir is None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    """运行基准测试并输出JSON结果"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='发票管理系统基准测试')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='逗号分隔的数据量（如 1000,10000,100000,1000000）')
+    parser.add_argument('--repeat', type=int, default=30, help='每项测试的计时次数')
+    parser.add_argument('--warmup', type=int, default=3, help='每项测试的预热次数')
+    parser.add_argument('--only', action='append', help='只运行指定的测试（可重复）')
+    parser.add_argument('--gui', action='store_true', help='同时运行需要图形界面的测试（需要显示器）')
+    parser.add_argument('--keep-dir', help='在该目录中保留生成的数据库')
+    parser.add_argument('-o', '--output', help='结果JSON文件（默认输出到标准输出）')
+    parser.add_argument('--compare', help='与之前的结果JSON比较中位数')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    names = [name for name, _, _ in BENCHMARKS]
+    for name in args.only or ():
+        if name not in names:
+            parser.error(f"未知的测试：{name}，可选：{', '.join(names)}")
+
+    results = run_suite(sizes, args.repeat, args.warmup, args.only, args.gui, args.keep_dir,
+                        progress=lambda rows, name: print(f"[{rows}] {name}", file=sys.stderr))
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        print(f"{'rows':>8}  {'benchmark':<26}{'before':>10}{'after':>10}{'ratio':>9}", file=sys.stderr)
+        for line in compare(results, args.compare):
+            print(line, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
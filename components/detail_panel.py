@@ -2,8 +2,10 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import os
 import subprocess
+import sys
 import sqlite3
-from .invoice_dialog import InvoiceDialog
+from utils.database import InvoiceConflictError
+from utils.thumbnails import ThumbnailCache, PreviewRenderer, renderer_available
 
 class DetailPanel:
     def __init__(self, parent_frame, main_app):
@@ -24,8 +26,16 @@ class DetailPanel:
         # 创建按钮
         self.create_buttons()
         
-        # 初始化PDF路径
+        # 创建PDF预览
+        self.create_preview()
+        
+        # 初始化PDF路径和当前发票
         self.pdf_path = None
+        self.current_invoice_id = None
+        # 显示的记录的版本号，切换报销状态时检测冲突
+        self.current_version = None
+        # 多选时选中的发票数量（单选时为 0）
+        self.selection_count = 0
         self.pdf_button.state(['disabled'])
 
     def create_fields(self):
@@ -97,9 +107,67 @@ class DetailPanel:
         )
         self.toggle_button.pack(pady=5)
 
+    def create_preview(self):
+        """创建PDF首页预览区域（在后台渲染，结果缓存在磁盘上）"""
+        self.preview_image = None
+        self.preview_path = None
+        self.preview_label = ttk.Label(self.frame, anchor='center', cursor='hand2')
+        self.preview_label.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.preview_label.bind('<Button-1>', lambda event: self.pdf_path and self.view_pdf())
+        # 渲染器在第一次显示预览时才创建，检测 PyMuPDF / pdftoppm 不拖慢窗口启动
+        self.preview_renderer = None
+        self.preview_renderer_checked = False
+
+    def get_preview_renderer(self):
+        """第一次使用时创建预览渲染器，没有可用的渲染方式时返回 None"""
+        if not self.preview_renderer_checked:
+            self.preview_renderer_checked = True
+            if renderer_available():
+                self.preview_renderer = PreviewRenderer(ThumbnailCache(), lambda callback: self.frame.after(0, callback))
+        return self.preview_renderer
+
+    def show_preview(self, pdf_path):
+        """显示PDF预览（渲染完成后回调）"""
+        if pdf_path and pdf_path == self.preview_path and self.preview_image is not None:
+            return  # 同一个PDF的预览已在显示
+        self.preview_path = pdf_path
+        self.preview_image = None
+        self.preview_label.configure(image='')
+        if not pdf_path:
+            self.preview_label.configure(text="")
+            return
+        renderer = self.get_preview_renderer()
+        if renderer is None:
+            self.preview_label.configure(text="安装 PyMuPDF 或 poppler-utils 后可显示PDF预览")
+            return
+        self.preview_label.configure(text="正在生成预览...")
+        renderer.request(pdf_path, lambda path, error: self.on_preview_ready(pdf_path, path, error))
+
+    def on_preview_ready(self, pdf_path, image_path, error):
+        """预览渲染完成（在界面线程中执行）"""
+        if pdf_path != self.pdf_path:
+            return  # 已切换到其他发票
+        if error is not None:
+            self.preview_label.configure(text=f"无法生成预览：{str(error)}")
+            return
+        try:
+            self.preview_image = tk.PhotoImage(file=image_path)
+        except tk.TclError as e:
+            self.preview_label.configure(text=f"无法显示预览：{str(e)}")
+            return
+        self.preview_label.configure(image=self.preview_image, text="")
+
+    def prefetch_previews(self, pdf_paths):
+        """预取相邻发票的预览，方向键浏览时可立即显示"""
+        renderer = self.get_preview_renderer()
+        if renderer is not None:
+            renderer.prefetch(pdf_paths)
+
     def show_details(self, invoice_data):
         """显示发票详情"""
         self.current_invoice_id = invoice_data['id']
+        self.current_version = invoice_data['version']
+        self.selection_count = 0
         
         # 更新显示的值
         self.value_labels['报销内容:'].configure(text=invoice_data['content'])
@@ -116,12 +184,22 @@ class DetailPanel:
         self.delete_button.state(['!disabled'])
         self.toggle_button.state(['!disabled'])
         
-        # 只在有PDF时启用PDF按钮
+        # 只在有PDF时启用PDF按钮（查文件状态缓存，网络共享上不必每次访问文件系统）
         self.pdf_path = invoice_data.get('pdf_path')
-        if self.pdf_path and os.path.exists(self.pdf_path):
+        if self.pdf_path and self.main_app.file_status.exists(self.pdf_path):
             self.pdf_button.state(['!disabled'])
+            self.show_preview(self.pdf_path)
         else:
             self.pdf_button.state(['disabled'])
+            self.show_preview(None)
+
+    def show_selection(self, count, total):
+        """多选时显示选中数量和合计金额，只保留删除按钮（其他批量操作在列表的右键菜单中）"""
+        self.clear_details()
+        self.selection_count = count
+        self.value_labels['报销内容:'].configure(text=f"已选择 {count} 张发票")
+        self.value_labels['金额:'].configure(text=f"¥ {total:,.2f}")
+        self.delete_button.state(['!disabled'])
 
     def clear_details(self):
         """清空详情显示"""
@@ -136,16 +214,21 @@ class DetailPanel:
         
         self.pdf_path = None
         self.current_invoice_id = None
+        self.current_version = None
+        self.selection_count = 0
+        self.show_preview(None)
 
     def edit_invoice(self):
         """编辑发票"""
-        if hasattr(self, 'current_invoice_id'):
+        if self.current_invoice_id:
             # 直接调用主窗口的编辑方法
             self.main_app.edit_selected_invoice()
     
     def delete_invoice(self):
-        """删除发票"""
-        if self.current_invoice_id:
+        """删除发票（多选时删除所有选中的发票）"""
+        if self.selection_count:
+            self.main_app.delete_selected_invoices()
+        elif self.current_invoice_id:
             self.main_app.delete_invoice(self.current_invoice_id)
     
     def view_pdf(self):
@@ -161,47 +244,33 @@ class DetailPanel:
         try:
             if os.name == 'nt':  # Windows
                 os.startfile(self.pdf_path)
-            else:  # Linux/Mac
-                os.system(f'xdg-open "{self.pdf_path}"')
+            else:  # Linux/Mac：不等待查看器启动，避免界面卡住
+                opener = 'open' if sys.platform == 'darwin' else 'xdg-open'
+                subprocess.Popen([opener, self.pdf_path],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         except Exception as e:
             messagebox.showerror("错误", f"打开PDF文件时出错：\n{str(e)}")
     
     def toggle_reimbursed_status(self):
         """切换报销状态"""
-        if not hasattr(self, 'current_invoice_id'):
+        if not self.current_invoice_id:
             return
         
         try:
-            conn = sqlite3.connect('invoices.db')
-            cursor = conn.cursor()
+            new_status = self.main_app.repo.toggle_reimbursed(self.current_invoice_id, self.current_version)
             
-            # 获取当前状态和内容
-            cursor.execute('SELECT reimbursed, content FROM invoices WHERE id = ?', 
-                         (self.current_invoice_id,))
-            result = cursor.fetchone()
-            
-            if result is None:
+            if new_status is None:
                 messagebox.showerror("错误", "找不到选中的发票记录")
                 return
             
-            current_status = result[0]
-            invoice_content = result[1]
-            
-            # 切换状态
-            new_status = not bool(current_status)
-            cursor.execute('UPDATE invoices SET reimbursed = ? WHERE id = ?',
-                         (new_status, self.current_invoice_id))
-            
-            conn.commit()
-            conn.close()
-            
-            # 刷新显示
-            self.main_app.refresh_invoice_list()
-            
+            # 列表中的对应行会通过变更事件单独更新
             # 更新当前显示的状态文本
             status_text = "已报销" if new_status else "未报销"
             self.value_labels['报销状态:'].configure(text=status_text)
             
+        except InvoiceConflictError as e:
+            messagebox.showwarning("数据已变化", f"{str(e)}，报销状态没有修改。已重新加载最新内容，请确认后重试。")
+            self.main_app.reload_external_changes()
         except sqlite3.Error as e:
             messagebox.showerror("数据库错误", f"更新报销状态时出错：{str(e)}")
         except Exception as e:
@@ -0,0 +1,92 @@
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+from datetime import datetime
+
+class DiagnosticsDialog:
+    """诊断窗口：按操作汇总的耗时、慢查询及其执行计划，可导出为JSON附在问题报告中"""
+
+    # 汇总表的列：(字段, 标题, 宽度)
+    COLUMNS = (
+        ('kind', '类型', 60),
+        ('name', '操作 / 语句', 520),
+        ('count', '次数', 70),
+        ('median_ms', '中位数(ms)', 110),
+        ('p95_ms', 'p95(ms)', 100),
+        ('max_ms', '最大(ms)', 100),
+        ('total_ms', '总计(ms)', 110),
+        ('avg_rows', '平均行数', 100),
+    )
+
+    def __init__(self, parent, tracer, extra=None):
+        self.tracer = tracer
+        self.extra = extra or {}
+
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("诊断信息")
+        self.dialog.geometry("1200x700")
+        self.dialog.transient(parent)
+
+        main_frame = ttk.Frame(self.dialog, padding="10 10 10 10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        # 按操作汇总
+        self.summary_tree = ttk.Treeview(main_frame, columns=[c[0] for c in self.COLUMNS], show='headings', height=12)
+        for column, title, width in self.COLUMNS:
+            self.summary_tree.heading(column, text=title)
+            self.summary_tree.column(column, width=width, anchor='w' if column == 'name' else 'e')
+        self.summary_tree.pack(fill=tk.BOTH, expand=True)
+
+        # 慢查询与执行计划
+        ttk.Label(main_frame, text=f"慢查询（超过 {tracer.slow_query_ms} ms）:").pack(anchor='w', pady=(10, 0))
+        self.slow_text = tk.Text(main_frame, height=12, state='disabled', wrap='word')
+        self.slow_text.pack(fill=tk.BOTH, expand=True)
+
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="刷新", width=12, command=self.refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="导出JSON", width=12, command=self.export).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="清空", width=12, command=self.clear).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="关闭", width=12, command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+        self.refresh()
+
+    def refresh(self):
+        """重新读取追踪数据"""
+        self.summary_tree.delete(*self.summary_tree.get_children())
+        for item in self.tracer.summary():
+            values = ['' if item[column] is None else item[column] for column, _, _ in self.COLUMNS]
+            self.summary_tree.insert('', tk.END, values=values)
+
+        lines = []
+        for query in reversed(self.tracer.slow_queries):
+            at = datetime.fromtimestamp(query['at']).strftime('%H:%M:%S')
+            lines.append(f"[{at}] {query['duration_ms']:.1f} ms, {query['rows']} 行")
+            lines.append(f"  {query['sql']}")
+            lines.append(f"  参数: {query['params']}")
+            lines.extend(f"    {step}" for step in query['plan'])
+            lines.append('')
+        self.slow_text.configure(state='normal')
+        self.slow_text.delete('1.0', tk.END)
+        self.slow_text.insert('1.0', "\n".join(lines) if lines else "没有慢查询")
+        self.slow_text.configure(state='disabled')
+
+    def export(self):
+        """把追踪数据导出为JSON文件"""
+        path = filedialog.asksaveasfilename(
+            parent=self.dialog,
+            title="导出诊断信息",
+            defaultextension=".json",
+            initialfile=f"invoice_trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            filetypes=[("JSON files", "*.json")]
+        )
+        if not path:
+            return
+        try:
+            self.tracer.dump(path, self.extra)
+            messagebox.showinfo("成功", f"诊断信息已导出到：\n{path}", parent=self.dialog)
+        except OSError as e:
+            messagebox.showerror("错误", f"导出诊断信息时出错：\n{str(e)}", parent=self.dialog)
+
+    def clear(self):
+        self.tracer.clear()
+        self.refresh()
@@ -0,0 +1,79 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+import threading
+from utils.exporter import export_to_file, ExportCancelled
+
+class ExportDialog:
+    """导出进度窗口：在后台线程中从数据库游标逐行写出，内存占用与行数无关"""
+
+    def __init__(self, parent, repo, path, search_term='', sort_keys=None, filters=None):
+        self.repo = repo
+        self.path = path
+        self.cancel_event = threading.Event()
+
+        # 创建对话框窗口
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("导出")
+        self.dialog.geometry("600x200")
+        self.dialog.transient(parent)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        main_frame = ttk.Frame(self.dialog, padding="20 20 20 20")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.status_var = tk.StringVar(value=f"正在导出：{path}")
+        ttk.Label(main_frame, textvariable=self.status_var, wraplength=540).pack(fill=tk.X)
+
+        # 进度条
+        self.progress_var = tk.DoubleVar()
+        ttk.Progressbar(main_frame, variable=self.progress_var, maximum=100).pack(fill=tk.X, pady=10)
+
+        self.button = ttk.Button(main_frame, text="取消", width=15, command=self.cancel)
+        self.button.pack(pady=10)
+
+        threading.Thread(target=self.run_export, args=(search_term, sort_keys, filters), daemon=True).start()
+
+    def run_export(self, search_term, sort_keys, filters):
+        """后台线程：在单独的连接上流式读取并写出（不占用界面查询的连接池），通过 after 把进度和结果交回界面线程"""
+        last_percent = [-1]
+
+        try:
+            with self.repo.dedicated_connection() as conn:
+                total = self.repo.get_statistics(search_term, conn, filters)[0]
+
+                def report_progress(count):
+                    # 只在百分比变化时才通知界面线程，避免逐行刷新
+                    percent = count * 100 // total if total else 100
+                    if percent != last_percent[0]:
+                        last_percent[0] = percent
+                        self.dialog.after(0, lambda: self.progress_var.set(percent))
+
+                invoices = self.repo.iter_invoices(search_term, sort_keys, conn=conn, filters=filters)
+                count = export_to_file(invoices, self.path, progress=report_progress,
+                                       cancel_event=self.cancel_event)
+            self.dialog.after(0, lambda: self.show_result(count))
+        except ExportCancelled:
+            self.dialog.after(0, self.dialog.destroy)
+        except Exception as e:
+            self.dialog.after(0, lambda error=e: self.show_error(error))
+
+    def show_result(self, count):
+        """导出完成"""
+        self.progress_var.set(100)
+        self.status_var.set(f"已导出 {count} 条到：{self.path}")
+        self.finish()
+
+    def show_error(self, error):
+        """导出失败（不会留下不完整的文件）"""
+        self.status_var.set("导出失败")
+        messagebox.showerror("导出错误", f"导出过程中出错：\n{str(error)}", parent=self.dialog)
+        self.finish()
+
+    def finish(self):
+        self.button.configure(text="关闭", command=self.dialog.destroy)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.dialog.destroy)
+
+    def cancel(self):
+        """取消导出（已写出的部分会被删除）"""
+        self.cancel_event.set()
+        self.status_var.set("正在取消...")
@@ -0,0 +1,131 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from datetime import date, datetime
+from utils.database import InvoiceFilter
+
+class FilterBar:
+    """筛选栏：创建日期范围、金额范围、报销状态和费用类型，变化后回调 on_change()"""
+
+    # 下拉框选项：(显示文字, 筛选值)
+    STATUS_OPTIONS = (('全部', None), ('未报销', False), ('已报销', True))
+    TYPE_OPTIONS = (('全部', None), ('垫付', '垫付'), ('自费', '自费'))
+
+    def __init__(self, parent, on_change):
+        self.on_change = on_change
+        # 当前生效的筛选条件
+        self.filter = InvoiceFilter()
+
+        self.frame = ttk.Frame(parent)
+
+        # 日期范围：勾选后才生效（日期控件不能留空）
+        self.date_enabled = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.frame, text="日期:", variable=self.date_enabled,
+                        command=self.apply).pack(side=tk.LEFT, padx=5)
+        self.date_from = self.create_date_entry(date.today().replace(day=1))
+        ttk.Label(self.frame, text="至").pack(side=tk.LEFT)
+        self.date_to = self.create_date_entry(date.today())
+
+        ttk.Label(self.frame, text="金额:").pack(side=tk.LEFT, padx=(15, 5))
+        self.amount_min = self.create_entry()
+        ttk.Label(self.frame, text="至").pack(side=tk.LEFT)
+        self.amount_max = self.create_entry()
+
+        ttk.Label(self.frame, text="状态:").pack(side=tk.LEFT, padx=(15, 5))
+        self.status_combo = self.create_combo(self.STATUS_OPTIONS)
+        ttk.Label(self.frame, text="类型:").pack(side=tk.LEFT, padx=(15, 5))
+        self.type_combo = self.create_combo(self.TYPE_OPTIONS)
+
+        ttk.Button(self.frame, text="清除筛选", command=self.clear).pack(side=tk.LEFT, padx=15)
+        # 离开输入框时输入无效只在这里提示（弹窗会夺走焦点，再次触发离开事件）
+        self.error_label = ttk.Label(self.frame, foreground='red')
+        self.error_label.pack(side=tk.LEFT, padx=5)
+
+    def create_date_entry(self, initial):
+        """有 tkcalendar 时使用日历控件，否则使用输入框（格式 YYYY-MM-DD）"""
+        try:
+            from tkcalendar import DateEntry
+        except ImportError:
+            DateEntry = None
+
+        if DateEntry is not None:
+            entry = DateEntry(self.frame, width=11, date_pattern='yyyy-mm-dd')
+            entry.set_date(initial)
+            entry.bind('<<DateEntrySelected>>', lambda event: self.apply())
+        else:
+            entry = ttk.Entry(self.frame, width=11)
+            entry.insert(0, initial.isoformat())
+        entry.bind('<Return>', lambda event: self.apply())
+        entry.bind('<FocusOut>', lambda event: self.apply(quiet=True))
+        entry.pack(side=tk.LEFT, padx=5)
+        return entry
+
+    def create_entry(self):
+        entry = ttk.Entry(self.frame, width=10)
+        entry.bind('<Return>', lambda event: self.apply())
+        entry.bind('<FocusOut>', lambda event: self.apply(quiet=True))
+        entry.pack(side=tk.LEFT, padx=5)
+        return entry
+
+    def create_combo(self, options):
+        combo = ttk.Combobox(self.frame, values=[text for text, _ in options], state='readonly', width=7)
+        combo.current(0)
+        combo.bind('<<ComboboxSelected>>', lambda event: self.apply())
+        combo.pack(side=tk.LEFT, padx=5)
+        return combo
+
+    def parse_date(self, entry, name):
+        try:
+            return datetime.strptime(entry.get().strip(), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError(f"{name}格式应为 YYYY-MM-DD")
+
+    def parse_amount(self, entry, name):
+        text = entry.get().strip()
+        if not text:
+            return None
+        try:
+            return float(text)
+        except ValueError:
+            raise ValueError(f"{name}必须是数字")
+
+    def read_filter(self):
+        """根据控件内容生成筛选条件；输入无效时抛出 ValueError"""
+        date_from = date_to = None
+        if self.date_enabled.get():
+            date_from = self.parse_date(self.date_from, "开始日期")
+            date_to = self.parse_date(self.date_to, "结束日期")
+            if date_from > date_to:
+                raise ValueError("开始日期不能晚于结束日期")
+        amount_min = self.parse_amount(self.amount_min, "最小金额")
+        amount_max = self.parse_amount(self.amount_max, "最大金额")
+        if amount_min is not None and amount_max is not None and amount_min > amount_max:
+            raise ValueError("最小金额不能大于最大金额")
+        return InvoiceFilter(
+            date_from, date_to, amount_min, amount_max,
+            self.STATUS_OPTIONS[self.status_combo.current()][1],
+            self.TYPE_OPTIONS[self.type_combo.current()][1],
+        )
+
+    def apply(self, quiet=False):
+        """筛选条件有变化时通知主窗口重新查询；quiet 为 True 时输入无效只在筛选栏中提示，不弹窗"""
+        try:
+            new_filter = self.read_filter()
+        except ValueError as e:
+            self.error_label.configure(text=str(e))
+            if not quiet:
+                messagebox.showwarning("筛选", str(e))
+            return
+        self.error_label.configure(text="")
+        if vars(new_filter) == vars(self.filter):
+            return
+        self.filter = new_filter
+        self.on_change()
+
+    def clear(self):
+        """清除所有筛选条件"""
+        self.date_enabled.set(False)
+        self.amount_min.delete(0, tk.END)
+        self.amount_max.delete(0, tk.END)
+        self.status_combo.current(0)
+        self.type_combo.current(0)
+        self.apply()
@@ -0,0 +1,82 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+import threading
+from utils.importer import InvoiceImporter
+
+class ImportDialog:
+    """批量导入进度窗口：导入在后台线程中进行，完成后显示逐行错误报告"""
+
+    def __init__(self, parent, repo, path, on_finished=None):
+        self.parent = parent
+        self.on_finished = on_finished
+        self.cancel_event = threading.Event()
+        self.importer = InvoiceImporter(repo)
+
+        # 创建对话框窗口
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("批量导入")
+        self.dialog.geometry("700x450")
+        self.dialog.transient(parent)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        main_frame = ttk.Frame(self.dialog, padding="20 20 20 20")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.status_var = tk.StringVar(value=f"正在导入：{path}")
+        ttk.Label(main_frame, textvariable=self.status_var, wraplength=640).pack(fill=tk.X)
+
+        # 进度条
+        self.progress_var = tk.DoubleVar()
+        ttk.Progressbar(main_frame, variable=self.progress_var, maximum=100).pack(fill=tk.X, pady=10)
+
+        # 错误报告
+        self.report_text = tk.Text(main_frame, height=10, state='disabled')
+        self.report_text.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        self.button = ttk.Button(main_frame, text="取消", width=15, command=self.cancel)
+        self.button.pack(pady=10)
+
+        threading.Thread(target=self.run_import, args=(path,), daemon=True).start()
+
+    def run_import(self, path):
+        """后台线程：执行导入，通过 after 把进度和结果交回界面线程"""
+        last_percent = [-1]
+        
+        def report_progress(fraction):
+            # 只在百分比变化时才通知界面线程，避免逐行刷新
+            percent = int(fraction * 100)
+            if percent != last_percent[0]:
+                last_percent[0] = percent
+                self.dialog.after(0, lambda: self.progress_var.set(percent))
+
+        try:
+            report = self.importer.import_file(path, report_progress, self.cancel_event)
+            self.dialog.after(0, lambda: self.show_report(report))
+        except Exception as e:
+            self.dialog.after(0, lambda error=e: self.show_error(error))
+
+    def show_report(self, report):
+        """显示导入结果"""
+        self.status_var.set(report.summary())
+        lines = [f"第 {row_number} 行：{message}" for row_number, message in report.errors]
+        self.report_text.configure(state='normal')
+        self.report_text.insert('1.0', "\n".join(lines) if lines else "没有错误")
+        self.report_text.configure(state='disabled')
+        self.finish(report)
+
+    def show_error(self, error):
+        """导入失败（整个事务已回滚）"""
+        self.status_var.set("导入失败，未写入任何数据")
+        messagebox.showerror("导入错误", f"导入过程中出错：\n{str(error)}", parent=self.dialog)
+        self.finish(None)
+
+    def finish(self, report):
+        self.button.configure(text="关闭", command=self.dialog.destroy)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.dialog.destroy)
+        if self.on_finished:
+            self.on_finished(report)
+
+    def cancel(self):
+        """取消导入（已读取的数据会被回滚）"""
+        self.cancel_event.set()
+        self.status_var.set("正在取消...")
@@ -1,14 +1,15 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from tkcalendar import DateEntry
 import os
-import shutil
 from datetime import datetime
+from utils.validation import validate_invoice_fields
+from utils.pdf_store import PdfStore
 
 class InvoiceDialog:
     def __init__(self, parent, pdf_dir, invoice_data=None):
         self.parent = parent
         self.pdf_dir = pdf_dir
+        self.pdf_store = PdfStore(pdf_dir)
         self.invoice_data = invoice_data
         self.result = None
         self.selected_pdf = None
@@ -125,7 +126,8 @@ class InvoiceDialog:
         button_frame = ttk.Frame(parent)
         button_frame.grid(row=7, column=0, columnspan=2, pady=20)
         
-        ttk.Button(button_frame, text="保存", command=self.save, width=15).pack(side=tk.LEFT, padx=10)
+        self.save_button = ttk.Button(button_frame, text="保存", command=self.save, width=15)
+        self.save_button.pack(side=tk.LEFT, padx=10)
         ttk.Button(button_frame, text="取消", command=self.cancel, width=15).pack(side=tk.LEFT, padx=10)
         
         # 设置列权重
@@ -156,16 +158,9 @@ class InvoiceDialog:
     
     def validate_form(self):
         """验证表单数据"""
-        if not self.content_var.get().strip():
-            messagebox.showerror("错误", "请填写报销内容")
-            return False
-            
-        try:
-            amount = float(self.amount_var.get())
-            if amount <= 0:
-                raise ValueError
-        except ValueError:
-            messagebox.showerror("错误", "请输入有效的金额")
+        error = validate_invoice_fields(self.content_var.get(), self.amount_var.get())
+        if error:
+            messagebox.showerror("错误", error)
             return False
             
         return True
@@ -176,16 +171,33 @@ class InvoiceDialog:
             return
             
         # 处理PDF文件
-        pdf_path = None
-        if self.selected_pdf:
-            # 生成新的文件名：报销内容_金额.pdf
-            new_filename = f"{self.content_var.get()}_{self.amount_var.get()}.pdf"
-            pdf_path = os.path.join(self.pdf_dir, new_filename)
-            
-            # 如果是新文件或文件发生改变，则复制到目标位置
-            if not self.invoice_data or self.selected_pdf != self.invoice_data.get('pdf_path'):
-                shutil.copy2(self.selected_pdf, pdf_path)
+        if self.selected_pdf and (not self.invoice_data or self.selected_pdf != self.invoice_data.get('pdf_path')):
+            # 新文件或文件发生改变：在后台线程中按内容哈希复制到存储目录
+            self.save_button.state(['disabled'])
+            self.pdf_var.set(f"正在复制 {os.path.basename(self.selected_pdf)} ...")
+            self.pdf_store.add_async(self.selected_pdf, self.deliver_pdf_result)
+            return
         
+        self.finish_save(self.selected_pdf)
+    
+    def deliver_pdf_result(self, pdf_path, error):
+        """工作线程：把复制结果交回界面线程"""
+        try:
+            self.dialog.after(0, lambda: self.on_pdf_stored(pdf_path, error))
+        except (tk.TclError, RuntimeError):
+            pass  # 对话框已被关闭
+    
+    def on_pdf_stored(self, pdf_path, error):
+        """PDF复制完成（在界面线程中执行）"""
+        if error is not None:
+            self.save_button.state(['!disabled'])
+            self.pdf_var.set(os.path.basename(self.selected_pdf))
+            messagebox.showerror("错误", f"复制PDF文件时出错：\n{str(error)}", parent=self.dialog)
+            return
+        self.finish_save(pdf_path)
+    
+    def finish_save(self, pdf_path):
+        """生成结果并关闭对话框"""
         self.result = {
             'content': self.content_var.get(),
             'platform': self.platform_var.get(),
@@ -0,0 +1,32 @@
+import tkinter as tk
+from tkinter import ttk
+
+class MigrationDialog:
+    """数据库升级进度窗口：迁移在界面线程中同步执行，每次报告进度时刷新窗口"""
+
+    def __init__(self, parent):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("升级数据库")
+        self.dialog.geometry("600x160")
+        self.dialog.transient(parent)
+        # 迁移过程中不能关闭
+        self.dialog.protocol("WM_DELETE_WINDOW", lambda: None)
+
+        main_frame = ttk.Frame(self.dialog, padding="20 20 20 20")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.status_var = tk.StringVar(value="正在升级数据库...")
+        ttk.Label(main_frame, textvariable=self.status_var, wraplength=540).pack(fill=tk.X)
+
+        self.progress_var = tk.DoubleVar()
+        ttk.Progressbar(main_frame, variable=self.progress_var, maximum=100).pack(fill=tk.X, pady=10)
+
+    def update(self, description, done, total):
+        """显示当前迁移及其进度（total 为 None 表示没有可报告的进度）"""
+        percent = done * 100 // total if total else 0
+        self.status_var.set(f"正在升级数据库：{description}" + (f"  {percent}%" if total else ''))
+        self.progress_var.set(percent)
+        self.dialog.update()
+
+    def close(self):
+        self.dialog.destroy()
@@ -1,14 +1,25 @@
 from tkinter import ttk
 import tkinter as tk
+from utils.tracing import tracer
+from utils.row_model import RowModel
 
 class InvoiceTreeview:
+    # 虚拟列表模式下每次按需加载的行数（可见行数加上预取余量）
+    PAGE_SIZE = 100
+    # 滚动到距顶部/底部多少比例时加载上一页/下一页
+    PREFETCH_THRESHOLD = 0.1
+    # 表格中最多保留的行数：超过后从另一端移除，滚动回去时重新查询
+    MAX_LOADED_ROWS = 500
+    
     def __init__(self, parent_frame):
         # 设置字体
         self.default_font = ('Microsoft YaHei UI', 15)
         
         # 创建并配置表格
         columns = ('id', 'content', 'platform', 'expense_type', 'amount', 'reimbursed', 'created_at')
-        self.tree = ttk.Treeview(parent_frame, columns=columns, show='headings', style='Custom.Treeview')
+        # 可按住 Ctrl/Shift 多选，批量操作作用于所有选中行
+        self.tree = ttk.Treeview(parent_frame, columns=columns, show='headings', style='Custom.Treeview',
+                                 selectmode='extended')
         
         # 配置样式
         style = ttk.Style()
@@ -23,25 +34,16 @@ class InvoiceTreeview:
                        font=self.default_font,
                        padding=(0, 10))  # 增加表头padding
         
-        # 添加排序状态追踪
-        self.sort_states = {
-            'id': False,        # False 表示升序，True 表示降序
-            'content': False,
-            'platform': False,
-            'expense_type': False,
-            'amount': False,
-            'reimbursed': False,
-            'created_at': False
-        }
+        # 当前排序键 [(列名, 是否降序), ...]；为空时使用默认排序（编号倒序）
+        self.sort_keys = []
+        # 排序键变化时的回调 sort_callback(sort_keys)，由其重新查询数据
+        self.sort_callback = None
         
-        # 设置列标题和排序功能
-        self.tree.heading('id', text='编号', command=lambda: self.sort_column('id', is_numeric=True))
-        self.tree.heading('content', text='报销内容', command=lambda: self.sort_column('content'))
-        self.tree.heading('platform', text='购买平台', command=lambda: self.sort_column('platform'))
-        self.tree.heading('expense_type', text='费用类型', command=lambda: self.sort_column('expense_type'))
-        self.tree.heading('amount', text='金额', command=lambda: self.sort_column('amount', is_numeric=True, is_currency=True))
-        self.tree.heading('reimbursed', text='报销状态', command=lambda: self.sort_column('reimbursed'))
-        self.tree.heading('created_at', text='创建时间', command=lambda: self.sort_column('created_at'))
+        # 设置列标题和排序功能（单击按该列排序，Shift+单击追加为次要排序键）
+        for column in columns:
+            self.tree.heading(column, text=self.get_column_title(column),
+                              command=lambda c=column: self.sort_column(c))
+        self.tree.bind('<Shift-Button-1>', self.on_shift_click)
         
         # 设置列宽
         self.tree.column('id', width=80)
@@ -52,53 +54,84 @@ class InvoiceTreeview:
         self.tree.column('reimbursed', width=100)
         self.tree.column('created_at', width=180)  # 时间列宽度
         
-        # 添加滚动条
-        scrollbar = ttk.Scrollbar(parent_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # 添加滚动条（滚动时按需加载更多数据）
+        self.scrollbar = ttk.Scrollbar(parent_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_yscroll)
         
         # 布局
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # 虚拟列表状态：表格中只保留结果中连续的一段（窗口），两端按需加载，超出上限时移除另一端
+        # page_loader(anchor, backward, limit, on_done) 在后台查询 anchor 行之后（backward 为 True 时之前）
+        # 的一页，完成后在界面线程中调用 on_done(rows)，查询失败时 on_done(None)
+        self.page_loader = None
+        self.has_more = False       # 窗口之后还有行
+        self.has_before = False     # 窗口之前还有行（已被移出窗口）
+        self.row_count = 0          # 已插入行数，用于交替行颜色
+        self.model = RowModel()     # 已加载行的类型化列存储，表格只负责显示
+        self._load_pending = False
+        self._loader_generation = 0 # 每次重新加载时递增，丢弃旧列表的分页结果
         
         # 设置交替行颜色
         self.tree.tag_configure('oddrow', background='#FFFFFF')
         self.tree.tag_configure('evenrow', background='#F0F0F0')
     
-    def sort_column(self, column, is_numeric=False, is_currency=False):
-        """排序指定列"""
-        # 获取所有项目
-        items = [(self.tree.set(item, column), item) for item in self.tree.get_children('')]
+    @tracer.traced('sort_column')
+    def sort_column(self, column, append=False):
+        """按指定列排序；append 为 True 时作为次要排序键追加
         
-        # 转换排序方向
-        self.sort_states[column] = not self.sort_states[column]
-        reverse = self.sort_states[column]
+        结果已全部加载时直接在行模型上排序，否则交给数据库重新查询
+        """
+        keys = list(self.sort_keys)
+        existing = [key for key, _ in keys]
         
-        # 根据不同类型的数据进行排序
-        if is_numeric:
-            if is_currency:
-                # 处理金额格式（去除 ¥ 和逗号）
-                items.sort(key=lambda x: float(x[0].replace('¥', '').replace(',', '').strip()), reverse=reverse)
+        if column in existing:
+            index = existing.index(column)
+            if append or len(keys) == 1:
+                # 再次点击同一列时切换排序方向
+                keys[index] = (column, not keys[index][1])
             else:
-                # 处理普通数字
-                items.sort(key=lambda x: int(x[0]) if x[0].isdigit() else float('inf'), reverse=reverse)
+                keys = [(column, False)]
+        elif append:
+            keys.append((column, False))
         else:
-            # 字符串排序
-            items.sort(key=lambda x: x[0].lower(), reverse=reverse)
-        
-        # 重新排列项目
-        for index, (val, item) in enumerate(items):
-            # 更新交替行颜色
-            self.tree.move(item, '', index)
-            tag = 'evenrow' if index % 2 == 0 else 'oddrow'
-            self.tree.item(item, tags=(tag,))
+            keys = [(column, False)]
+        
+        self.sort_keys = keys
+        self.update_headings()
         
-        # 更新表头显示排序方向
+        if self.page_loader and not self.has_more and not self.has_before:
+            self.sort_loaded_rows()
+        elif self.sort_callback:
+            self.sort_callback(self.sort_keys)
+    
+    def sort_loaded_rows(self):
+        """按当前排序键在行模型上排序，一次调用重排表格项"""
+        ordered = self.model.sorted_ids(self.sort_keys)
+        self.tree.set_children('', *map(str, ordered))
+        self.retag_from(0)
+    
+    def on_shift_click(self, event):
+        """Shift+单击表头：追加次要排序键"""
+        if self.tree.identify_region(event.x, event.y) != 'heading':
+            return None
+        column_index = int(self.tree.identify_column(event.x)[1:]) - 1
+        self.sort_column(self.tree['columns'][column_index], append=True)
+        return 'break'
+    
+    def update_headings(self):
+        """更新表头显示排序方向（多列排序时显示优先级）"""
+        directions = {column: (i, descending) for i, (column, descending) in enumerate(self.sort_keys)}
         for col in self.tree['columns']:
-            if col == column:
-                direction = '↓' if reverse else '↑'
-                self.tree.heading(col, text=f"{self.get_column_title(col)} {direction}")
-            else:
-                self.tree.heading(col, text=self.get_column_title(col))
+            title = self.get_column_title(col)
+            if col in directions:
+                priority, descending = directions[col]
+                arrow = '↓' if descending else '↑'
+                if len(self.sort_keys) > 1:
+                    arrow += str(priority + 1)
+                title = f"{title} {arrow}"
+            self.tree.heading(col, text=title)
 
     def get_column_title(self, column):
         """获取列的原始标题"""
@@ -113,36 +146,219 @@ class InvoiceTreeview:
         }
         return titles.get(column, column)
 
-    def insert_item(self, id, content, platform, expense_type, amount, reimbursed, created_at):
-        """插入新记录"""
+    def format_values(self, id, content, platform, expense_type, amount, reimbursed, created_at):
+        """把原始列表行格式化为表格显示的值"""
         reimbursed_text = "已报销" if reimbursed else "未报销"
         amount_text = f"¥ {amount:,.2f}"
+        # 数据库中的时间文本已是显示格式
+        created_at_text = created_at or ""
+        return (id, content, platform or "", expense_type, amount_text, reimbursed_text, created_at_text)
+    
+    def insert_item(self, *row, index=tk.END):
+        """插入新记录（以发票编号作为表格项的iid）"""
+        # 根据已插入行数决定使用哪个标签（避免每次插入都查询全部子项）
+        tag = 'evenrow' if self.row_count % 2 == 0 else 'oddrow'
+        self.row_count += 1
         
-        # 格式化时间显示
-        created_at_text = created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else ""
+        iid = str(row[0])
+        self.model.upsert(row)
+        self.tree.insert('', index, iid=iid, values=self.format_values(*row), tags=(tag,))
+    
+    def upsert_row(self, row, sort_key, retag=True):
+        """新增或更新一行，并按当前排序放到正确位置（只改动这一行）"""
+        iid = str(row[0])
+        existed = self.tree.exists(iid)
+        children = [child for child in self.tree.get_children() if child != iid]
+        
+        # 在已加载的行中二分查找插入位置
+        key = sort_key(row)
+        low, high = 0, len(children)
+        while low < high:
+            middle = (low + high) // 2
+            if sort_key(self.model.row(int(children[middle]))) < key:
+                low = middle + 1
+            else:
+                high = middle
         
-        # 获取当前项目数量来决定使用哪个标签
-        count = len(self.tree.get_children())
-        tag = 'evenrow' if count % 2 == 0 else 'oddrow'
+        if (low == len(children) and self.has_more) or (low == 0 and children and self.has_before):
+            # 排在窗口之外：留给后续分页加载
+            if existed:
+                self.remove_row(row[0], retag)
+            return
         
-        self.tree.insert('', tk.END, 
-                        values=(id, content, platform, expense_type, amount_text, reimbursed_text, created_at_text),
-                        tags=(tag,))
+        self.model.upsert(row)
+        if existed:
+            self.tree.item(iid, values=self.format_values(*row))
+            old_index = self.tree.index(iid)
+            if old_index != low:
+                self.tree.move(iid, '', low)
+                if retag:
+                    self.retag_from(min(old_index, low))
+        else:
+            self.insert_item(*row, index=low)
+            if retag:
+                self.retag_from(low)
+    
+    def remove_row(self, invoice_id, retag=True):
+        """删除一行"""
+        iid = str(invoice_id)
+        if not self.tree.exists(iid):
+            return
+        index = self.tree.index(iid)
+        self.tree.delete(iid)
+        self.model.remove(int(invoice_id))
+        self.row_count -= 1
+        if retag:
+            self.retag_from(index)
+    
+    def patch_rows(self, upserts, removals, sort_key):
+        """批量修补：更新或插入 upserts 中的行、删除 removals 中的编号，最后统一重设行颜色"""
+        for invoice_id in removals:
+            self.remove_row(invoice_id, retag=False)
+        for row in upserts:
+            self.upsert_row(row, sort_key, retag=False)
+        self.retag_from(0)
+    
+    def retag_from(self, index):
+        """从指定位置起重新设置交替行颜色"""
+        for position, item in enumerate(self.tree.get_children()[index:], start=index):
+            tag = 'evenrow' if position % 2 == 0 else 'oddrow'
+            self.tree.item(item, tags=(tag,))
+    
+    def set_page_loader(self, page_loader, first_page, first_page_size=None, has_before=False):
+        """进入虚拟列表模式：清空列表并显示第一页 first_page
+
+        first_page_size 为第一页查询的行数（重新加载时可能大于 PAGE_SIZE），has_before 表示第一页之前还有行
+        """
+        self.clear_all()
+        self.page_loader = page_loader
+        self.has_before = has_before
+        for row in first_page:
+            self.insert_item(*row)
+        self.has_more = len(first_page) == (first_page_size or self.PAGE_SIZE)
+    
+    def request_page(self, backward=False):
+        """在后台加载窗口之后（backward 为 True 时之前）的一页，不阻塞界面线程"""
+        children = self.tree.get_children()
+        if self._load_pending or not self.page_loader or not children:
+            return
+        self._load_pending = True
+        generation = self._loader_generation
+        anchor = self.model.row(int(children[0] if backward else children[-1]))
+        self.page_loader(anchor, backward, self.PAGE_SIZE,
+                         lambda rows: self.on_page_loaded(generation, backward, rows))
+    
+    def on_page_loaded(self, generation, backward, rows):
+        """分页查询返回：列表已重新加载时丢弃，查询失败时等下次滚动再试"""
+        if generation != self._loader_generation:
+            return
+        self._load_pending = False
+        if rows is None:
+            return
+        if backward:
+            self.prepend_rows(rows)
+        else:
+            self.append_rows(rows)
+    
+    def first_visible_index(self):
+        """窗口中第一个可见行的位置"""
+        return round(float(self.tree.yview()[0]) * len(self.tree.get_children()))
+    
+    def scroll_to_index(self, index):
+        children = len(self.tree.get_children())
+        if children:
+            self.tree.yview_moveto(max(0, index) / children)
+    
+    def append_rows(self, rows):
+        """在窗口末尾追加一页；超过上限时移除窗口开头的行"""
+        first_visible = self.first_visible_index()
+        for row in rows:
+            # 分页查询期间本地写入可能已插入同一行
+            if not self.tree.exists(str(row[0])):
+                self.insert_item(*row)
+        self.has_more = len(rows) == self.PAGE_SIZE
+        
+        excess = len(self.tree.get_children()) - self.MAX_LOADED_ROWS
+        if excess > 0:
+            self.evict(self.tree.get_children()[:excess])
+            self.has_before = True
+            self.retag_from(0)
+            self.scroll_to_index(first_visible - excess)
+    
+    def prepend_rows(self, rows):
+        """在窗口开头插入一页；超过上限时移除窗口末尾的行"""
+        first_visible = self.first_visible_index()
+        self.has_before = len(rows) == self.PAGE_SIZE
+        rows = [row for row in rows if not self.tree.exists(str(row[0]))]
+        for index, row in enumerate(rows):
+            self.insert_item(*row, index=index)
+        
+        children = self.tree.get_children()
+        if len(children) > self.MAX_LOADED_ROWS:
+            self.evict(children[self.MAX_LOADED_ROWS:])
+            self.has_more = True
+        self.retag_from(0)
+        self.scroll_to_index(first_visible + len(rows))
+    
+    def evict(self, items):
+        """从表格和行模型中移除窗口之外的行"""
+        self.tree.delete(*items)
+        for iid in items:
+            self.model.remove(int(iid))
+        self.row_count -= len(items)
+    
+    def on_yscroll(self, first, last):
+        """滚动回调：更新滚动条，接近窗口两端时在后台加载相邻的一页"""
+        self.scrollbar.set(first, last)
+        if self._load_pending:
+            return
+        if self.has_more and float(last) >= 1.0 - self.PREFETCH_THRESHOLD:
+            self.request_page()
+        elif self.has_before and float(first) <= self.PREFETCH_THRESHOLD:
+            self.request_page(backward=True)
     
     def clear_all(self):
         """清空所有记录"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        # 重置所有排序状态
-        for key in self.sort_states:
-            self.sort_states[key] = False
-        # 重置表头文字
-        for column in self.tree['columns']:
-            self.tree.heading(column, text=self.get_column_title(column))
+        self.tree.delete(*self.tree.get_children())
+        self.model.clear()
+        self.row_count = 0
+        self.has_more = False
+        self.has_before = False
+        self._load_pending = False
+        self._loader_generation += 1
     
     def get_selected_item(self):
         """获取选中的记录"""
         selection = self.tree.selection()
         if selection:
             return self.tree.item(selection[0])
-        return None 
\ No newline at end of file
+        return None
+    
+    def loaded_count(self):
+        """已加载的行数"""
+        return len(self.model)
+    
+    def window_start(self):
+        """窗口之前还有行时返回窗口的第一行（重新加载时从这里开始），否则返回 None"""
+        children = self.tree.get_children()
+        if not self.has_before or not children:
+            return None
+        return self.model.row(int(children[0]))
+    
+    def save_view(self):
+        """记录选中行和滚动位置，重新加载后用 restore_view 恢复"""
+        return self.tree.selection(), self.tree.yview()[0]
+    
+    def restore_view(self, view):
+        """恢复选中行（已不存在的行忽略）和滚动位置"""
+        selection, first = view
+        self.tree.selection_set([iid for iid in selection if self.tree.exists(iid)])
+        self.tree.yview_moveto(first)
+    
+    def get_selected_ids(self):
+        """获取所有选中发票的编号（按显示顺序）"""
+        return [int(iid) for iid in self.tree.selection()]
+    
+    def get_selection_subtotal(self):
+        """选中行的 (数量, 金额合计)，在行模型上计算"""
+        return self.model.subtotal(self.get_selected_ids()) 
\ No newline at end of file
@@ -1,19 +1,48 @@
+from utils.startup import StartupProfile
+# 尽早开始计时，统计包括模块导入在内的启动耗时
+startup_profile = StartupProfile()
+
 import tkinter as tk
 from tkinter import ttk
-from tkcalendar import DateEntry
 import sqlite3
 import os
+import threading
 from datetime import datetime
-from tkinter import filedialog, messagebox
-from components.invoice_dialog import InvoiceDialog
+from tkinter import messagebox
 from components.detail_panel import DetailPanel
 from components.treeview import InvoiceTreeview
-from utils.backup import BackupManager
+from components.filter_bar import FilterBar
+from utils.database import (InvoiceRepository, InvoiceConflictError, DEFAULT_DB_PATH, invoice_matches_search,
+                            invoice_to_list_row, sort_key_function)
+from utils.query_worker import QueryWorker
+from utils.invoice_cache import InvoiceCache
+from utils.tracing import tracer
+from utils.pdf_reconciler import FileStatusCache
+# 对话框、导入、备份、PDF文字索引等模块在第一次使用时才导入
+
+startup_profile.mark('导入模块')
+
+# 搜索输入防抖间隔（毫秒）
+SEARCH_DEBOUNCE_MS = 250
+
+# 选中发票时预取上下各几行的PDF预览
+PREVIEW_PREFETCH_ROWS = 2
+
+# 选中发票时预取上下各多少行的详情（一条查询），以及距已缓存范围边缘多少行时开始预取
+DETAIL_PREFETCH_ROWS = 100
+DETAIL_PREFETCH_MARGIN = 10
+
+# 检查其他用户是否写入过数据库（PRAGMA data_version）的间隔（毫秒）
+DATA_VERSION_POLL_MS = 2000
+
+# 首次绘制后再等待多久启动后台任务（备份、PDF文字索引），让界面先响应操作（毫秒）
+BACKGROUND_START_DELAY_MS = 2000
 
 class InvoiceManager:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("发票管理系统")
+        self.startup_profile = startup_profile
         
         # 设置全局字体
         default_font = ('Microsoft YaHei UI', 15)  # 微软雅黑UI，15号
@@ -43,49 +72,140 @@ class InvoiceManager:
             self.root.geometry(f"{screen_width}x{screen_height}+0+0")
             self.root.attributes('-zoomed', True)
         
+        self.startup_profile.mark('创建窗口')
+        
         # 确保PDF存储目录存在
         self.pdf_dir = "./invoices_pdf"
         os.makedirs(self.pdf_dir, exist_ok=True)
+        # PDF文件是否存在的缓存（由后台对账刷新，选中发票时不访问文件系统）
+        self.file_status = FileStatusCache()
         
         # 初始化数据库
         self.init_database()
+        self.startup_profile.mark('打开数据库')
         
-        # 初始化备份管理器
-        self.backup_manager = BackupManager('invoices.db')
+        # 备份管理器在首次绘制之后才创建（见 start_background_tasks）
+        self.backup_manager = None
+        self.pdf_indexer = None
+        self.pdf_reconciler = None
+        self.background_started = False
         
         # 创建界面
         self.create_gui()
+        self.startup_profile.mark('创建界面')
         
-        # 加载并显示所有记录
+        # 加载并显示第一页记录（后台查询）
         self.refresh_invoice_list()
         
+        # 窗口绘制完成后再启动非必要的后台任务
+        self.root.after_idle(self.on_first_paint)
+    
+    def on_first_paint(self):
+        """窗口首次绘制完成"""
+        self.startup_profile.mark('首次绘制')
+        self.root.after(BACKGROUND_START_DELAY_MS, self.start_background_tasks)
+        self.root.after(DATA_VERSION_POLL_MS, self.poll_external_changes)
+    
+    def poll_external_changes(self):
+        """定时检查其他用户是否写入过数据库，只有确实写入过才重新加载"""
+        try:
+            if self.repo.has_external_changes():
+                self.reload_external_changes()
+        except sqlite3.Error as e:
+            print(f"Cannot check database changes: {str(e)}")
+        self.root.after(DATA_VERSION_POLL_MS, self.poll_external_changes)
+    
+    def reload_external_changes(self):
+        """数据库被其他程序修改后：清空详情缓存，重新加载列表并保留选中行和滚动位置"""
+        self.invoice_cache.clear()
+        self.refresh_invoice_list(keep_view=True)
+    
+    def start_background_tasks(self):
+        """启动定时备份、PDF文字索引和PDF对账"""
+        self.background_started = True
+        self.get_backup_manager().start()
+        self.index_pdf_text()
+        self.reconcile_pdfs()
+    
+    def reconcile_pdfs(self):
+        """在后台把不再被任何发票引用的PDF移到回收区，并刷新文件状态缓存"""
+        if not self.background_started:
+            # 启动阶段的后台任务开始时会执行一次
+            return
+        if self.pdf_reconciler is None:
+            pdf_reconciler = self.startup_profile.timed_import('utils.pdf_reconciler')
+            self.pdf_reconciler = pdf_reconciler.PdfReconciler(self.repo, self.pdf_dir, self.file_status)
+        self.pdf_reconciler.start()
+    
+    def get_backup_manager(self):
+        """第一次使用时创建备份管理器"""
+        if self.backup_manager is None:
+            backup = self.startup_profile.timed_import('utils.backup')
+            self.backup_manager = backup.BackupManager(self.repo.db_path, auto_start=False)
+        return self.backup_manager
+    
+    def show_diagnostics(self, event=None):
+        """打开诊断窗口：各操作耗时、慢查询及其执行计划，可导出为JSON"""
+        from components.diagnostics_dialog import DiagnosticsDialog
+        DiagnosticsDialog(self.root, tracer, {'startup': self.startup_profile.report()})
+    
+    def show_startup_report(self, event=None):
+        """显示启动耗时报告（F12）"""
+        messagebox.showinfo("启动耗时", self.startup_profile.report())
+        
     def init_database(self):
         """初始化SQLite数据库"""
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        
-        # 检查表是否存在
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='invoices'")
-        table_exists = cursor.fetchone() is not None
-        
-        if not table_exists:
-            # 创建新表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS invoices (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    content TEXT NOT NULL,
-                    platform TEXT,
-                    expense_type TEXT NOT NULL,
-                    amount REAL NOT NULL,
-                    note TEXT,
-                    pdf_path TEXT,
-                    reimbursed BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-        
-        conn.commit()
-        conn.close()
+        # 需要升级数据库结构时显示进度窗口（大数据库的回填可能需要较长时间）
+        migration_dialog = None
+        
+        def report_migration(description, done, total):
+            nonlocal migration_dialog
+            if migration_dialog is None:
+                from components.migration_dialog import MigrationDialog
+                migration_dialog = MigrationDialog(self.root)
+            migration_dialog.update(description, done, total)
+        
+        try:
+            # 连接池供列表查询、分页和详情预取三个后台线程使用
+            self.repo = InvoiceRepository(DEFAULT_DB_PATH, pool_size=3, migration_progress=report_migration)
+        finally:
+            if migration_dialog is not None:
+                migration_dialog.close()
+        
+        # 发票详情缓存（先于界面订阅变更事件，界面处理变更时读到的已是新数据）
+        self.invoice_cache = InvoiceCache(self.repo)
+        
+        # 后台查询线程：结果通过 root.after 交回界面线程
+        self.query_worker = QueryWorker(self.repo.pool, lambda callback: self.root.after(0, callback))
+        # 详情预取和滚动分页使用单独的线程，不会中断列表查询
+        self.prefetch_worker = QueryWorker(self.repo.pool, lambda callback: self.root.after(0, callback))
+        self.page_worker = QueryWorker(self.repo.pool, lambda callback: self.root.after(0, callback))
+        self._search_after_id = None
+        
+        # 当前列表对应的搜索词、筛选条件和统计数字（用于增量更新）
+        self.displayed_search_term = ''
+        self.displayed_filter = None
+        self.statistics = (0, 0)
+        self.summary = None
+        
+        # 写入后只修补受影响的行
+        self.repo.subscribe(self.on_invoices_changed)
+    
+    def index_pdf_text(self):
+        """在后台索引尚未提取文字的PDF（多进程，已索引的不会重复解析），完成后如正在搜索则刷新结果"""
+        if self.pdf_indexer is None:
+            # 启动阶段的后台任务尚未开始时，新增的PDF会在那时一并索引
+            if not self.background_started:
+                return
+            pdf_text = self.startup_profile.timed_import('utils.pdf_text')
+            if not pdf_text.extractor_available():
+                return
+            self.pdf_indexer = pdf_text.PdfTextIndexer(self.repo)
+        
+        def on_done(count):
+            self.root.after(0, lambda: self.displayed_search_term and self.refresh_invoice_list())
+        
+        self.pdf_indexer.start(on_done)
         
     def create_gui(self):
         """创建主界面"""
@@ -110,15 +230,22 @@ class InvoiceManager:
         search_frame.pack(side=tk.LEFT, padx=5)
         ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT, padx=5)
         self.search_var = tk.StringVar()
-        self.search_var.trace('w', lambda name, index, mode: self.refresh_invoice_list())
+        self.search_var.trace_add('write', self.on_search_change)
         ttk.Entry(search_frame, textvariable=self.search_var, width=30).pack(side=tk.LEFT, padx=5)
         
         # 创建新增按钮（放在搜索框右边）
         ttk.Button(top_frame, text="新增", command=self.add_invoice).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="导入", command=self.import_invoices).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="导出", command=self.export_invoices).pack(side=tk.LEFT, padx=5)
         ttk.Button(top_frame, text="备份", command=self.backup_database).pack(side=tk.RIGHT, padx=5)
         
+        # 创建筛选栏（日期范围、金额范围、报销状态、费用类型）
+        self.filter_bar = FilterBar(left_frame, self.refresh_invoice_list)
+        self.filter_bar.frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+        
         # 创建发票列表
         self.invoice_tree = InvoiceTreeview(left_frame)
+        self.invoice_tree.sort_callback = lambda sort_keys: self.refresh_invoice_list()
         
         # 创建状态栏（移到最底部）
         self.status_var = tk.StringVar()
@@ -131,10 +258,17 @@ class InvoiceManager:
         
         # 绑定选择事件
         self.invoice_tree.tree.bind('<<TreeviewSelect>>', self.on_select)
+        # 右键菜单和 Delete 键批量操作选中的发票（Ctrl+A 全选已加载的行）
+        right_button = '<Button-2>' if self.root.tk.call('tk', 'windowingsystem') == 'aqua' else '<Button-3>'
+        self.invoice_tree.tree.bind(right_button, self.show_context_menu)
+        self.invoice_tree.tree.bind('<Delete>', lambda event: self.delete_selected_invoices())
+        self.invoice_tree.tree.bind('<Control-a>', self.select_all)
         
-        # 更新状态栏初始统计
-        self.update_statistics()
+        # F12 查看启动耗时，Ctrl+Shift+D 打开诊断窗口（不在界面上显示）
+        self.root.bind('<F12>', self.show_startup_report)
+        self.root.bind('<Control-D>', self.show_diagnostics)
         
+    @tracer.traced('on_select')
     def on_select(self, event):
         """处理发票选择事件"""
         selected_items = self.invoice_tree.tree.selection()
@@ -142,78 +276,79 @@ class InvoiceManager:
             self.detail_panel.clear_details()
             return
         
-        # 获取选中项的ID
-        item_values = self.invoice_tree.tree.item(selected_items[0])['values']
-        invoice_id = item_values[0]
-        
-        # 从数据库获取完整的发票信息
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, content, platform, expense_type, amount, note, pdf_path, reimbursed
-            FROM invoices 
-            WHERE id = ?
-        ''', (invoice_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            invoice_data = {
-                'id': row[0],
-                'content': row[1],
-                'platform': row[2],
-                'expense_type': row[3],
-                'amount': row[4],
-                'note': row[5],
-                'pdf_path': row[6],
-                'reimbursed': bool(row[7])
-            }
+        # 多选时显示选中数量和合计金额，可批量操作
+        if len(selected_items) > 1:
+            self.detail_panel.show_selection(*self.invoice_tree.get_selection_subtotal())
+            return
+        
+        # 表格项的iid即发票编号
+        invoice_id = int(selected_items[0])
+        
+        # 获取完整的发票信息（通常已由相邻行预取缓存，不访问数据库）
+        invoice_data = self.invoice_cache.get(invoice_id)
+        if invoice_data:
             # 更新详情面板
             self.detail_panel.show_details(invoice_data)
+            self.prefetch_neighbour_details(selected_items[0])
+            self.prefetch_neighbour_previews(selected_items[0])
+    
+    def select_all(self, event=None):
+        """选中所有已加载的行"""
+        self.invoice_tree.tree.selection_set(self.invoice_tree.tree.get_children())
+        return 'break'
+    
+    def prefetch_neighbour_details(self, iid):
+        """选中行附近有未缓存的记录时，在后台用一条查询预取上下各一页的详情"""
+        children = self.invoice_tree.tree.get_children()
+        index = children.index(iid)
+        
+        def ids(margin):
+            return [int(item) for item in children[max(0, index - margin):index + margin + 1]]
+        
+        if not self.invoice_cache.missing(ids(DETAIL_PREFETCH_MARGIN)):
+            return
+        missing = self.invoice_cache.missing(ids(DETAIL_PREFETCH_ROWS))
+        self.prefetch_worker.submit(lambda conn: self.invoice_cache.load(missing, conn),
+                                    lambda result: self.invoice_cache.store(*result))
+    
+    def prefetch_neighbour_previews(self, iid):
+        """预取选中行上下相邻发票的PDF预览"""
+        tree = self.invoice_tree.tree
+        neighbours = []
+        previous_iid = next_iid = iid
+        for _ in range(PREVIEW_PREFETCH_ROWS):
+            next_iid = next_iid and tree.next(next_iid)
+            previous_iid = previous_iid and tree.prev(previous_iid)
+            neighbours.extend(item for item in (next_iid, previous_iid) if item)
+        # 只使用已缓存的记录，预取预览不值得为此查询数据库
+        invoices = [self.invoice_cache.get(int(item)) for item in neighbours if int(item) in self.invoice_cache]
+        self.detail_panel.prefetch_previews([invoice['pdf_path'] for invoice in invoices
+                                             if invoice and invoice['pdf_path']])
     
     def get_invoice_details(self, invoice_id):
-        """从数据库获取发票详细信息"""
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, content, platform, expense_type, amount, note, pdf_path, reimbursed 
-            FROM invoices 
-            WHERE id = ?
-        ''', (invoice_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return {
-                'id': row[0],
-                'content': row[1],
-                'platform': row[2],
-                'expense_type': row[3],
-                'amount': row[4],
-                'note': row[5],
-                'pdf_path': row[6],
-                'reimbursed': bool(row[7])
-            }
-        return None
+        """获取发票详细信息（经过详情缓存）"""
+        return self.invoice_cache.get(invoice_id)
 
+    def create_invoice_dialog(self, invoice_data=None):
+        """创建新增/编辑对话框（第一次打开时才导入对话框模块）"""
+        invoice_dialog = self.startup_profile.timed_import('components.invoice_dialog')
+        return invoice_dialog.InvoiceDialog(self.root, self.pdf_dir, invoice_data)
+    
     def show_add_dialog(self):
         """显示新增发票对话框"""
-        dialog = InvoiceDialog(self.root, self.pdf_dir)
+        dialog = self.create_invoice_dialog()
         self.root.wait_window(dialog.dialog)
         
         if dialog.result:
             self.save_invoice(dialog.result)
-            self.refresh_invoice_list()
     
     def show_edit_dialog(self, invoice_data):
         """显示编辑发票对话框"""
-        dialog = InvoiceDialog(self.root, self.pdf_dir, invoice_data)
+        dialog = self.create_invoice_dialog(invoice_data)
         self.root.wait_window(dialog.dialog)
         
         if dialog.result:
             self.update_invoice(dialog.result)
-            self.refresh_invoice_list()
     
     def edit_selected_invoice(self):
         """编辑当前选中的发票"""
@@ -221,74 +356,30 @@ class InvoiceManager:
         if selected_item:
             invoice_id = selected_item['values'][0]  # 获取ID
             
-            # 从数据库获取完整的发票信息
-            conn = sqlite3.connect('invoices.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, content, platform, expense_type, amount, note, pdf_path, reimbursed
-                FROM invoices 
-                WHERE id = ?
-            ''', (invoice_id,))
-            
-            row = cursor.fetchone()
-            conn.close()
+            # 获取完整的发票信息（经过详情缓存）
+            invoice_data = self.get_invoice_details(invoice_id)
             
-            if row:
-                invoice_data = {
-                    'id': row[0],
-                    'content': row[1],
-                    'platform': row[2],
-                    'expense_type': row[3],
-                    'amount': row[4],
-                    'note': row[5],
-                    'pdf_path': row[6],
-                    'reimbursed': bool(row[7])
-                }
-                
-                dialog = InvoiceDialog(self.root, self.pdf_dir, invoice_data)
+            if invoice_data:
+                dialog = self.create_invoice_dialog(invoice_data)
                 self.root.wait_window(dialog.dialog)
                 
                 if dialog.result:
-                    # 确保ID被包含在更新数据中
+                    # 确保ID和读取时的版本号被包含在更新数据中（版本号用于检测其他用户的修改）
                     dialog.result['id'] = invoice_id
-                    if self.update_invoice(dialog.result):
-                        self.refresh_invoice_list()
+                    dialog.result['version'] = invoice_data['version']
+                    self.update_invoice(dialog.result)
 
     def check_invoice_id_exists(self, invoice_id):
         """检查发票编号是否已存在"""
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM invoices WHERE id = ?', (invoice_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count > 0
+        return self.repo.invoice_exists(invoice_id)
     
     def save_invoice(self, invoice_data):
         """保存新发票到数据库"""
         try:
-            conn = sqlite3.connect('invoices.db')
-            cursor = conn.cursor()
-            
             # 获取当前系统时间
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-            cursor.execute('''
-                INSERT INTO invoices 
-                (content, platform, expense_type, amount, note, pdf_path, reimbursed, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                invoice_data['content'],
-                invoice_data['platform'],
-                invoice_data['expense_type'],
-                invoice_data['amount'],
-                invoice_data['note'],
-                invoice_data['pdf_path'],
-                invoice_data['reimbursed'],
-                current_time
-            ))
-            
-            conn.commit()
-            conn.close()
+            self.repo.insert_invoice(invoice_data, current_time)
             messagebox.showinfo("成功", "发票保存成功")
             return True
             
@@ -299,149 +390,177 @@ class InvoiceManager:
     def update_invoice(self, invoice_data):
         """更新发票信息"""
         try:
-            conn = sqlite3.connect('invoices.db')
-            cursor = conn.cursor()
-            
-            # 如果PDF路径发生变化，删除旧的PDF文件
-            cursor.execute('SELECT pdf_path FROM invoices WHERE id = ?', (invoice_data['id'],))
-            old_pdf = cursor.fetchone()
-            if old_pdf and old_pdf[0] and old_pdf[0] != invoice_data['pdf_path']:
-                try:
-                    os.remove(old_pdf[0])
-                except OSError:
-                    pass
+            old_pdf = self.repo.update_invoice(invoice_data)
             
-            cursor.execute('''
-                UPDATE invoices
-                SET content = ?, 
-                    platform = ?, 
-                    expense_type = ?, 
-                    amount = ?, 
-                    note = ?, 
-                    pdf_path = ?, 
-                    reimbursed = ?
-                WHERE id = ?
-            ''', (
-                invoice_data['content'],
-                invoice_data['platform'],
-                invoice_data['expense_type'],
-                invoice_data['amount'],
-                invoice_data['note'],
-                invoice_data['pdf_path'],
-                invoice_data['reimbursed'],
-                invoice_data['id']
-            ))
+            # 如果PDF路径发生变化，旧文件不再被引用时由后台对账移到回收区
+            if old_pdf and old_pdf != invoice_data['pdf_path']:
+                self.reconcile_pdfs()
             
-            conn.commit()
-            conn.close()
             messagebox.showinfo("成功", "发票更新成功")
             return True
             
+        except InvoiceConflictError as e:
+            messagebox.showwarning("数据已变化", f"{str(e)}，你的修改没有保存。已重新加载最新内容，请重新编辑。")
+            self.reload_external_changes()
+            return False
         except sqlite3.Error as e:
             messagebox.showerror("数据库错误", f"更新发票时出错：{str(e)}")
             return False
     
     def on_search_change(self, *args):
-        """搜索框内容变化时触发搜索"""
-        self.refresh_invoice_list()
+        """搜索框内容变化时触发搜索（防抖：停止输入一段时间后才查询）"""
+        if self._search_after_id is not None:
+            self.root.after_cancel(self._search_after_id)
+        self._search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.refresh_invoice_list)
     
-    def refresh_invoice_list(self):
-        """刷新发票列表"""
-        # 清空现有列表
-        self.invoice_tree.clear_all()
+    def refresh_invoice_list(self, keep_view=False):
+        """刷新发票列表（查询在后台线程执行，只加载第一页，滚动时在后台按需加载相邻的页）
+
+        keep_view 为 True 时从当前窗口的第一行起重新加载同样多的行，并保留选中行和滚动位置
+        """
+        self._search_after_id = None
         
-        # 获取搜索关键词
+        # 获取搜索关键词、筛选条件和当前排序键
         search_term = self.search_var.get().strip().lower()
-        
-        # 从数据库获取数据
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        
-        if search_term:
-            # 构建模糊搜索条件
-            search_pattern = f"%{search_term}%"
-            cursor.execute('''
-                SELECT id, content, platform, expense_type, amount, reimbursed, created_at 
-                FROM invoices 
-                WHERE LOWER(content) LIKE ? 
-                OR LOWER(platform) LIKE ? 
-                OR LOWER(expense_type) LIKE ?
-                ORDER BY id DESC
-            ''', (search_pattern, search_pattern, search_pattern))
-        else:
-            # 无搜索词时显示全部
-            cursor.execute('''
-                SELECT id, content, platform, expense_type, amount, reimbursed, created_at 
-                FROM invoices 
-                ORDER BY id DESC
-            ''')
-        
-        # 填充数据到表格
-        for row in cursor.fetchall():
-            # 将时间字符串转换为datetime对象
-            created_at = datetime.strptime(row[6], '%Y-%m-%d %H:%M:%S') if row[6] else None
-            # 使用解包操作符将前6个元素传递，然后单独传递created_at
-            self.invoice_tree.insert_item(*row[:6], created_at)
-        
-        conn.close()
-        
-        # 更新统计信息
-        self.update_statistics()
+        filters = self.filter_bar.filter
+        sort_keys = list(self.invoice_tree.sort_keys)
+        page_size = self.invoice_tree.PAGE_SIZE
+        window_start = None
+        if keep_view:
+            page_size = max(page_size, self.invoice_tree.loaded_count())
+            window_start = self.invoice_tree.window_start()
+        # 从提交查询到显示第一页的总耗时
+        span = tracer.span('refresh_invoice_list')
+        
+        def load_page(anchor, backward, limit, on_done):
+            # 滚动分页：以窗口两端的行作为键集分页位置，在分页线程中查询
+            def query(conn):
+                if backward:
+                    return self.repo.list_page(search_term, sort_keys, None, limit, conn, filters, before=anchor)
+                return self.repo.list_page(search_term, sort_keys, anchor, limit, conn, filters)
+            
+            def show_page_error(error):
+                print(f"Cannot load page: {str(error)}")
+                on_done(None)
+            
+            self.page_worker.submit(query, on_done, show_page_error)
+        
+        def query(conn):
+            # 在后台线程中同时查询第一页和统计信息
+            after = None
+            if window_start is not None:
+                # 从原窗口的第一行起加载（该行已被删除时从它原来的位置起）
+                previous = self.repo.list_page(search_term, sort_keys, None, 1, conn, filters, before=window_start)
+                after = previous[-1] if previous else None
+            rows = self.repo.list_page(search_term, sort_keys, after, page_size, conn, filters)
+            with tracer.span('update_statistics'):
+                statistics = self.repo.get_statistics(search_term, conn, filters)
+                summary = self.repo.get_summary(conn)
+            return rows, after is not None, statistics, summary
+        
+        def show(result):
+            rows, has_before, (count, total), self.summary = result
+            self.displayed_search_term = search_term
+            self.displayed_filter = filters
+            view = self.invoice_tree.save_view() if keep_view else None
+            self.invoice_tree.set_page_loader(load_page, rows, page_size, has_before)
+            if view is not None:
+                self.invoice_tree.restore_view(view)
+                # 详情面板显示最新内容（选中的发票被删除时清空）
+                self.on_select(None)
+            self.show_statistics(count, total)
+            span.finish(len(rows))
+            self.startup_profile.finish('显示第一页')
+        
+        def show_error(error):
+            span.finish()
+            messagebox.showerror("数据库错误", f"查询发票时出错：{str(error)}")
+        
+        self.query_worker.submit(query, show, show_error)
     
-    def update_statistics(self):
-        """更新统计信息"""
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        
-        search_term = self.search_var.get().strip().lower()
+    def show_statistics(self, count, total):
+        """在状态栏显示统计信息"""
+        self.statistics = (count, total)
+        text = f"共 {count} 张发票   总金额: ¥ {total:,.2f}"
+        if self.summary:
+            # 汇总数字由触发器维护的汇总表提供，不需要扫描发票表
+            text += (f"   未报销垫付: ¥ {self.summary['unreimbursed_advance_total']:,.2f}"
+                     f"   本月: {self.summary['month_count']} 张 / ¥ {self.summary['month_total']:,.2f}")
+        self.status_var.set(text)
+    
+    def on_invoices_changed(self, changes):
+        """数据变更后只修补受影响的行并按差值调整统计，保持当前排序和滚动位置（批量操作也只更新一次）"""
+        search_term = self.displayed_search_term
+        filters = self.displayed_filter
+        count, total = self.statistics
+        
+        def matches(invoice):
+            return invoice_matches_search(invoice, search_term) and (filters is None or filters.matches(invoice))
+        
+        # 新的PDF需要提取文字，并重新检查文件是否存在
+        new_pdf_paths = [change.new['pdf_path'] for change in changes if change.new and change.new['pdf_path'] and (
+            not change.old or change.old['pdf_path'] != change.new['pdf_path'])]
+        for pdf_path in new_pdf_paths:
+            self.file_status.invalidate(pdf_path)
+        if new_pdf_paths:
+            self.index_pdf_text()
+        
+        # 带附件的发票可能只因PDF文字匹配，内存中无法判断，重新查询
+        if search_term and any(invoice and invoice['pdf_path'] and not invoice_matches_search(invoice, search_term)
+                               for change in changes for invoice in (change.old, change.new)):
+            self.refresh_invoice_list()
+            self.update_detail_panel(changes)
+            return
         
-        if search_term:
-            search_pattern = f"%{search_term}%"
-            cursor.execute('''
-                SELECT COUNT(*), SUM(amount) 
-                FROM invoices 
-                WHERE LOWER(content) LIKE ? 
-                OR LOWER(platform) LIKE ? 
-                OR LOWER(expense_type) LIKE ?
-            ''', (search_pattern, search_pattern, search_pattern))
+        upserts = []
+        removals = []
+        for change in changes:
+            if change.old and matches(change.old):
+                count -= 1
+                total = round(total - change.old['amount'], 2)
+            
+            if change.new and matches(change.new):
+                count += 1
+                total = round(total + change.new['amount'], 2)
+                upserts.append(invoice_to_list_row(change.new))
+            else:
+                removals.append(change.invoice_id)
+        
+        sort_key = sort_key_function(self.invoice_tree.sort_keys)
+        if len(changes) == 1:
+            for row in upserts:
+                self.invoice_tree.upsert_row(row, sort_key)
+            for invoice_id in removals:
+                self.invoice_tree.remove_row(invoice_id)
         else:
-            cursor.execute('SELECT COUNT(*), SUM(amount) FROM invoices')
-        
-        count, total = cursor.fetchone()
-        count = count or 0
-        total = total or 0
-        
-        conn.close()
+            self.invoice_tree.patch_rows(upserts, removals, sort_key)
         
-        # 更新状态栏
-        self.status_var.set(f"共 {count} 张发票   总金额: ¥ {total:,.2f}")
+        # 统计按差值调整，只需重新读取汇总表
+        with tracer.span('update_statistics'):
+            self.summary = self.repo.get_summary()
+            self.show_statistics(count, total)
+        self.update_detail_panel(changes)
+    
+    def update_detail_panel(self, changes):
+        """正在显示的发票被修改时同步更新详情面板"""
+        if self.detail_panel.selection_count:
+            # 多选：重新计算选中数量和合计金额
+            self.on_select(None)
+            return
+        for change in changes:
+            if change.new and self.detail_panel.current_invoice_id == change.invoice_id:
+                self.detail_panel.show_details(change.new)
     
     def delete_invoice(self, invoice_id):
         """删除发票"""
         if messagebox.askyesno("确认删除", "确定要删除这张发票吗？"):
             try:
-                conn = sqlite3.connect('invoices.db')
-                cursor = conn.cursor()
-                
-                # 获取PDF路径
-                cursor.execute('SELECT pdf_path FROM invoices WHERE id = ?', (invoice_id,))
-                result = cursor.fetchone()
+                pdf_path = self.repo.delete_invoice(invoice_id)
                 
-                if result and result[0]:
-                    pdf_path = result[0]
-                    # 删除PDF文件
-                    try:
-                        os.remove(pdf_path)
-                    except OSError:
-                        pass  # 忽略文件删除错误
+                if pdf_path:
+                    # 不再被引用的PDF文件由后台对账移到回收区
+                    self.reconcile_pdfs()
                 
-                # 删除数据库记录
-                cursor.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
-                conn.commit()
-                conn.close()
-                
-                # 刷新列表
-                self.refresh_invoice_list()
                 # 清空详情面板
                 self.detail_panel.clear_details()
                 
@@ -450,77 +569,135 @@ class InvoiceManager:
             except sqlite3.Error as e:
                 messagebox.showerror("错误", f"删除发票时出错：{str(e)}")
 
+    def delete_selected_invoices(self):
+        """删除所有选中的发票（一个事务）"""
+        invoice_ids = self.invoice_tree.get_selected_ids()
+        if not invoice_ids:
+            return
+        if len(invoice_ids) == 1:
+            self.delete_invoice(invoice_ids[0])
+            return
+        if not messagebox.askyesno("确认删除", f"确定要删除选中的 {len(invoice_ids)} 张发票吗？"):
+            return
+        try:
+            if self.repo.delete_many(invoice_ids):
+                self.reconcile_pdfs()
+            self.detail_panel.clear_details()
+        except sqlite3.Error as e:
+            messagebox.showerror("错误", f"删除发票时出错：{str(e)}")
+    
+    def set_selected_reimbursed(self, reimbursed):
+        """把所有选中的发票标记为已报销/未报销（一个事务）"""
+        invoice_ids = self.invoice_tree.get_selected_ids()
+        if not invoice_ids:
+            return
+        try:
+            self.repo.set_reimbursed_many(invoice_ids, reimbursed)
+        except sqlite3.Error as e:
+            messagebox.showerror("数据库错误", f"更新报销状态时出错：{str(e)}")
+    
+    def set_selected_expense_type(self, expense_type):
+        """修改所有选中发票的费用类型（一个事务）"""
+        invoice_ids = self.invoice_tree.get_selected_ids()
+        if not invoice_ids:
+            return
+        try:
+            self.repo.set_expense_type_many(invoice_ids, expense_type)
+        except sqlite3.Error as e:
+            messagebox.showerror("数据库错误", f"修改费用类型时出错：{str(e)}")
+    
+    def show_context_menu(self, event):
+        """右键菜单：对选中的发票批量操作（右键点击未选中的行时改为选中该行）"""
+        iid = self.invoice_tree.tree.identify_row(event.y)
+        if not iid:
+            return
+        if iid not in self.invoice_tree.tree.selection():
+            self.invoice_tree.tree.selection_set(iid)
+        count = len(self.invoice_tree.tree.selection())
+        
+        menu = tk.Menu(self.root, tearoff=0)
+        menu.add_command(label=f"标记为已报销 ({count})", command=lambda: self.set_selected_reimbursed(True))
+        menu.add_command(label=f"标记为未报销 ({count})", command=lambda: self.set_selected_reimbursed(False))
+        type_menu = tk.Menu(menu, tearoff=0)
+        for expense_type in ('垫付', '自费'):
+            type_menu.add_command(label=expense_type,
+                                  command=lambda value=expense_type: self.set_selected_expense_type(value))
+        menu.add_cascade(label="修改费用类型", menu=type_menu)
+        menu.add_separator()
+        menu.add_command(label=f"删除 ({count})", command=self.delete_selected_invoices)
+        menu.tk_popup(event.x_root, event.y_root)
+    
     def add_invoice(self):
         """添加新发票"""
-        dialog = InvoiceDialog(self.root, self.pdf_dir)
+        dialog = self.create_invoice_dialog()
         self.root.wait_window(dialog.dialog)
         
         if dialog.result:
-            if self.save_invoice(dialog.result):
-                self.refresh_invoice_list()
+            self.save_invoice(dialog.result)
 
-    def delete_selected_invoice(self):
-        """删除选中的发票"""
-        selected_item = self.invoice_tree.tree.selection()
-        if not selected_item:
-            messagebox.showwarning("警告", "请先选择要删除的发票")
+    def export_invoices(self):
+        """按当前搜索词、筛选条件和排序导出发票（CSV / XLSX / JSON Lines）"""
+        from tkinter import filedialog
+        from components.export_dialog import ExportDialog
+        
+        file_path = filedialog.asksaveasfilename(
+            title="导出发票",
+            defaultextension=".csv",
+            initialfile=f"发票_{datetime.now().strftime('%Y%m%d')}.csv",
+            filetypes=[("CSV files", "*.csv"), ("Excel files", "*.xlsx"), ("JSON Lines", "*.jsonl")]
+        )
+        if not file_path:
             return
         
-        # 获取发票ID和内容
-        item_values = self.invoice_tree.tree.item(selected_item)['values']
-        invoice_id = item_values[0]
-        invoice_content = item_values[1]
-        
-        # 确认删除
-        if not messagebox.askyesno("确认删除", 
-                                  f"确定要删除以下发票吗？\n\n"
-                                  f"编号: {invoice_id}\n"
-                                  f"内容: {invoice_content}"):
+        ExportDialog(self.root, self.repo, file_path, self.displayed_search_term, list(self.invoice_tree.sort_keys),
+                     self.displayed_filter)
+
+    def import_invoices(self):
+        """从CSV/XLSX文件批量导入发票"""
+        from tkinter import filedialog
+        from components.import_dialog import ImportDialog
+        
+        file_path = filedialog.askopenfilename(
+            title="选择导入文件",
+            filetypes=[("CSV/Excel files", "*.csv *.xlsx"), ("CSV files", "*.csv"), ("Excel files", "*.xlsx")]
+        )
+        if not file_path:
             return
         
-        try:
-            # 从数据库中删除发票
-            conn = sqlite3.connect('invoices.db')
-            cursor = conn.cursor()
-            
-            # 先获取PDF文件路径
-            cursor.execute('SELECT pdf_path FROM invoices WHERE id = ?', (invoice_id,))
-            pdf_path = cursor.fetchone()[0]
-            
-            # 删除数据库记录
-            cursor.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
-            conn.commit()
-            conn.close()
-            
-            # 如果存在PDF文件，也删除它
-            if pdf_path and os.path.exists(pdf_path):
-                try:
-                    os.remove(pdf_path)
-                except OSError:
-                    pass
-            
-            # 刷新列表
-            self.refresh_invoice_list()
-            
-            # 清空详情面板
-            self.detail_panel.clear_details()
-            
-            messagebox.showinfo("成功", "发票已删除")
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("数据库错误", f"删除发票时出错：{str(e)}")
+        def on_finished(report):
+            # 批量导入不逐行发出变更事件，完成后整体刷新一次
+            if report and report.inserted:
+                self.refresh_invoice_list()
+        
+        ImportDialog(self.root, self.repo, file_path, on_finished)
 
     def backup_database(self):
-        """备份数据库"""
-        try:
-            # 创建备份
-            backup_path = self.backup_manager.create_backup()
-            if backup_path:
+        """备份数据库（在后台线程中执行，状态栏显示进度）"""
+        def report_progress(done, total):
+            percent = done * 100 // total if total else 100
+            self.root.after(0, lambda: self.status_var.set(f"正在备份数据库... {percent}%"))
+        
+        def finish(backup_path, error):
+            # 恢复状态栏统计信息
+            self.show_statistics(*self.statistics)
+            if error is not None:
+                messagebox.showerror("错误", f"备份过程中出错：\n{str(error)}")
+            elif backup_path:
                 messagebox.showinfo("成功", f"数据库已备份到：\n{backup_path}")
             else:
                 messagebox.showwarning("警告", "备份失败")
-        except Exception as e:
-            messagebox.showerror("错误", f"备份过程中出错：\n{str(e)}")
+        
+        backup_manager = self.get_backup_manager()
+        
+        def run_backup():
+            try:
+                # 创建备份
+                backup_path = backup_manager.create_backup(progress=report_progress)
+                self.root.after(0, lambda: finish(backup_path, None))
+            except Exception as e:
+                self.root.after(0, lambda error=e: finish(None, error))
+        
+        threading.Thread(target=run_backup, daemon=True).start()
 
     def run(self):
         """运行程序"""
@@ -528,6 +705,13 @@ class InvoiceManager:
         self.root.minsize(800, 600)
         # 运行主循环
         self.root.mainloop()
+        # 退出时停止后台查询并关闭数据库连接
+        self.query_worker.stop()
+        self.prefetch_worker.stop()
+        self.page_worker.stop()
+        if self.detail_panel.preview_renderer is not None:
+            self.detail_panel.preview_renderer.stop()
+        self.repo.close()
 
 if __name__ == "__main__":
     app = InvoiceManager()
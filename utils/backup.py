@@ -1,58 +1,373 @@
+import argparse
+import hashlib
+import json
 import os
-import shutil
 import sqlite3
-from datetime import datetime
+import tempfile
+import zlib
+from datetime import datetime, timedelta
 import threading
 import time
 
 class BackupManager:
-    def __init__(self, db_path, backup_dir='./backups'):
+    """增量去重备份：数据库快照与PDF文件都按内容寻址分块存储
+
+    备份目录结构：
+        objects/ab/abcdef...   zlib压缩的数据块，文件名为原始数据的SHA-256
+        snapshots/<时间戳>.json 每次备份的清单（数据库与每个PDF对应的数据块列表）
+    未变化的数据块只存一份，未变化的PDF只占清单中的一条记录
+    """
+    # 每一步复制的页数（默认页大小4KB时约1MB）
+    PAGES_PER_STEP = 256
+    # 每步之间的间隔（秒），让写入者有机会获得锁
+    STEP_SLEEP = 0.01
+    # 分块大小（页大小的整数倍，数据库中未改动的页区间可以复用）
+    CHUNK_SIZE = 256 * 1024
+    # 自动备份间隔（秒）
+    BACKUP_INTERVAL = 24 * 60 * 60
+    # 默认保留策略：最近7天每天一份、最近4周每周一份、最近12个月每月一份
+    DEFAULT_RETENTION = {'daily': 7, 'weekly': 4, 'monthly': 12}
+
+    def __init__(self, db_path, backup_dir='./backups', pdf_dir='./invoices_pdf', retention=None,
+                 auto_start=True):
         self.db_path = db_path
         self.backup_dir = backup_dir
-        os.makedirs(backup_dir, exist_ok=True)
-        
+        self.pdf_dir = pdf_dir
+        self.retention = dict(self.DEFAULT_RETENTION, **(retention or {}))
+        self.objects_dir = os.path.join(backup_dir, 'objects')
+        self.snapshots_dir = os.path.join(backup_dir, 'snapshots')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+        # 最近一次校验结果 (快照编号, quick_check结果)
+        self.last_verification = None
+        self.verify_thread = None
+        # 防止定时备份与手动备份同时进行
+        self._lock = threading.Lock()
+
         # 启动备份线程
-        self.backup_thread = threading.Thread(target=self._backup_loop, daemon=True)
-        self.backup_thread.start()
-    
+        self.backup_thread = None
+        if auto_start:
+            self.start()
+
+    def start(self):
+        """启动定时备份线程（只启动一次）"""
+        if self.backup_thread is None:
+            self.backup_thread = threading.Thread(target=self._backup_loop, daemon=True)
+            self.backup_thread.start()
+
+    def seconds_until_due(self):
+        """距离下一次定时备份的秒数；最近一次快照已超过备份间隔时为0"""
+        snapshots = self.list_snapshots()
+        if not snapshots:
+            return 0
+        try:
+            latest = self._snapshot_time(snapshots[-1])
+        except ValueError:
+            return 0
+        elapsed = (datetime.now() - latest).total_seconds()
+        return max(0, self.BACKUP_INTERVAL - elapsed)
+
     def _backup_loop(self):
-        """定期备份循环"""
+        """定期备份循环（启动时如果今天已经备份过，等到到期再备份）"""
         while True:
             try:
+                delay = self.seconds_until_due()
+                if delay > 0:
+                    time.sleep(delay)
+                    continue
                 self.create_backup()
-                # 每周备份一次
-                time.sleep(7 * 24 * 60 * 60)
+                # 增量备份代价很小，每天备份一次
+                time.sleep(self.BACKUP_INTERVAL)
             except Exception as e:
                 print(f"Backup error: {str(e)}")
                 time.sleep(60)  # 出错后等待1分钟再试
-    
-    def create_backup(self):
-        """创建数据库备份"""
-        # 生成备份文件名
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_path = os.path.join(self.backup_dir, f'invoices_backup_{timestamp}.db')
-        
-        # 确保数据库连接已关闭
-        conn = sqlite3.connect(self.db_path)
-        conn.close()
-        
-        # 复制数据库文件
-        shutil.copy2(self.db_path, backup_path)
-        
-        # 清理旧备份（只保留最近5个）
-        self._cleanup_old_backups()
-    
-    def _cleanup_old_backups(self):
-        """清理旧的备份文件"""
-        backups = sorted([
-            os.path.join(self.backup_dir, f) 
-            for f in os.listdir(self.backup_dir) 
-            if f.startswith('invoices_backup_')
-        ])
-        
-        # 保留最近5个备份
-        while len(backups) > 5:
+
+    # ---- 备份 ----
+
+    def create_backup(self, progress=None):
+        """创建一次增量备份，返回快照清单路径；progress(已复制页数, 总页数)"""
+        with self._lock:
+            snapshot_id = self._new_snapshot_id()
+            previous = self._latest_manifest()
+            temp_path = os.path.join(self.backup_dir, f'.snapshot_{snapshot_id}.tmp')
+
             try:
-                os.remove(backups.pop(0))
-            except OSError:
-                pass 
\ No newline at end of file
+                self._snapshot_database(temp_path, progress)
+                database = self._store_file(temp_path)
+                database['name'] = os.path.basename(self.db_path)
+            finally:
+                for path in (temp_path, temp_path + '-journal'):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+            manifest = {
+                'version': 1,
+                'id': snapshot_id,
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'database': database,
+                'pdf_dir': os.path.basename(os.path.normpath(self.pdf_dir)),
+                'files': self._store_pdfs(previous),
+            }
+            manifest_path = self._write_manifest(manifest)
+
+            # 按保留策略清理旧快照和不再被引用的数据块
+            self.apply_retention()
+
+        # 在后台校验备份
+        self.verify_thread = threading.Thread(target=self.verify_backup, args=(snapshot_id,), daemon=True)
+        self.verify_thread.start()
+
+        return manifest_path
+
+    def _snapshot_database(self, snapshot_path, progress=None):
+        """使用SQLite在线备份API把数据库复制为一致的单文件快照"""
+        def on_step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            # 步与步之间释放源库的读锁并稍作等待，避免长时间阻塞写入
+            time.sleep(self.STEP_SLEEP)
+
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(snapshot_path)
+        try:
+            # 按页分步复制；WAL模式下同样读取到一致的快照
+            source.backup(target, pages=self.PAGES_PER_STEP, progress=on_step)
+            # 快照使用回滚日志模式，保证单个文件即可完整恢复
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+            source.close()
+
+    def _store_pdfs(self, previous):
+        """备份PDF目录；大小和修改时间与上次相同的文件直接沿用上次的数据块"""
+        previous_files = previous['files'] if previous else {}
+        files = {}
+        if not os.path.isdir(self.pdf_dir):
+            return files
+
+        for dirpath, dirnames, filenames in os.walk(self.pdf_dir):
+            # 跳过隐藏的临时文件和目录（如正在写入的文件）
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                relpath = os.path.relpath(path, self.pdf_dir).replace(os.sep, '/')
+                stat = os.stat(path)
+                old = previous_files.get(relpath)
+                if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                    files[relpath] = old
+                    continue
+                entry = self._store_file(path)
+                entry['mtime_ns'] = stat.st_mtime_ns
+                files[relpath] = entry
+        return files
+
+    def _store_file(self, path):
+        """把文件切分为数据块存入对象库，返回 {'size', 'chunks'}"""
+        chunks = []
+        size = 0
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(self.CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                chunks.append(self._store_chunk(data))
+        return {'size': size, 'chunks': chunks}
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _store_chunk(self, data):
+        """按内容寻址存储一个数据块，已存在时跳过"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(temp_path, path)
+        return digest
+
+    def _read_chunk(self, digest):
+        """读取并校验一个数据块"""
+        with open(self._object_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"备份数据块已损坏：{digest}")
+        return data
+
+    # ---- 快照清单 ----
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.snapshots_dir, f"{manifest['id']}.json")
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        return path
+
+    def _new_snapshot_id(self):
+        """生成快照编号（精确到微秒，与已有快照重复时顺延），同一秒内的多次备份不会互相覆盖"""
+        now = datetime.now()
+        while True:
+            snapshot_id = now.strftime('%Y%m%d_%H%M%S_%f')
+            if not os.path.exists(os.path.join(self.snapshots_dir, f'{snapshot_id}.json')):
+                return snapshot_id
+            now += timedelta(microseconds=1)
+
+    @staticmethod
+    def _snapshot_time(snapshot_id):
+        """快照编号对应的时间（兼容旧版精确到秒的编号）"""
+        return datetime.strptime(snapshot_id[:len('YYYYmmdd_HHMMSS')], '%Y%m%d_%H%M%S')
+
+    def list_snapshots(self):
+        """按时间顺序返回所有快照编号"""
+        return sorted(f[:-len('.json')] for f in os.listdir(self.snapshots_dir) if f.endswith('.json'))
+
+    def load_manifest(self, snapshot_id):
+        """读取快照清单"""
+        with open(os.path.join(self.snapshots_dir, f'{snapshot_id}.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def _latest_manifest(self):
+        snapshots = self.list_snapshots()
+        return self.load_manifest(snapshots[-1]) if snapshots else None
+
+    # ---- 保留策略 ----
+
+    def apply_retention(self):
+        """按每日/每周/每月保留策略删除旧快照，并清理不再被引用的数据块"""
+        snapshots = self.list_snapshots()
+        keep = set(snapshots[-1:])  # 最新快照始终保留
+        buckets = {
+            'daily': lambda t: t.strftime('%Y%m%d'),
+            'weekly': lambda t: '%d-%02d' % t.isocalendar()[:2],
+            'monthly': lambda t: t.strftime('%Y%m'),
+        }
+        for period, bucket_of in buckets.items():
+            seen = []
+            # 从新到旧，每个时间段保留其中最新的一份
+            for snapshot_id in reversed(snapshots):
+                bucket = bucket_of(self._snapshot_time(snapshot_id))
+                if bucket in seen:
+                    continue
+                if len(seen) >= self.retention.get(period, 0):
+                    break
+                seen.append(bucket)
+                keep.add(snapshot_id)
+
+        for snapshot_id in snapshots:
+            if snapshot_id not in keep:
+                os.remove(os.path.join(self.snapshots_dir, f'{snapshot_id}.json'))
+
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        """删除没有被任何快照引用的数据块"""
+        referenced = set()
+        for snapshot_id in self.list_snapshots():
+            manifest = self.load_manifest(snapshot_id)
+            referenced.update(manifest['database']['chunks'])
+            for entry in manifest['files'].values():
+                referenced.update(entry['chunks'])
+
+        for dirpath, dirnames, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                if filename not in referenced:
+                    try:
+                        os.remove(os.path.join(dirpath, filename))
+                    except OSError as e:
+                        print(f"Backup cleanup error: {str(e)}")
+
+    # ---- 校验与恢复 ----
+
+    def _restore_file(self, entry, target_path):
+        """按数据块列表重建文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+        temp_path = target_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for digest in entry['chunks']:
+                f.write(self._read_chunk(digest))
+        os.replace(temp_path, target_path)
+
+    def verify_backup(self, snapshot_id):
+        """重建快照中的数据库并用 PRAGMA quick_check 校验，返回是否完好"""
+        fd, temp_path = tempfile.mkstemp(prefix=f'.verify_{snapshot_id}_', suffix='.tmp', dir=self.backup_dir)
+        os.close(fd)
+        try:
+            self._restore_file(self.load_manifest(snapshot_id)['database'], temp_path)
+            conn = sqlite3.connect(f'file:{temp_path}?mode=ro', uri=True)
+            try:
+                result = conn.execute('PRAGMA quick_check').fetchone()[0]
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError, ValueError, zlib.error) as e:
+            result = str(e)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.last_verification = (snapshot_id, result)
+        if result != 'ok':
+            print(f"Backup verification failed for {snapshot_id}: {result}")
+            return False
+        return True
+
+    def restore(self, snapshot_id, target_dir):
+        """把快照恢复到 target_dir（数据库文件与PDF目录），返回恢复的文件数"""
+        manifest = self.load_manifest(snapshot_id)
+        os.makedirs(target_dir, exist_ok=True)
+
+        database = manifest['database']
+        self._restore_file(database, os.path.join(target_dir, database['name']))
+
+        pdf_dir = os.path.join(target_dir, manifest['pdf_dir'])
+        for relpath, entry in manifest['files'].items():
+            self._restore_file(entry, os.path.join(pdf_dir, *relpath.split('/')))
+        return 1 + len(manifest['files'])
+
+
+def main(argv=None):
+    """备份命令行：列出快照、手动备份、校验与恢复"""
+    parser = argparse.ArgumentParser(prog='python -m utils.backup', description='发票数据库备份工具')
+    parser.add_argument('--db', default='invoices.db', help='数据库文件')
+    parser.add_argument('--backup-dir', default='./backups', help='备份目录')
+    parser.add_argument('--pdf-dir', default='./invoices_pdf', help='PDF目录')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='列出所有快照')
+    commands.add_parser('create', help='立即备份')
+    verify_parser = commands.add_parser('verify', help='校验快照')
+    verify_parser.add_argument('snapshot')
+    restore_parser = commands.add_parser('restore', help='恢复快照到指定目录')
+    restore_parser.add_argument('snapshot')
+    restore_parser.add_argument('target_dir')
+    args = parser.parse_args(argv)
+
+    manager = BackupManager(args.db, args.backup_dir, args.pdf_dir, auto_start=False)
+    if args.command == 'list':
+        for snapshot_id in manager.list_snapshots():
+            manifest = manager.load_manifest(snapshot_id)
+            print(f"{snapshot_id}  {manifest['created_at']}  PDF: {len(manifest['files'])}")
+    elif args.command == 'create':
+        print(manager.create_backup())
+        # 校验在后台线程中进行，命令行进程退出前等待其完成
+        manager.verify_thread.join()
+        snapshot_id, result = manager.last_verification
+        print(result)
+        return 0 if result == 'ok' else 1
+    elif args.command == 'verify':
+        ok = manager.verify_backup(args.snapshot)
+        print(manager.last_verification[1])
+        return 0 if ok else 1
+    elif args.command == 'restore':
+        count = manager.restore(args.snapshot, args.target_dir)
+        print(f"已恢复 {count} 个文件到 {args.target_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
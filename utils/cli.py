@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from utils.database import InvoiceRepository, InvoiceFilter, DEFAULT_DB_PATH, SORT_COLUMNS, LIST_COLUMNS
+
+# --status 的取值
+STATUS_CHOICES = {'reimbursed': True, 'unreimbursed': False}
+
+
+def parse_sort_keys(values):
+    """把 ['amount:desc', 'id'] 解析为排序键列表"""
+    sort_keys = []
+    for value in values or ():
+        column, _, direction = value.partition(':')
+        if column not in SORT_COLUMNS:
+            raise argparse.ArgumentTypeError(f"不能按 {column} 排序，可选：{', '.join(SORT_COLUMNS)}")
+        if direction not in ('', 'asc', 'desc'):
+            raise argparse.ArgumentTypeError(f"排序方向只能是 asc 或 desc：{value}")
+        sort_keys.append((column, direction == 'desc'))
+    return sort_keys or None
+
+
+def parse_month(value):
+    """YYYY-MM，或 current 表示本月"""
+    if value == 'current':
+        return datetime.now().strftime('%Y-%m')
+    try:
+        return datetime.strptime(value, '%Y-%m').strftime('%Y-%m')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"月份格式应为 YYYY-MM：{value}")
+
+
+def parse_date(value):
+    """YYYY-MM-DD"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式应为 YYYY-MM-DD：{value}")
+
+
+def add_filter_arguments(parser):
+    """筛选参数（与界面上的筛选栏相同）"""
+    parser.add_argument('--from', dest='date_from', type=parse_date, help='创建日期不早于 YYYY-MM-DD')
+    parser.add_argument('--to', dest='date_to', type=parse_date, help='创建日期不晚于 YYYY-MM-DD')
+    parser.add_argument('--min', dest='amount_min', type=float, help='最小金额')
+    parser.add_argument('--max', dest='amount_max', type=float, help='最大金额')
+    parser.add_argument('--status', choices=tuple(STATUS_CHOICES), help='报销状态')
+    parser.add_argument('--type', dest='expense_type', choices=('垫付', '自费'), help='费用类型')
+
+
+def filter_from_args(args):
+    return InvoiceFilter(args.date_from, args.date_to, args.amount_min, args.amount_max,
+                         STATUS_CHOICES.get(args.status), args.expense_type)
+
+
+def command_query(repo, args):
+    """逐行输出符合条件的发票（制表符分隔）"""
+    count = 0
+    for invoice in repo.iter_invoices(args.search, parse_sort_keys(args.sort), filters=filter_from_args(args)):
+        if args.limit is not None and count >= args.limit:
+            break
+        values = []
+        for column in LIST_COLUMNS:
+            value = invoice[column]
+            if column == 'reimbursed':
+                value = '已报销' if value else '未报销'
+            elif column == 'amount':
+                value = f'{value:.2f}'
+            values.append('' if value is None else str(value))
+        print('\t'.join(values))
+        count += 1
+    return 0
+
+
+def command_stats(repo, args):
+    """输出统计：无参数时为整体汇总，--month 时按费用类型和报销状态分组"""
+    filters = filter_from_args(args)
+    if args.search or not filters.is_empty():
+        count, total = repo.get_statistics(args.search, filters=filters)
+        result = {'count': count, 'total': round(total, 2)}
+    elif args.month:
+        result = {
+            'month': args.month,
+            'groups': [
+                {'expense_type': expense_type, 'reimbursed': reimbursed, 'count': count, 'total': round(total, 2)}
+                for expense_type, reimbursed, count, total in repo.get_breakdown(args.month)
+            ],
+        }
+    else:
+        result = {key: round(value, 2) if isinstance(value, float) else value
+                  for key, value in repo.get_summary().items()}
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    elif 'groups' in result:
+        for group in result['groups']:
+            status = '已报销' if group['reimbursed'] else '未报销'
+            print(f"{group['expense_type']}\t{status}\t{group['count']}\t{group['total']:.2f}")
+    else:
+        for key, value in result.items():
+            print(f"{key}\t{value}")
+    return 0
+
+
+def command_export(repo, args):
+    """流式导出到文件或标准输出"""
+    from utils.exporter import export_invoices, export_to_file
+
+    invoices = repo.iter_invoices(args.search, parse_sort_keys(args.sort), filters=filter_from_args(args))
+    if args.output in (None, '-'):
+        if args.format == 'xlsx':
+            raise argparse.ArgumentTypeError("XLSX 只能导出到文件，请使用 -o")
+        count = export_invoices(invoices, sys.stdout, args.format or 'csv')
+    else:
+        count = export_to_file(invoices, args.output, args.format)
+    print(f"已导出 {count} 条", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m utils.cli', description='发票管理命令行（无需图形界面）')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='数据库文件')
+    parser.add_argument('--trace', help='结束时把各语句的耗时和慢查询计划写入该JSON文件')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = commands.add_parser('query', help='查询发票')
+    query_parser.add_argument('search', nargs='?', default='', help='搜索关键词')
+    query_parser.add_argument('--sort', action='append', help='排序列，如 amount:desc（可重复）')
+    query_parser.add_argument('--limit', type=int, default=None, help='最多输出的行数')
+    add_filter_arguments(query_parser)
+
+    stats_parser = commands.add_parser('stats', help='统计')
+    stats_parser.add_argument('search', nargs='?', default='', help='搜索关键词')
+    stats_parser.add_argument('--month', type=parse_month, help='按月分组统计：YYYY-MM 或 current')
+    stats_parser.add_argument('--json', action='store_true', help='输出JSON')
+    add_filter_arguments(stats_parser)
+
+    export_parser = commands.add_parser('export', help='导出发票')
+    export_parser.add_argument('search', nargs='?', default='', help='搜索关键词')
+    export_parser.add_argument('--sort', action='append', help='排序列，如 amount:desc（可重复）')
+    export_parser.add_argument('--format', choices=('csv', 'xlsx', 'jsonl'),
+                               help='导出格式（默认按输出文件扩展名，标准输出为 csv）')
+    export_parser.add_argument('-o', '--output', help='输出文件（默认标准输出）')
+    add_filter_arguments(export_parser)
+
+    backup_parser = commands.add_parser('backup', help='备份工具（参数同 python -m utils.backup）')
+    backup_parser.add_argument('backup_args', nargs=argparse.REMAINDER)
+    return parser
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'backup':
+        from utils import backup
+        return backup.main(['--db', args.db] + args.backup_args)
+
+    if not os.path.exists(args.db):
+        parser.error(f"数据库文件不存在：{args.db}")
+
+    repo = InvoiceRepository(args.db)
+    try:
+        handler = {'query': command_query, 'stats': command_stats, 'export': command_export}[args.command]
+        return handler(repo, args)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # 输出被管道另一端提前关闭（如 | head），不再写入
+        sys.stdout = open(os.devnull, 'w')
+        return 0
+    finally:
+        repo.close()
+        if args.trace:
+            from utils.tracing import tracer
+            tracer.dump(args.trace)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,1031 @@
+import calendar
+import functools
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from utils.tracing import tracer
+
+# 默认数据库文件
+DEFAULT_DB_PATH = 'invoices.db'
+
+# 详情字段（与 SQL_SELECT_DETAIL 的列顺序一致）
+DETAIL_COLUMNS = ('id', 'content', 'platform', 'expense_type', 'amount', 'note', 'pdf_path', 'reimbursed',
+                  'created_at', 'version')
+
+# 每个连接的初始化参数
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',      # WAL模式下足够安全，且减少fsync
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',       # 约16MB页缓存
+    'PRAGMA mmap_size = 268435456',     # 256MB内存映射读取
+    'PRAGMA foreign_keys = ON',
+)
+
+# 语句缓存大小（sqlite3按SQL文本复用已编译的语句）
+STATEMENT_CACHE_SIZE = 256
+
+# 数据库被其他程序锁定时最多等待的秒数（多人共用一个数据库文件时写入会互相等待）
+BUSY_TIMEOUT_SECONDS = 15
+
+# 新建数据库时的日志模式：默认WAL；数据库放在网络共享上时应设为 DELETE（见 README）
+# 日志模式保存在数据库文件中，已有数据库只能用 python -m utils.migrations --journal-mode 切换
+DEFAULT_JOURNAL_MODE = 'WAL'
+JOURNAL_MODE_ENV_VAR = 'INVOICE_JOURNAL_MODE'
+JOURNAL_MODES = ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST')
+
+SQL_CREATE_INVOICES = '''
+    CREATE TABLE IF NOT EXISTS invoices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content TEXT NOT NULL,
+        platform TEXT,
+        expense_type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        note TEXT,
+        pdf_path TEXT,
+        reimbursed BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+SQL_SELECT_DETAIL = '''
+    SELECT id, content, platform, expense_type, amount, note, pdf_path, reimbursed, created_at, version
+    FROM invoices
+    WHERE id = ?
+'''
+
+# 按编号批量读取详情（{placeholders} 为参数占位符）
+SQL_SELECT_DETAILS_BY_IDS = '''
+    SELECT id, content, platform, expense_type, amount, note, pdf_path, reimbursed, created_at, version
+    FROM invoices
+    WHERE id IN ({placeholders})
+'''
+
+SQL_SELECT_LIST = '''
+    SELECT id, content, platform, expense_type, amount, reimbursed, created_at
+    FROM invoices
+'''
+
+# 导出/命令行查询：完整字段（列顺序与 DETAIL_COLUMNS 一致）
+SQL_SELECT_ALL_DETAILS = '''
+    SELECT id, content, platform, expense_type, amount, note, pdf_path, reimbursed, created_at, version
+    FROM invoices
+'''
+
+# 列表查询返回的列（与 SQL_SELECT_LIST 的列顺序一致）
+LIST_COLUMNS = ('id', 'content', 'platform', 'expense_type', 'amount', 'reimbursed', 'created_at')
+
+# 可排序列：列名 -> (SQL排序表达式, 把原始值转换为该表达式取值的函数)
+# 排序表达式必须与 SQL_CREATE_SORT_INDEXES 中的索引表达式完全一致才能走索引
+SORT_COLUMNS = {
+    'id': ('id', None),
+    'content': ('content COLLATE NOCASE', None),
+    'platform': ("IFNULL(platform, '') COLLATE NOCASE", lambda value: value or ''),
+    'expense_type': ('expense_type', None),
+    'amount': ('amount', None),
+    'reimbursed': ('reimbursed', None),
+    'created_at': ("IFNULL(created_at, '')", lambda value: value or ''),
+}
+
+# COLLATE NOCASE 只把 ASCII 大写字母转换为小写，其他字符按原值比较
+NOCASE_FOLD = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+# 默认排序：编号倒序（最新的在前）
+DEFAULT_SORT_KEYS = (('id', True),)
+
+SQL_CREATE_SORT_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_invoices_content ON invoices(content COLLATE NOCASE, id)',
+    "CREATE INDEX IF NOT EXISTS idx_invoices_platform ON invoices(IFNULL(platform, '') COLLATE NOCASE, id)",
+    'CREATE INDEX IF NOT EXISTS idx_invoices_expense_type ON invoices(expense_type, id)',
+    'CREATE INDEX IF NOT EXISTS idx_invoices_amount ON invoices(amount, id)',
+    'CREATE INDEX IF NOT EXISTS idx_invoices_reimbursed ON invoices(reimbursed, id)',
+    "CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices(IFNULL(created_at, ''), id)",
+)
+
+# 按PDF路径查找引用（去重存储中多张发票可能共用同一个文件）
+SQL_CREATE_PDF_PATH_INDEX = 'CREATE INDEX IF NOT EXISTS idx_invoices_pdf_path ON invoices(pdf_path)'
+
+# 金额以整数分保存（amount_cents），求和没有浮点误差；创建时间另存为整数秒（created_ts）便于范围查询
+# created_ts 由 created_at 文本按UTC换算，只用于比较大小，不代表真实时区
+# 金额上限（元）：整数分超出 64 位范围时 SUM(amount_cents) 会报 integer overflow，
+# 换算时限制在 ±MAX_AMOUNT 内（无穷大也按上限换算）
+MAX_AMOUNT = 100_000_000
+SQL_AMOUNT_CENTS = f'CAST(round(MIN(MAX({{amount}}, -{MAX_AMOUNT}), {MAX_AMOUNT}) * 100) AS INTEGER)'
+# 无穷大或超出上限的金额
+SQL_INVALID_AMOUNT_CONDITION = f'NOT (abs(amount) <= {MAX_AMOUNT})'
+SQL_CREATED_TS = "CAST(strftime('%s', {created_at}) AS INTEGER)"
+
+# 范围查询用索引
+SQL_CREATE_RANGE_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_invoices_created_ts ON invoices(created_ts, id)',
+    'CREATE INDEX IF NOT EXISTS idx_invoices_amount_cents ON invoices(amount_cents, id)',
+)
+
+# 筛选栏：按报销状态加日期范围（如"上季度还有哪些未报销"）
+SQL_CREATE_FILTER_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_invoices_reimbursed_created_ts ON invoices(reimbursed, created_ts)',
+)
+
+SQL_SELECT_STATISTICS = 'SELECT COUNT(*), SUM(amount_cents) FROM invoices'
+
+# 由触发器维护的统计汇总表：按费用类型、报销状态和月份分组的数量与金额
+SQL_CREATE_STATS = '''
+    CREATE TABLE IF NOT EXISTS invoice_stats (
+        expense_type TEXT NOT NULL,
+        reimbursed INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL,
+        PRIMARY KEY (expense_type, reimbursed, month)
+    ) WITHOUT ROWID
+'''
+
+# 汇总表的分组键（{row} 为 new 或 old）
+STATS_KEY = "{row}.expense_type, CASE WHEN {row}.reimbursed THEN 1 ELSE 0 END, IFNULL(substr({row}.created_at, 1, 7), '')"
+
+SQL_STATS_ADD = '''
+    INSERT INTO invoice_stats (expense_type, reimbursed, month, count, total_cents)
+    VALUES ({key}, 1, new.amount_cents)
+    ON CONFLICT (expense_type, reimbursed, month)
+    DO UPDATE SET count = count + 1, total_cents = total_cents + excluded.total_cents;
+'''.format(key=STATS_KEY.format(row='new'))
+
+SQL_STATS_REMOVE = '''
+    UPDATE invoice_stats SET count = count - 1, total_cents = total_cents - old.amount_cents
+    WHERE (expense_type, reimbursed, month) = ({key});
+    DELETE FROM invoice_stats WHERE (expense_type, reimbursed, month) = ({key}) AND count <= 0;
+'''.format(key=STATS_KEY.format(row='old'))
+
+SQL_CREATE_STATS_TRIGGERS = (
+    f'''
+    CREATE TRIGGER IF NOT EXISTS invoice_stats_ai AFTER INSERT ON invoices BEGIN
+        {SQL_STATS_ADD}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS invoice_stats_ad AFTER DELETE ON invoices BEGIN
+        {SQL_STATS_REMOVE}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS invoice_stats_au AFTER UPDATE OF expense_type, reimbursed, amount_cents, created_at
+    ON invoices BEGIN
+        {SQL_STATS_REMOVE}
+        {SQL_STATS_ADD}
+    END
+    ''',
+)
+
+SQL_BACKFILL_STATS = '''
+    INSERT INTO invoice_stats (expense_type, reimbursed, month, count, total_cents)
+    SELECT expense_type, CASE WHEN reimbursed THEN 1 ELSE 0 END, IFNULL(substr(created_at, 1, 7), ''),
+           COUNT(*), SUM(amount_cents)
+    FROM invoices
+    GROUP BY 1, 2, 3
+'''
+
+# 状态栏汇总：全部、未报销垫付、本月（汇总表只有 类型×状态×月份 行，读取代价可忽略）
+SQL_SELECT_SUMMARY = '''
+    SELECT SUM(count), SUM(total_cents),
+           SUM(CASE WHEN expense_type = '垫付' AND reimbursed = 0 THEN total_cents ELSE 0 END),
+           SUM(CASE WHEN month = ? THEN count ELSE 0 END),
+           SUM(CASE WHEN month = ? THEN total_cents ELSE 0 END)
+    FROM invoice_stats
+'''
+
+# 按费用类型和报销状态分组的汇总（可限定月份）
+SQL_SELECT_BREAKDOWN = '''
+    SELECT expense_type, reimbursed, SUM(count), SUM(total_cents)
+    FROM invoice_stats
+    WHERE ? IS NULL OR month = ?
+    GROUP BY expense_type, reimbursed
+    ORDER BY expense_type, reimbursed
+'''
+
+# trigram分词器按3个字符建立索引，更短的搜索词只能回退到LIKE扫描
+FTS_MIN_TERM_LENGTH = 3
+
+SQL_CREATE_FTS = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS invoices_fts USING fts5(
+        content, platform, expense_type, note,
+        content='invoices', content_rowid='id',
+        tokenize='trigram'
+    )
+'''
+
+# 外部内容FTS表需要由触发器与 invoices 保持同步
+SQL_CREATE_FTS_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS invoices_fts_ai AFTER INSERT ON invoices BEGIN
+        INSERT INTO invoices_fts(rowid, content, platform, expense_type, note)
+        VALUES (new.id, new.content, new.platform, new.expense_type, new.note);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS invoices_fts_ad AFTER DELETE ON invoices BEGIN
+        INSERT INTO invoices_fts(invoices_fts, rowid, content, platform, expense_type, note)
+        VALUES ('delete', old.id, old.content, old.platform, old.expense_type, old.note);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS invoices_fts_au AFTER UPDATE OF content, platform, expense_type, note ON invoices BEGIN
+        INSERT INTO invoices_fts(invoices_fts, rowid, content, platform, expense_type, note)
+        VALUES ('delete', old.id, old.content, old.platform, old.expense_type, old.note);
+        INSERT INTO invoices_fts(rowid, content, platform, expense_type, note)
+        VALUES (new.id, new.content, new.platform, new.expense_type, new.note);
+    END
+    ''',
+)
+
+SQL_SEARCH_FTS_CONDITION = 'id IN (SELECT rowid FROM invoices_fts WHERE invoices_fts MATCH ?)'
+
+# PDF文本层：pdf_files 记录路径对应的文件哈希，pdf_text 按哈希缓存提取出的文本（每个PDF只解析一次）
+SQL_CREATE_PDF_TEXT = (
+    '''
+    CREATE TABLE IF NOT EXISTS pdf_files (
+        pdf_path TEXT PRIMARY KEY,
+        sha256 TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS pdf_text (
+        id INTEGER PRIMARY KEY,
+        sha256 TEXT NOT NULL UNIQUE,
+        text TEXT NOT NULL,
+        error TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_pdf_files_sha256 ON pdf_files(sha256)',
+)
+
+SQL_CREATE_PDF_TEXT_FTS = (
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS pdf_text_fts USING fts5(
+        text, content='pdf_text', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_text_fts_ai AFTER INSERT ON pdf_text BEGIN
+        INSERT INTO pdf_text_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_text_fts_ad AFTER DELETE ON pdf_text BEGIN
+        INSERT INTO pdf_text_fts(pdf_text_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS pdf_text_fts_au AFTER UPDATE OF text ON pdf_text BEGIN
+        INSERT INTO pdf_text_fts(pdf_text_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO pdf_text_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    ''',
+)
+
+# 搜索发票字段或附件PDF中的文字
+SQL_SEARCH_FTS_WITH_PDF_CONDITION = '''(
+    id IN (SELECT rowid FROM invoices_fts WHERE invoices_fts MATCH ?)
+    OR pdf_path IN (
+        SELECT f.pdf_path FROM pdf_files f JOIN pdf_text t ON t.sha256 = f.sha256
+        WHERE t.id IN (SELECT rowid FROM pdf_text_fts WHERE pdf_text_fts MATCH ?)
+    )
+)'''
+
+# 尚未提取文本的PDF路径
+SQL_SELECT_PENDING_PDFS = '''
+    SELECT DISTINCT i.pdf_path FROM invoices i
+    WHERE i.pdf_path IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM pdf_files f JOIN pdf_text t ON t.sha256 = f.sha256 WHERE f.pdf_path = i.pdf_path
+    )
+'''
+
+SQL_SEARCH_LIKE_CONDITION = '''(
+    content LIKE ? ESCAPE '\\'
+    OR platform LIKE ? ESCAPE '\\'
+    OR expense_type LIKE ? ESCAPE '\\'
+    OR note LIKE ? ESCAPE '\\'
+)'''
+
+# 参数顺序不变，整数分和整数秒由同一参数计算
+SQL_INSERT = f'''
+    INSERT INTO invoices
+    (content, platform, expense_type, amount, note, pdf_path, reimbursed, created_at, amount_cents, created_ts)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, {SQL_AMOUNT_CENTS.format(amount='?4')}, {SQL_CREATED_TS.format(created_at='?8')})
+'''
+
+# 导入暂存表：在连接私有的临时库中，写入时不占用数据库写锁
+SQL_CREATE_IMPORT_STAGING = '''
+    CREATE TEMP TABLE IF NOT EXISTS import_staging (
+        content TEXT, platform TEXT, expense_type TEXT, amount REAL, note TEXT, pdf_path TEXT,
+        reimbursed BOOLEAN, created_at TIMESTAMP
+    )
+'''
+
+SQL_STAGE_IMPORT_ROW = 'INSERT INTO temp.import_staging VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+
+SQL_INSERT_STAGED = f'''
+    INSERT INTO invoices
+    (content, platform, expense_type, amount, note, pdf_path, reimbursed, created_at, amount_cents, created_ts)
+    SELECT content, platform, expense_type, amount, note, pdf_path, reimbursed, created_at,
+           {SQL_AMOUNT_CENTS.format(amount='amount')}, {SQL_CREATED_TS.format(created_at='created_at')}
+    FROM temp.import_staging
+    ORDER BY rowid
+'''
+
+SQL_UPDATE = f'''
+    UPDATE invoices
+    SET content = ?1,
+        platform = ?2,
+        expense_type = ?3,
+        amount = ?4,
+        amount_cents = {SQL_AMOUNT_CENTS.format(amount='?4')},
+        note = ?5,
+        pdf_path = ?6,
+        reimbursed = ?7,
+        version = version + 1
+    WHERE id = ?8 AND (?9 IS NULL OR version = ?9)
+'''
+
+
+def open_connection(db_path):
+    """打开一个已按统一参数配置好的数据库连接"""
+    # 隐式事务使用 BEGIN IMMEDIATE：写事务开始时就取得写锁，锁被占用时按忙超时等待；
+    # 默认的 DEFERRED 事务在读后升级为写锁时，如果其他程序已经写入会直接返回 SQLITE_BUSY
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level='IMMEDIATE',
+                           check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def set_journal_mode(conn, mode):
+    """设置日志模式，返回实际生效的模式；其他程序正在使用数据库而无法切换时保留原模式"""
+    mode = mode.upper()
+    if mode not in JOURNAL_MODES:
+        raise ValueError(f"不支持的日志模式：{mode}（可选 {', '.join(JOURNAL_MODES)}）")
+    try:
+        return conn.execute(f'PRAGMA journal_mode = {mode}').fetchone()[0].upper()
+    except sqlite3.OperationalError as e:
+        print(f"Cannot switch journal mode to {mode}: {str(e)}")
+        return conn.execute('PRAGMA journal_mode').fetchone()[0].upper()
+
+
+def cents_to_amount(cents):
+    """整数分转换为金额（元）"""
+    return cents / 100
+
+
+def fts_phrase(term):
+    """把搜索词转换为FTS5短语查询（按原样匹配子串）"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def like_pattern(term):
+    """把搜索词转换为转义后的LIKE模式"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def normalize_sort_keys(sort_keys):
+    """规范化排序键 [(列名, 是否降序), ...]，并以编号作为最终排序键保证顺序唯一"""
+    keys = [(column, bool(descending)) for column, descending in (sort_keys or DEFAULT_SORT_KEYS)
+            if column in SORT_COLUMNS]
+    if not keys:
+        keys = list(DEFAULT_SORT_KEYS)
+    if not any(column == 'id' for column, _ in keys):
+        keys.append(('id', keys[-1][1]))
+    # 编号唯一，其后的排序键没有意义
+    id_index = [column for column, _ in keys].index('id')
+    return keys[:id_index + 1]
+
+
+def order_by_clause(sort_keys):
+    """生成 ORDER BY 子句"""
+    terms = [SORT_COLUMNS[column][0] + (' DESC' if descending else '') for column, descending in sort_keys]
+    return ' ORDER BY ' + ', '.join(terms)
+
+
+def keyset_condition(sort_keys, last_row):
+    """生成键集分页条件：排在 last_row（原始列表行）之后的所有行"""
+    values = []
+    for column, _ in sort_keys:
+        value = last_row[LIST_COLUMNS.index(column)]
+        convert = SORT_COLUMNS[column][1]
+        values.append(convert(value) if convert else value)
+    expressions = [SORT_COLUMNS[column][0] for column, _ in sort_keys]
+    directions = {descending for _, descending in sort_keys}
+
+    if len(directions) == 1:
+        # 方向一致时使用行值比较，SQLite可以直接在索引上定位
+        op = '<' if directions.pop() else '>'
+        placeholders = ', '.join('?' * len(values))
+        return f"({', '.join(expressions)}) {op} ({placeholders})", values
+
+    # 方向混合时展开为 (k1 > v1) OR (k1 = v1 AND k2 < v2) OR ...
+    terms = []
+    params = []
+    for i, (column, descending) in enumerate(sort_keys):
+        parts = [f"{expr} = ?" for expr in expressions[:i]]
+        parts.append(f"{expressions[i]} {'<' if descending else '>'} ?")
+        terms.append('(' + ' AND '.join(parts) + ')')
+        params.extend(values[:i + 1])
+    return '(' + ' OR '.join(terms) + ')', params
+
+
+def sort_value(column, value):
+    """按 SORT_COLUMNS 的排序表达式把原始值转换为可比较的Python值
+
+    Python 按码位比较字符串，与 SQLite 按 UTF-8 字节比较的顺序一致
+    """
+    expression, convert = SORT_COLUMNS[column]
+    if convert:
+        value = convert(value)
+    if 'NOCASE' in expression:
+        value = value.translate(NOCASE_FOLD)
+    return value
+
+
+def sort_key_function(sort_keys):
+    """返回与 ORDER BY 顺序一致的排序键函数（作用于原始列表行）"""
+    sort_keys = normalize_sort_keys(sort_keys)
+    indexes = [(column, LIST_COLUMNS.index(column), descending) for column, descending in sort_keys]
+
+    def compare(a, b):
+        for column, index, descending in indexes:
+            value_a = sort_value(column, a[index])
+            value_b = sort_value(column, b[index])
+            if value_a != value_b:
+                result = -1 if value_a < value_b else 1
+                return -result if descending else result
+        return 0
+
+    return functools.cmp_to_key(compare)
+
+
+def invoice_matches_search(invoice, search_term):
+    """判断发票是否匹配搜索词（与数据库中的子串搜索语义一致）"""
+    if not search_term:
+        return True
+    search_term = search_term.lower()
+    return any(search_term in (invoice[field] or '').lower()
+               for field in ('content', 'platform', 'expense_type', 'note'))
+
+
+def date_to_timestamp(date):
+    """日期零点对应的整数秒（与 SQL_CREATED_TS 一样按UTC换算）"""
+    return calendar.timegm(date.timetuple())
+
+
+def amount_to_cents(amount):
+    """金额转换为整数分（与 SQL_AMOUNT_CENTS 一样限制在 ±MAX_AMOUNT 内）"""
+    return int(round(min(max(amount, -MAX_AMOUNT), MAX_AMOUNT) * 100))
+
+
+class InvoiceFilter:
+    """筛选条件：创建日期范围（含两端）、金额范围、报销状态、费用类型；None 表示不限"""
+
+    def __init__(self, date_from=None, date_to=None, amount_min=None, amount_max=None,
+                 reimbursed=None, expense_type=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.amount_min = amount_min
+        self.amount_max = amount_max
+        self.reimbursed = reimbursed
+        self.expense_type = expense_type
+
+    def is_empty(self):
+        return all(value is None for value in (self.date_from, self.date_to, self.amount_min,
+                                               self.amount_max, self.reimbursed, self.expense_type))
+
+    def conditions(self):
+        """返回 (条件列表, 参数列表)；只使用 created_ts、amount_cents 等有索引的整数列"""
+        conditions = []
+        params = []
+        if self.reimbursed is not None:
+            conditions.append('reimbursed = ?')
+            params.append(1 if self.reimbursed else 0)
+        if self.expense_type is not None:
+            conditions.append('expense_type = ?')
+            params.append(self.expense_type)
+        if self.date_from is not None:
+            conditions.append('created_ts >= ?')
+            params.append(date_to_timestamp(self.date_from))
+        if self.date_to is not None:
+            conditions.append('created_ts < ?')
+            params.append(date_to_timestamp(self.date_to + timedelta(days=1)))
+        if self.amount_min is not None:
+            conditions.append('amount_cents >= ?')
+            params.append(amount_to_cents(self.amount_min))
+        if self.amount_max is not None:
+            conditions.append('amount_cents <= ?')
+            params.append(amount_to_cents(self.amount_max))
+        return conditions, params
+
+    def matches(self, invoice):
+        """判断发票是否符合筛选条件（与 conditions 的语义一致，用于增量更新列表）"""
+        if self.reimbursed is not None and bool(invoice['reimbursed']) != self.reimbursed:
+            return False
+        if self.expense_type is not None and invoice['expense_type'] != self.expense_type:
+            return False
+        if self.date_from is not None or self.date_to is not None:
+            day = (invoice['created_at'] or '')[:10]
+            if not day:
+                return False
+            if self.date_from is not None and day < self.date_from.isoformat():
+                return False
+            if self.date_to is not None and day > self.date_to.isoformat():
+                return False
+        cents = amount_to_cents(invoice['amount'])
+        if self.amount_min is not None and cents < amount_to_cents(self.amount_min):
+            return False
+        if self.amount_max is not None and cents > amount_to_cents(self.amount_max):
+            return False
+        return True
+
+
+def invoice_to_list_row(invoice):
+    """把发票字典转换为列表行"""
+    return tuple(invoice[column] for column in LIST_COLUMNS)
+
+
+def row_to_invoice(row):
+    """将详情查询结果转换为字典"""
+    if row is None:
+        return None
+    invoice = dict(zip(DETAIL_COLUMNS, row))
+    invoice['reimbursed'] = bool(invoice['reimbursed'])
+    return invoice
+
+
+class ConnectionPool:
+    """供工作线程使用的小型连接池"""
+
+    def __init__(self, db_path, size=2):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取出一个空闲连接，必要时新建；达到上限时等待归还"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return open_connection(self.db_path)
+        return self._idle.get()
+
+    def release(self, conn):
+        """归还连接"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """以上下文管理器的方式借用连接"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+class InvoiceConflictError(Exception):
+    """发票在读取后已被其他用户修改或删除（乐观并发检查失败）；current 为最新记录，已删除时为 None"""
+
+    def __init__(self, invoice_id, current):
+        super().__init__(f"发票 {invoice_id} 已被其他用户{'修改' if current else '删除'}")
+        self.invoice_id = invoice_id
+        self.current = current
+
+
+class InvoiceChange:
+    """发票变更事件：新增时 old 为 None，删除时 new 为 None"""
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+
+    @property
+    def invoice_id(self):
+        return (self.new or self.old)['id']
+
+
+class InvoiceRepository:
+    """发票数据访问层：持有长连接并集中管理所有SQL"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, pool_size=2, migration_progress=None, journal_mode=None):
+        self.db_path = db_path
+
+        # 界面线程使用的长连接
+        self.conn = open_connection(db_path)
+        # 日志模式保存在数据库文件中、所有客户端共用：只在新建数据库或明确指定时设置，
+        # 不随各个客户端的环境变量来回切换（其他客户端打开着数据库时也无法切换）
+        if journal_mode is None and not self._table_exists('invoices'):
+            journal_mode = os.environ.get(JOURNAL_MODE_ENV_VAR) or DEFAULT_JOURNAL_MODE
+        if journal_mode is not None:
+            self.journal_mode = set_journal_mode(self.conn, journal_mode)
+        else:
+            self.journal_mode = self.conn.execute('PRAGMA journal_mode').fetchone()[0].upper()
+        # 上次检查时的 PRAGMA data_version（见 has_external_changes）
+        self._data_version = self.data_version()
+
+        # 工作线程使用的连接池
+        self.pool = ConnectionPool(db_path, pool_size)
+
+        # 全文索引是否可用（部分SQLite构建未启用FTS5）
+        self.fts_enabled = False
+
+        # 写入后接收 InvoiceChange 事件列表的回调
+        self.listeners = []
+
+        self.init_schema(migration_progress)
+
+    def _execute(self, sql, params=(), conn=None):
+        """执行单条语句（所有SQL都经过这里，耗时与行数记录到追踪器）"""
+        return tracer.execute(conn or self.conn, sql, params, self.db_path)
+
+    def _execute_many(self, sql, seq_of_params, conn=None):
+        """批量执行同一条语句"""
+        return tracer.executemany(conn or self.conn, sql, seq_of_params)
+
+    def init_schema(self, progress=None):
+        """按 PRAGMA user_version 执行尚未执行的结构迁移（见 utils/migrations.py）"""
+        from utils.migrations import migrate
+
+        migrate(self.conn, progress)
+        # 当前SQLite构建不支持FTS5时迁移不会创建全文索引
+        self.fts_enabled = self._table_exists('invoices_fts')
+
+    def data_version(self):
+        """PRAGMA data_version：其他连接（包括其他程序）提交写入后变化，本连接自己的写入不会改变它"""
+        # 定时轮询的语句不经过追踪器，避免淹没诊断数据
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def has_external_changes(self):
+        """自上次检查以来是否有其他连接写入过数据库（不读取任何数据页，开销很小）
+
+        本程序工作线程的写入（PDF文字索引、导入）也会被计入，它们完成后本来就会刷新
+        """
+        version = self.data_version()
+        if version == self._data_version:
+            return False
+        self._data_version = version
+        return True
+
+    def _table_exists(self, name):
+        row = self._execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def subscribe(self, listener):
+        """注册变更监听器 listener(changes)，changes 为一次写入产生的 InvoiceChange 列表"""
+        self.listeners.append(listener)
+
+    def _emit(self, old, new):
+        """通知所有监听器"""
+        self._emit_many([InvoiceChange(old, new)])
+
+    def _emit_many(self, changes):
+        """批量操作只通知一次"""
+        if not changes:
+            return
+        for listener in self.listeners:
+            listener(changes)
+
+    @contextmanager
+    def dedicated_connection(self):
+        """为长时间运行的任务（导出、导入）单独打开一个连接，不占用界面查询使用的连接池
+
+        该连接为自动提交模式，需要事务时由调用方显式 BEGIN/COMMIT
+        """
+        conn = open_connection(self.db_path)
+        conn.isolation_level = None
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        """关闭所有连接"""
+        self.pool.close_all()
+        self.conn.close()
+
+    # ---- 查询 ----
+
+    def get_invoice(self, invoice_id, conn=None):
+        """获取单张发票的完整信息"""
+        row = self._execute(SQL_SELECT_DETAIL, (invoice_id,), conn).fetchone()
+        return row_to_invoice(row)
+
+    def get_invoices(self, invoice_ids, conn=None):
+        """批量获取发票，返回 {编号: 发票}（不存在的编号不在结果中）"""
+        invoices = {}
+        invoice_ids = list(invoice_ids)
+        # 分批查询，避免超过SQL参数数量上限
+        for start in range(0, len(invoice_ids), 500):
+            batch = invoice_ids[start:start + 500]
+            sql = SQL_SELECT_DETAILS_BY_IDS.format(placeholders=', '.join('?' * len(batch)))
+            for row in self._execute(sql, batch, conn):
+                invoices[row[0]] = row_to_invoice(row)
+        return invoices
+
+    def invoice_exists(self, invoice_id):
+        """检查发票编号是否已存在"""
+        row = self._execute('SELECT 1 FROM invoices WHERE id = ?', (invoice_id,)).fetchone()
+        return row is not None
+
+    def get_pdf_path(self, invoice_id):
+        """获取发票关联的PDF路径"""
+        row = self._execute('SELECT pdf_path FROM invoices WHERE id = ?', (invoice_id,)).fetchone()
+        return row[0] if row else None
+
+    def list_pdf_paths(self, conn=None):
+        """返回所有不同的PDF路径"""
+        rows = self._execute('SELECT DISTINCT pdf_path FROM invoices WHERE pdf_path IS NOT NULL', (), conn)
+        return [row[0] for row in rows]
+
+    def pending_pdf_paths(self, conn=None):
+        """返回尚未提取文本的PDF路径"""
+        return [row[0] for row in self._execute(SQL_SELECT_PENDING_PDFS, (), conn)]
+
+    def known_pdf_digests(self, digests, conn=None):
+        """返回其中已经缓存了文本的文件哈希"""
+        known = set()
+        digests = list(digests)
+        # 分批查询，避免超过SQL参数数量上限
+        for start in range(0, len(digests), 500):
+            batch = digests[start:start + 500]
+            sql = f"SELECT sha256 FROM pdf_text WHERE sha256 IN ({', '.join('?' * len(batch))})"
+            known.update(row[0] for row in self._execute(sql, batch, conn))
+        return known
+
+    def save_pdf_text(self, results, conn=None):
+        """保存提取结果 [(pdf_path, sha256, text, error), ...]；text 为 None 表示只记录路径与哈希"""
+        conn = conn or self.conn
+        with conn:
+            self._execute_many(
+                'INSERT OR REPLACE INTO pdf_files (pdf_path, sha256) VALUES (?, ?)',
+                [(pdf_path, sha256) for pdf_path, sha256, text, error in results], conn)
+            self._execute_many(
+                'INSERT OR IGNORE INTO pdf_text (sha256, text, error) VALUES (?, ?, ?)',
+                [(sha256, text, error) for pdf_path, sha256, text, error in results if text is not None], conn)
+
+    def _where_clause(self, search_term, sort_keys=None, after=None, filters=None):
+        """构建WHERE子句，返回 (SQL片段, 参数)"""
+        conditions = []
+        params = []
+        if filters is not None:
+            conditions, params = filters.conditions()
+        if search_term:
+            if self.fts_enabled and len(search_term) >= FTS_MIN_TERM_LENGTH:
+                # trigram索引查询（大小写不敏感的子串匹配），同时搜索附件PDF中提取出的文字
+                conditions.append(SQL_SEARCH_FTS_WITH_PDF_CONDITION)
+                params.extend((fts_phrase(search_term),) * 2)
+            else:
+                search_pattern = like_pattern(search_term)
+                conditions.append(SQL_SEARCH_LIKE_CONDITION)
+                params.extend((search_pattern,) * 4)
+        if after is not None:
+            # 键集分页：从上一页最后一行之后继续，避免OFFSET扫描
+            condition, keyset_params = keyset_condition(sort_keys, after)
+            conditions.append(condition)
+            params.extend(keyset_params)
+        if not conditions:
+            return '', ()
+        return ' WHERE ' + ' AND '.join(conditions), tuple(params)
+
+    def list_page(self, search_term='', sort_keys=None, after=None, limit=100, conn=None, filters=None,
+                  before=None):
+        """按排序键返回一页列表行；after 为上一页的最后一行（None 表示第一页），filters 为 InvoiceFilter
+
+        给出 before 时返回紧接在该行之前的一页（仍按原顺序排列），用于向上滚动时重新加载已移出的行
+        """
+        sort_keys = normalize_sort_keys(sort_keys)
+        if before is not None:
+            # 反转排序方向，从 before 开始向前取，再把结果倒回原顺序
+            reversed_keys = [(column, not descending) for column, descending in sort_keys]
+            where, params = self._where_clause(search_term, reversed_keys, before, filters)
+            sql = SQL_SELECT_LIST + where + order_by_clause(reversed_keys) + ' LIMIT ?'
+            return self._execute(sql, params + (limit,), conn).fetchall()[::-1]
+        where, params = self._where_clause(search_term, sort_keys, after, filters)
+        sql = SQL_SELECT_LIST + where + order_by_clause(sort_keys) + ' LIMIT ?'
+        return self._execute(sql, params + (limit,), conn).fetchall()
+
+    def iter_invoices(self, search_term='', sort_keys=None, batch_size=500, conn=None, filters=None):
+        """按排序键流式返回所有符合条件的完整发票记录（分批读取，内存占用与总行数无关）"""
+        sort_keys = normalize_sort_keys(sort_keys)
+        where, params = self._where_clause(search_term, filters=filters)
+        cursor = self._execute(SQL_SELECT_ALL_DETAILS + where + order_by_clause(sort_keys), params, conn)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row_to_invoice(row)
+
+    def get_breakdown(self, month=None, conn=None):
+        """按 (费用类型, 报销状态) 分组返回 [(费用类型, 已报销, 数量, 总金额), ...]；month 为 YYYY-MM"""
+        rows = self._execute(SQL_SELECT_BREAKDOWN, (month, month), conn).fetchall()
+        return [(expense_type, bool(reimbursed), count, cents_to_amount(total))
+                for expense_type, reimbursed, count, total in rows]
+
+    def get_summary(self, conn=None):
+        """从统计汇总表读取状态栏汇总（不扫描发票表）"""
+        month = datetime.now().strftime('%Y-%m')
+        row = self._execute(SQL_SELECT_SUMMARY, (month, month), conn).fetchone()
+        count, total, unreimbursed_advance, month_count, month_total = (value or 0 for value in row)
+        return {
+            'count': count,
+            'total': cents_to_amount(total),
+            'unreimbursed_advance_total': cents_to_amount(unreimbursed_advance),
+            'month_count': month_count,
+            'month_total': cents_to_amount(month_total),
+        }
+
+    def get_statistics(self, search_term='', conn=None, filters=None):
+        """返回 (数量, 总金额)；无搜索词和筛选条件时直接读取汇总表"""
+        if filters is not None and filters.is_empty():
+            filters = None
+        if not search_term and filters is None:
+            summary = self.get_summary(conn)
+            return summary['count'], summary['total']
+        where, params = self._where_clause(search_term, filters=filters)
+        count, total = self._execute(SQL_SELECT_STATISTICS + where, params, conn).fetchone()
+        return count or 0, cents_to_amount(total or 0)
+
+    # ---- 写入 ----
+
+    def insert_invoice(self, invoice_data, created_at):
+        """插入新发票，返回新记录的编号"""
+        with self.conn:
+            cursor = self._execute(SQL_INSERT, (
+                invoice_data['content'],
+                invoice_data['platform'],
+                invoice_data['expense_type'],
+                invoice_data['amount'],
+                invoice_data['note'],
+                invoice_data['pdf_path'],
+                invoice_data['reimbursed'],
+                created_at
+            ))
+        invoice_id = cursor.lastrowid
+        self._emit(None, self.get_invoice(invoice_id))
+        return invoice_id
+
+    def insert_many(self, rows, conn):
+        """批量插入数据行（不提交事务、不发出逐行变更事件，由调用方控制事务范围）"""
+        self._execute_many(SQL_INSERT, rows, conn)
+
+    def stage_import_rows(self, rows, conn):
+        """把待导入的行（SQL_INSERT 的参数）写入 conn 私有的临时暂存表；conn 为 dedicated_connection"""
+        conn.execute(SQL_CREATE_IMPORT_STAGING)
+        # 事务只涉及临时库，不会锁住数据库文件
+        conn.execute('BEGIN')
+        try:
+            self._execute_many(SQL_STAGE_IMPORT_ROW, rows, conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def insert_staged_rows(self, conn):
+        """在一个短写事务中把暂存表中的行复制到发票表并清空暂存表，返回插入的行数"""
+        conn.execute(SQL_CREATE_IMPORT_STAGING)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            count = self._execute(SQL_INSERT_STAGED, (), conn).rowcount
+            conn.execute('DELETE FROM temp.import_staging')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return count
+
+    def replace_pdf_path(self, old_path, new_path):
+        """把所有引用 old_path 的发票改为引用 new_path，并删除旧路径的文本索引记录"""
+        with self.conn:
+            self._execute('UPDATE invoices SET pdf_path = ?, version = version + 1 WHERE pdf_path = ?',
+                          (new_path, old_path))
+            # 新路径的哈希就在文件名中，索引时按哈希直接复用已提取的文本
+            self._execute('DELETE FROM pdf_files WHERE pdf_path = ?', (old_path,))
+
+    @contextmanager
+    def _write_transaction(self):
+        """写事务：先用 BEGIN IMMEDIATE 取得写锁再读取旧记录，读取和写入在同一事务中，
+        期间其他程序的修改或删除不会让读到的旧记录过时"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def update_invoice(self, invoice_data):
+        """更新发票信息，返回更新前的PDF路径；记录不存在时返回 None
+
+        invoice_data 中带有读取时的 version 时，记录在此期间被其他用户修改或删除会抛出 InvoiceConflictError
+        """
+        expected_version = invoice_data.get('version')
+        with self._write_transaction():
+            old = self.get_invoice(invoice_data['id'])
+            if expected_version is not None and (old is None or old['version'] != expected_version):
+                raise InvoiceConflictError(invoice_data['id'], old)
+            if old is None:
+                return None
+            self._execute(SQL_UPDATE, (
+                invoice_data['content'],
+                invoice_data['platform'],
+                invoice_data['expense_type'],
+                invoice_data['amount'],
+                invoice_data['note'],
+                invoice_data['pdf_path'],
+                invoice_data['reimbursed'],
+                invoice_data['id'],
+                expected_version
+            ))
+            new = self.get_invoice(invoice_data['id'])
+        self._emit(old, new)
+        return old['pdf_path']
+
+    def delete_invoice(self, invoice_id):
+        """删除发票，返回其关联的PDF路径"""
+        with self._write_transaction():
+            old = self.get_invoice(invoice_id)
+            if old is None:
+                return None
+            self._execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
+        self._emit(old, None)
+        return old['pdf_path']
+
+    def toggle_reimbursed(self, invoice_id, expected_version=None):
+        """切换报销状态，返回新状态；记录不存在时返回 None
+
+        给出 expected_version 时，记录已被其他用户修改或删除会抛出 InvoiceConflictError
+        """
+        with self._write_transaction():
+            old = self.get_invoice(invoice_id)
+            if expected_version is not None and (old is None or old['version'] != expected_version):
+                raise InvoiceConflictError(invoice_id, old)
+            if old is None:
+                return None
+            new_status = not old['reimbursed']
+            self._execute('UPDATE invoices SET reimbursed = ?, version = version + 1 WHERE id = ?',
+                          (new_status, invoice_id))
+            new = self.get_invoice(invoice_id)
+        self._emit(old, new)
+        return new_status
+
+    # ---- 批量写入：一个事务、一次 executemany、一次变更通知 ----
+
+    def _write_many(self, invoice_ids, sql, params, deleted=False):
+        """对多张发票执行同一条语句，params(编号) 生成每行的参数；返回变更列表
+
+        已被其他程序删除的编号直接跳过，不在返回的变更列表中
+        """
+        invoice_ids = list(dict.fromkeys(invoice_ids))
+        with self._write_transaction():
+            old = self.get_invoices(invoice_ids)
+            self._execute_many(sql, [params(invoice_id) for invoice_id in old])
+            new = {} if deleted else self.get_invoices(old)
+        changes = [InvoiceChange(invoice, new.get(invoice_id)) for invoice_id, invoice in old.items()]
+        self._emit_many(changes)
+        return changes
+
+    def set_reimbursed_many(self, invoice_ids, reimbursed):
+        """把多张发票标记为已报销/未报销，返回实际改变状态的数量"""
+        changes = self._write_many(invoice_ids, 'UPDATE invoices SET reimbursed = ?, version = version + 1 WHERE id = ?',
+                                   lambda invoice_id: (reimbursed, invoice_id))
+        return sum(1 for change in changes if change.new and change.old['reimbursed'] != change.new['reimbursed'])
+
+    def set_expense_type_many(self, invoice_ids, expense_type):
+        """修改多张发票的费用类型，返回处理的数量"""
+        changes = self._write_many(invoice_ids, 'UPDATE invoices SET expense_type = ?, version = version + 1 WHERE id = ?',
+                                   lambda invoice_id: (expense_type, invoice_id))
+        return len(changes)
+
+    def delete_many(self, invoice_ids):
+        """删除多张发票，返回它们关联的PDF路径（去重）"""
+        changes = self._write_many(invoice_ids, 'DELETE FROM invoices WHERE id = ?',
+                                   lambda invoice_id: (invoice_id,), deleted=True)
+        return list(dict.fromkeys(change.old['pdf_path'] for change in changes if change.old['pdf_path']))
@@ -0,0 +1,123 @@
+import csv
+import json
+import os
+
+# 导出列：字段名 -> 表头（与导入时识别的表头一致，导出的文件可以直接再导入）
+EXPORT_COLUMNS = (
+    ('id', '编号'),
+    ('content', '报销内容'),
+    ('platform', '购买平台'),
+    ('expense_type', '费用类型'),
+    ('amount', '金额'),
+    ('note', '备注'),
+    ('reimbursed', '报销状态'),
+    ('created_at', '创建时间'),
+    ('pdf_path', 'PDF文件'),
+)
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'jsonl')
+
+# 扩展名 -> 格式
+FORMAT_EXTENSIONS = {'.csv': 'csv', '.xlsx': 'xlsx', '.jsonl': 'jsonl', '.json': 'jsonl'}
+
+
+class ExportCancelled(Exception):
+    """导出被用户取消"""
+
+
+def _table_row(invoice):
+    """表格格式的一行（报销状态显示为中文）"""
+    values = []
+    for field, _ in EXPORT_COLUMNS:
+        value = invoice[field]
+        if field == 'reimbursed':
+            value = '已报销' if value else '未报销'
+        values.append('' if value is None else value)
+    return values
+
+
+def write_csv(invoices, stream, progress=None):
+    """逐行写出CSV，返回写出的行数"""
+    writer = csv.writer(stream)
+    writer.writerow([header for _, header in EXPORT_COLUMNS])
+    count = 0
+    for count, invoice in enumerate(invoices, start=1):
+        writer.writerow(_table_row(invoice))
+        if progress:
+            progress(count)
+    return count
+
+
+def write_jsonl(invoices, stream, progress=None):
+    """每行一个JSON对象，返回写出的行数"""
+    count = 0
+    for count, invoice in enumerate(invoices, start=1):
+        stream.write(json.dumps({field: invoice[field] for field, _ in EXPORT_COLUMNS}, ensure_ascii=False))
+        stream.write('\n')
+        if progress:
+            progress(count)
+    return count
+
+
+def write_xlsx(invoices, path, progress=None):
+    """以只写模式逐行写出XLSX（行数据直接写入临时文件，不在内存中保留工作表），返回写出的行数"""
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError("导出XLSX文件需要安装 openpyxl：pip install openpyxl")
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('发票')
+    sheet.append([header for _, header in EXPORT_COLUMNS])
+    count = 0
+    for count, invoice in enumerate(invoices, start=1):
+        sheet.append(_table_row(invoice))
+        if progress:
+            progress(count)
+    workbook.save(path)
+    return count
+
+
+def export_invoices(invoices, stream, fmt='csv', progress=None):
+    """把发票记录流式写入文本流；progress(已写出行数)"""
+    if fmt == 'csv':
+        return write_csv(invoices, stream, progress)
+    if fmt == 'jsonl':
+        return write_jsonl(invoices, stream, progress)
+    raise ValueError(f"不支持的导出格式：{fmt}")
+
+
+def format_for_path(path):
+    """根据扩展名判断导出格式"""
+    fmt = FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"无法根据文件名判断导出格式，支持：{', '.join(FORMAT_EXTENSIONS)}")
+    return fmt
+
+
+def _until_cancelled(invoices, cancel_event):
+    for invoice in invoices:
+        if cancel_event.is_set():
+            raise ExportCancelled()
+        yield invoice
+
+
+def export_to_file(invoices, path, fmt=None, progress=None, cancel_event=None):
+    """流式导出到文件，返回行数；先写入临时文件，完成后才替换目标文件，取消或出错时不留下半个文件"""
+    fmt = fmt or format_for_path(path)
+    if cancel_event is not None:
+        invoices = _until_cancelled(invoices, cancel_event)
+    temp_path = f'{path}.part'
+    try:
+        if fmt == 'xlsx':
+            count = write_xlsx(invoices, temp_path, progress)
+        else:
+            # CSV带BOM，Excel可以直接识别中文
+            encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+            with open(temp_path, 'w', encoding=encoding, newline='') as f:
+                count = export_invoices(invoices, f, fmt, progress)
+        os.replace(temp_path, path)
+        return count
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,184 @@
+import csv
+import io
+import os
+from datetime import datetime
+
+from utils.validation import validate_invoice_fields, validate_expense_type
+
+# 表头名称（中文或英文）到字段名的映射
+HEADER_ALIASES = {
+    '报销内容': 'content', 'content': 'content',
+    '购买平台': 'platform', 'platform': 'platform',
+    '费用类型': 'expense_type', 'expense_type': 'expense_type',
+    '金额': 'amount', 'amount': 'amount',
+    '备注': 'note', 'note': 'note',
+    '报销状态': 'reimbursed', 'reimbursed': 'reimbursed',
+    '创建时间': 'created_at', 'created_at': 'created_at',
+}
+
+# 视为"已报销"的取值
+REIMBURSED_VALUES = {'已报销', '是', 'y', 'yes', 'true', '1'}
+
+# 可接受的时间格式
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%Y/%m/%d %H:%M:%S', '%Y/%m/%d')
+
+
+class ImportReport:
+    """导入结果：成功行数与逐行错误"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []        # [(行号, 错误信息), ...]
+        self.cancelled = False
+
+    def add_error(self, row_number, message):
+        self.errors.append((row_number, message))
+
+    def summary(self):
+        text = f"成功导入 {self.inserted} 条，失败 {len(self.errors)} 条"
+        if self.cancelled:
+            text += "（已取消，未写入任何数据）"
+        return text
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _rows_from_header(rows):
+    """把首行作为表头，逐行产出 (行号, 字段字典)"""
+    header = None
+    for row_number, row in enumerate(rows, start=1):
+        if header is None:
+            header = [HEADER_ALIASES.get(_cell_text(cell).lower(), HEADER_ALIASES.get(_cell_text(cell)))
+                      for cell in row]
+            if 'content' not in header or 'amount' not in header:
+                raise ValueError("文件首行必须包含“报销内容”和“金额”列")
+            continue
+        if not any(_cell_text(cell) for cell in row):
+            continue  # 跳过空行
+        record = {}
+        for field, cell in zip(header, row):
+            if field:
+                record[field] = cell
+        yield row_number, record
+
+
+def iter_csv(path, progress=None):
+    """流式读取CSV文件；progress(已读取字节比例)"""
+    size = os.path.getsize(path) or 1
+    with open(path, 'rb') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        for row_number, record in _rows_from_header(csv.reader(text)):
+            if progress:
+                progress(min(raw.tell() / size, 1.0))
+            yield row_number, record
+
+
+def iter_xlsx(path, progress=None):
+    """以只读模式流式读取XLSX文件的第一个工作表（需要 openpyxl）"""
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError("导入XLSX文件需要安装 openpyxl：pip install openpyxl")
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total = sheet.max_row or 1
+        for row_number, record in _rows_from_header(sheet.iter_rows(values_only=True)):
+            if progress:
+                progress(min(row_number / total, 1.0))
+            yield row_number, record
+    finally:
+        workbook.close()
+
+
+def iter_file(path, progress=None):
+    """按扩展名选择读取方式"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        return iter_xlsx(path, progress)
+    return iter_csv(path, progress)
+
+
+def parse_record(record):
+    """校验并转换一行数据，返回 (插入参数, 错误信息)；规则与新增发票对话框一致"""
+    content = _cell_text(record.get('content'))
+    amount = _cell_text(record.get('amount')).replace('¥', '').replace(',', '').strip()
+    error = validate_invoice_fields(content, amount)
+    if error:
+        return None, error
+
+    expense_type = _cell_text(record.get('expense_type')) or '垫付'
+    error = validate_expense_type(expense_type)
+    if error:
+        return None, error
+
+    created_at = record.get('created_at')
+    if isinstance(created_at, datetime):
+        created_at = created_at.strftime('%Y-%m-%d %H:%M:%S')
+    elif _cell_text(created_at):
+        text = _cell_text(created_at)
+        for fmt in DATETIME_FORMATS:
+            try:
+                created_at = datetime.strptime(text, fmt).strftime('%Y-%m-%d %H:%M:%S')
+                break
+            except ValueError:
+                continue
+        else:
+            return None, f"无法识别的创建时间：{text}"
+    else:
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    reimbursed = _cell_text(record.get('reimbursed')).lower() in REIMBURSED_VALUES
+    return (
+        content,
+        _cell_text(record.get('platform')),
+        expense_type,
+        float(amount),
+        _cell_text(record.get('note')),
+        None,
+        reimbursed,
+        created_at,
+    ), None
+
+
+class InvoiceImporter:
+    """批量导入：流式读取、逐行校验，分批写入暂存表，全部读完后在一个短事务中写入发票表"""
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def import_file(self, path, progress=None, cancel_event=None):
+        """导入CSV/XLSX文件，返回 ImportReport；progress(完成比例)，cancel_event 被设置时回滚并停止"""
+        report = ImportReport()
+        batch = []
+        # 使用单独的连接：读取文件期间既不占用界面的连接池，也不持有数据库写锁；
+        # 取消或出错时暂存表随连接关闭而丢弃，发票表不受影响
+        with self.repo.dedicated_connection() as conn:
+            for row_number, record in iter_file(path, progress):
+                if cancel_event is not None and cancel_event.is_set():
+                    report.cancelled = True
+                    break
+                params, error = parse_record(record)
+                if error:
+                    report.add_error(row_number, error)
+                    continue
+                batch.append(params)
+                if len(batch) >= self.BATCH_SIZE:
+                    self.repo.stage_import_rows(batch, conn)
+                    batch = []
+            if report.cancelled:
+                return report
+            if batch:
+                self.repo.stage_import_rows(batch, conn)
+            report.inserted = self.repo.insert_staged_rows(conn)
+        if progress:
+            progress(1.0)
+        return report
@@ -0,0 +1,87 @@
+import collections
+import threading
+
+# 缓存的发票详情条数上限
+CACHE_SIZE = 2000
+
+
+class InvoiceCache:
+    """发票详情的LRU缓存：订阅仓库的变更事件保持一致，可用一条 WHERE id IN (...) 查询预取一批"""
+
+    def __init__(self, repo, max_size=CACHE_SIZE):
+        self.repo = repo
+        self.max_size = max_size
+        self._items = collections.OrderedDict()     # 编号 -> 发票字典
+        # 每次写入递增；预取结果返回时代数已变化则丢弃，避免用旧数据覆盖刚写入的记录
+        self.generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        repo.subscribe(self.on_changes)
+
+    def __contains__(self, invoice_id):
+        with self._lock:
+            return invoice_id in self._items
+
+    def _put(self, invoice):
+        self._items[invoice['id']] = invoice
+        self._items.move_to_end(invoice['id'])
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get(self, invoice_id):
+        """返回发票详情（副本）；未缓存时从数据库读取，不存在时返回 None"""
+        with self._lock:
+            invoice = self._items.get(invoice_id)
+            if invoice is not None:
+                self._items.move_to_end(invoice_id)
+                self.hits += 1
+                return dict(invoice)
+            self.misses += 1
+        invoice = self.repo.get_invoice(invoice_id)
+        if invoice is not None:
+            with self._lock:
+                self._put(invoice)
+            invoice = dict(invoice)
+        return invoice
+
+    def missing(self, invoice_ids):
+        """返回其中尚未缓存的编号"""
+        with self._lock:
+            return [invoice_id for invoice_id in invoice_ids if invoice_id not in self._items]
+
+    def load(self, invoice_ids, conn=None):
+        """一次查询读取一批发票（可在工作线程中用连接池的连接调用），返回 (代数, {编号: 发票})"""
+        generation = self.generation
+        return generation, self.repo.get_invoices(invoice_ids, conn)
+
+    def store(self, generation, invoices):
+        """保存 load 的结果；期间有写入时丢弃"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            for invoice in invoices.values():
+                if invoice['id'] not in self._items:
+                    self._put(invoice)
+
+    def prefetch(self, invoice_ids):
+        """在当前线程中预取尚未缓存的发票"""
+        missing = self.missing(invoice_ids)
+        if missing:
+            self.store(*self.load(missing))
+
+    def on_changes(self, changes):
+        """写入后更新或移除对应记录"""
+        with self._lock:
+            self.generation += 1
+            for change in changes:
+                if change.new is None:
+                    self._items.pop(change.invoice_id, None)
+                elif change.invoice_id in self._items:
+                    self._items[change.invoice_id] = change.new
+
+    def clear(self):
+        """清空缓存（数据库被其他程序修改或替换后）"""
+        with self._lock:
+            self.generation += 1
+            self._items.clear()
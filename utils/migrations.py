@@ -0,0 +1,241 @@
+import argparse
+import sqlite3
+import sys
+
+from utils.database import (
+    DEFAULT_DB_PATH, SQL_CREATE_INVOICES, SQL_CREATE_SORT_INDEXES, SQL_CREATE_PDF_PATH_INDEX,
+    MAX_AMOUNT, SQL_AMOUNT_CENTS, SQL_INVALID_AMOUNT_CONDITION, SQL_CREATED_TS, SQL_CREATE_RANGE_INDEXES, SQL_CREATE_FILTER_INDEXES,
+    SQL_CREATE_STATS, SQL_CREATE_STATS_TRIGGERS, SQL_BACKFILL_STATS, SQL_CREATE_FTS, SQL_CREATE_FTS_TRIGGERS,
+    SQL_CREATE_PDF_TEXT, SQL_CREATE_PDF_TEXT_FTS,
+    JOURNAL_MODES, open_connection, set_journal_mode,
+)
+
+# 回填时每批处理的行数（每批单独提交，中断后重新运行会从未处理的行继续）
+BACKFILL_BATCH_SIZE = 10000
+
+# 已注册的迁移：[(版本号, 说明, 函数), ...]，按版本号递增
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """注册一个迁移：函数接收 (conn, progress)，在已开始的事务中执行"""
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        return function
+    return register
+
+
+def table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def column_names(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def pending_migrations(conn):
+    """返回尚未执行的迁移"""
+    current = schema_version(conn)
+    return [item for item in MIGRATIONS if item[0] > current]
+
+
+def migrate(conn, progress=None):
+    """依次执行尚未执行的迁移，每个迁移在一个事务中完成并更新 user_version；返回执行的数量
+
+    progress(说明, 已完成, 总数) 在每个迁移开始时及批量回填过程中调用
+    """
+    pending = pending_migrations(conn)
+    for version, description, function in pending:
+        if progress:
+            progress(description, 0, None)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            function(conn, (lambda done, total, text=description: progress(text, done, total)) if progress else None)
+            # user_version 写在数据库文件头中，与迁移本身一起提交
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return len(pending)
+
+
+def repair_invalid_amounts(conn):
+    """把无穷大或超过 MAX_AMOUNT 的金额改为 0（原值记入备注），返回受影响的编号
+
+    旧版对话框和导入接受 "inf" 这样的金额，换算成整数分后会使汇总求和溢出
+    """
+    invoice_ids = [row[0] for row in conn.execute(
+        f'SELECT id FROM invoices WHERE {SQL_INVALID_AMOUNT_CONDITION} ORDER BY id')]
+    if not invoice_ids:
+        return invoice_ids
+    assignments = 'amount = 0'
+    if 'amount_cents' in column_names(conn, 'invoices'):
+        assignments += ', amount_cents = 0'
+    conn.execute(f'''
+        UPDATE invoices
+        SET note = CASE WHEN IFNULL(note, '') = '' THEN '' ELSE note || ' ' END
+                   || '（原金额 ' || amount || ' 无效，已改为 0）',
+            {assignments}
+        WHERE {SQL_INVALID_AMOUNT_CONDITION}
+    ''')
+    print(f"以下发票的金额无效或超过 {MAX_AMOUNT} 元，已改为 0（原金额记在备注中）："
+          f"{', '.join(map(str, invoice_ids))}", file=sys.stderr)
+    return invoice_ids
+
+
+@migration(1, '创建发票表')
+def create_invoices(conn, progress):
+    conn.execute(SQL_CREATE_INVOICES)
+    # 排序用索引
+    for sql in SQL_CREATE_SORT_INDEXES:
+        conn.execute(sql)
+    conn.execute(SQL_CREATE_PDF_PATH_INDEX)
+
+
+@migration(2, '金额改存整数分，创建时间另存整数秒')
+def add_integer_columns(conn, progress):
+    columns = column_names(conn, 'invoices')
+    if 'amount_cents' not in columns:
+        conn.execute('ALTER TABLE invoices ADD COLUMN amount_cents INTEGER')
+    if 'created_ts' not in columns:
+        conn.execute('ALTER TABLE invoices ADD COLUMN created_ts INTEGER')
+
+    repair_invalid_amounts(conn)
+
+    # 按编号区间分批回填，避免一次更新整张表造成长时间锁定和过大的WAL
+    low, high = conn.execute('SELECT MIN(id), MAX(id) FROM invoices').fetchone()
+    if low is None:
+        return
+    sql = f'''
+        UPDATE invoices
+        SET amount_cents = {SQL_AMOUNT_CENTS.format(amount='amount')},
+            created_ts = {SQL_CREATED_TS.format(created_at='created_at')}
+        WHERE id BETWEEN ? AND ? AND amount_cents IS NULL
+    '''
+    total = high - low + 1
+    for start in range(low, high + 1, BACKFILL_BATCH_SIZE):
+        end = min(start + BACKFILL_BATCH_SIZE - 1, high)
+        conn.execute(sql, (start, end))
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        if progress:
+            progress(end - low + 1, total)
+
+
+@migration(3, '创建金额和日期范围索引')
+def create_range_indexes(conn, progress):
+    for sql in SQL_CREATE_RANGE_INDEXES:
+        conn.execute(sql)
+
+
+@migration(4, '统计汇总表改用整数分')
+def rebuild_stats(conn, progress):
+    # 旧版汇总表以浮点数累计金额，直接按整数分重建
+    for name in ('invoice_stats_ai', 'invoice_stats_ad', 'invoice_stats_au'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    conn.execute('DROP TABLE IF EXISTS invoice_stats')
+    conn.execute(SQL_CREATE_STATS)
+    for sql in SQL_CREATE_STATS_TRIGGERS:
+        conn.execute(sql)
+    conn.execute(SQL_BACKFILL_STATS)
+
+
+@migration(5, '创建全文索引')
+def create_fts(conn, progress):
+    exists = table_exists(conn, 'invoices_fts')
+    conn.execute('SAVEPOINT fts')
+    try:
+        conn.execute(SQL_CREATE_FTS)
+        for sql in SQL_CREATE_FTS_TRIGGERS:
+            conn.execute(sql)
+        if not exists:
+            # 为已有数据库中的全部记录建立索引
+            conn.execute("INSERT INTO invoices_fts(invoices_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError as e:
+        # 部分SQLite构建未启用FTS5，搜索回退到LIKE
+        conn.execute('ROLLBACK TO fts')
+        print(f"FTS5 unavailable, falling back to LIKE search: {str(e)}")
+    conn.execute('RELEASE fts')
+
+
+@migration(6, '创建PDF文本缓存表')
+def create_pdf_text(conn, progress):
+    for sql in SQL_CREATE_PDF_TEXT:
+        conn.execute(sql)
+    if not table_exists(conn, 'invoices_fts'):
+        return
+    exists = table_exists(conn, 'pdf_text_fts')
+    for sql in SQL_CREATE_PDF_TEXT_FTS:
+        conn.execute(sql)
+    if not exists:
+        conn.execute("INSERT INTO pdf_text_fts(pdf_text_fts) VALUES ('rebuild')")
+
+
+@migration(7, '创建筛选用索引')
+def create_filter_indexes(conn, progress):
+    for sql in SQL_CREATE_FILTER_INDEXES:
+        conn.execute(sql)
+
+
+@migration(8, '增加行版本号（多人编辑时检测冲突）')
+def add_version_column(conn, progress):
+    # 带常量默认值的 ADD COLUMN 只修改表定义，不重写已有的行
+    if 'version' not in column_names(conn, 'invoices'):
+        conn.execute('ALTER TABLE invoices ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+
+@migration(9, '修正无效金额并重建统计汇总')
+def repair_amounts(conn, progress):
+    # 已按旧的换算方式回填过的数据库中，无效金额的整数分可能是 64 位整数的最大值
+    if repair_invalid_amounts(conn):
+        conn.execute('DELETE FROM invoice_stats')
+        conn.execute(SQL_BACKFILL_STATS)
+
+
+def main(argv=None):
+    """命令行：执行数据库迁移并显示进度"""
+    parser = argparse.ArgumentParser(prog='python -m utils.migrations', description='升级发票数据库结构')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='数据库文件')
+    parser.add_argument('--status', action='store_true', help='只显示当前版本和待执行的迁移')
+    parser.add_argument('--journal-mode', type=str.upper, choices=JOURNAL_MODES,
+                        help='升级后切换日志模式（需要其他客户端都已关闭数据库）')
+    args = parser.parse_args(argv)
+
+    conn = open_connection(args.db)
+    try:
+        if args.status:
+            print(f"当前版本：{schema_version(conn)}，最新版本：{latest_version()}")
+            print(f"日志模式：{conn.execute('PRAGMA journal_mode').fetchone()[0].upper()}")
+            for version, description, _ in pending_migrations(conn):
+                print(f"  待执行 {version}: {description}")
+            return 0
+
+        def report(description, done, total):
+            text = f"{done}/{total}" if total else ''
+            print(f"\r{description} {text}", end='', file=sys.stderr)
+
+        count = migrate(conn, report)
+        if count:
+            print(file=sys.stderr)
+        print(f"已执行 {count} 个迁移，当前版本：{schema_version(conn)}")
+        if args.journal_mode:
+            mode = set_journal_mode(conn, args.journal_mode)
+            print(f"日志模式：{mode}")
+            if mode != args.journal_mode:
+                return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,253 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+# 回收区目录名（位于PDF存储目录下；以点开头，扫描和备份都会跳过）
+TRASH_DIR_NAME = '.trash'
+
+# 回收区中的文件保留天数
+TRASH_RETENTION_DAYS = 30
+
+# 最近修改过的文件不视为孤立文件：新增发票时PDF先存入存储，保存发票后才写入数据库
+ORPHAN_GRACE_SECONDS = 60 * 60
+
+# 文件状态缓存的有效期（秒）
+FILE_STATUS_TTL = 10 * 60
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+class FileStatusCache:
+    """文件是否存在的内存缓存：网络共享上 os.path.exists 很慢，选中发票时只查缓存"""
+
+    def __init__(self, ttl=FILE_STATUS_TTL):
+        self.ttl = ttl
+        self._status = {}       # 规范化路径 -> (是否存在, 检查时间)
+        self._lock = threading.Lock()
+
+    def exists(self, path):
+        """返回文件是否存在；缓存过期或没有记录时检查一次文件系统"""
+        if not path:
+            return False
+        key = normalize_path(path)
+        with self._lock:
+            cached = self._status.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+        exists = os.path.exists(path)
+        self.set(path, exists)
+        return exists
+
+    def set(self, path, exists):
+        with self._lock:
+            self._status[normalize_path(path)] = (exists, time.monotonic())
+
+    def update(self, existing_paths, checked_root, scan_started):
+        """用一次完整扫描的结果刷新 checked_root 下的记录；scan_started 为扫描开始时的 time.monotonic()"""
+        now = time.monotonic()
+        root = normalize_path(checked_root)
+        with self._lock:
+            # 扫描中没有出现的旧记录视为不存在（扫描开始后才检查过的记录更新，保留）
+            for key, (_, checked_at) in list(self._status.items()):
+                if key.startswith(root + os.sep) and checked_at < scan_started:
+                    self._status[key] = (False, now)
+            for path in existing_paths:
+                self._status[normalize_path(path)] = (True, now)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._status.clear()
+            else:
+                self._status.pop(normalize_path(path), None)
+
+
+class PdfReconciler:
+    """后台对账：比较PDF存储目录与数据库中的 pdf_path，把没有发票引用的文件移到回收区，
+    超过保留期后删除；被引用但已在回收区的文件会被移回原处"""
+
+    def __init__(self, repo, pdf_dir='./invoices_pdf', file_status=None,
+                 retention_days=TRASH_RETENTION_DAYS, grace_seconds=ORPHAN_GRACE_SECONDS):
+        self.repo = repo
+        self.pdf_dir = pdf_dir
+        self.trash_dir = os.path.join(pdf_dir, TRASH_DIR_NAME)
+        self.file_status = file_status
+        self.retention_days = retention_days
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._running = False
+        self._rerun = False
+
+    def scan_files(self, root):
+        """递归列出目录中的PDF文件，返回 {规范化路径: (路径, 修改时间)}；跳过以点开头的目录和文件"""
+        files = {}
+        if not os.path.isdir(root):
+            return files
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                print(f"Cannot scan {directory}: {str(e)}")
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file() and entry.name.lower().endswith('.pdf'):
+                        files[normalize_path(entry.path)] = (entry.path, entry.stat().st_mtime)
+                except OSError:
+                    continue
+        return files
+
+    def referenced_paths(self):
+        """数据库中引用的所有PDF路径（规范化后）"""
+        with self.repo.pool.connection() as conn:
+            return {normalize_path(path): path for path in self.repo.list_pdf_paths(conn)}
+
+    def check_references(self, files, referenced, root):
+        """存储目录中有文件、数据库却不像是与之对应时抛出 ValueError，不做任何移动
+
+        没有任何发票引用PDF时多半是打开了新建的或错误的数据库；数据库中的相对路径按当前目录解析，
+        没有一个引用落在存储目录中时多半是工作目录不对。两种情况继续都会把所有文件当作孤立文件
+        """
+        if not files:
+            return
+        if not referenced:
+            raise ValueError(f"数据库中没有任何发票引用PDF，而 {self.pdf_dir} 中有 {len(files)} 个文件，"
+                             f"请确认打开的是正确的数据库")
+        if not any(key.startswith(root) for key in referenced):
+            raise ValueError(f"数据库中的PDF路径都不在 {self.pdf_dir} 中，请在程序所在目录中运行")
+
+    def trash_path_for(self, path):
+        return os.path.join(self.trash_dir, os.path.relpath(path, self.pdf_dir))
+
+    def _move(self, source, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+        # 修改时间记为移动的时间，保留期从此开始计算
+        os.utime(target)
+
+    def run(self, dry_run=False):
+        """执行一轮对账，返回 {'orphaned': 移入回收区数, 'restored': 移回数, 'purged': 永久删除数, 'errors': [...]}"""
+        result = {'orphaned': 0, 'restored': 0, 'purged': 0, 'errors': []}
+        now = time.time()
+        scan_started = time.monotonic()
+        files = self.scan_files(self.pdf_dir)
+        referenced = self.referenced_paths()
+        root = normalize_path(self.pdf_dir) + os.sep
+        self.check_references(files, referenced, root)
+
+        # 被引用但不存在的文件：如果还在回收区中则移回（只处理存储目录中的文件）
+        for key, path in referenced.items():
+            if key in files or not key.startswith(root):
+                continue
+            trash_path = self.trash_path_for(path)
+            if not os.path.exists(trash_path):
+                continue
+            if not dry_run:
+                try:
+                    self._move(trash_path, path)
+                except OSError as e:
+                    result['errors'].append(f"{trash_path}: {str(e)}")
+                    continue
+                files[key] = (path, now)
+            result['restored'] += 1
+
+        # 没有被引用、且超过宽限期的文件移到回收区
+        candidates = [(key, path) for key, (path, mtime) in files.items()
+                      if key not in referenced and now - mtime >= self.grace_seconds]
+        if candidates:
+            # 移动前重新读取引用，避免刚保存的发票所引用的文件被移走
+            referenced = self.referenced_paths()
+            self.check_references(files, referenced, root)
+        for key, path in candidates:
+            if key in referenced:
+                continue
+            if not dry_run:
+                try:
+                    self._move(path, self.trash_path_for(path))
+                except OSError as e:
+                    result['errors'].append(f"{path}: {str(e)}")
+                    continue
+                del files[key]
+            result['orphaned'] += 1
+
+        # 超过保留期的回收区文件永久删除
+        expire_before = now - self.retention_days * 24 * 60 * 60
+        for path, mtime in self.scan_files(self.trash_dir).values():
+            if mtime >= expire_before:
+                continue
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    result['errors'].append(f"{path}: {str(e)}")
+                    continue
+            result['purged'] += 1
+
+        if self.file_status is not None and not dry_run:
+            self.file_status.update([path for path, _ in files.values()], self.pdf_dir, scan_started)
+        for error in result['errors']:
+            print(f"PDF reconcile error: {error}")
+        return result
+
+    def start(self, on_done=None):
+        """在后台线程中运行；已在运行时，结束后再运行一轮"""
+        with self._lock:
+            if self._running:
+                self._rerun = True
+                return
+            self._running = True
+
+        def worker():
+            while True:
+                try:
+                    result = self.run()
+                except Exception as e:
+                    result = None
+                    print(f"PDF reconcile failed: {str(e)}")
+                with self._lock:
+                    if not self._rerun:
+                        self._running = False
+                        break
+                    self._rerun = False
+            if on_done and result:
+                on_done(result)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+
+def main(argv=None):
+    """PDF对账命令行"""
+    from utils.database import InvoiceRepository, DEFAULT_DB_PATH
+
+    parser = argparse.ArgumentParser(prog='python -m utils.pdf_reconciler',
+                                     description='把没有发票引用的PDF移到回收区，并清理过期的回收区文件')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='数据库文件')
+    parser.add_argument('--pdf-dir', default='./invoices_pdf', help='PDF存储目录')
+    parser.add_argument('--retention-days', type=int, default=TRASH_RETENTION_DAYS, help='回收区保留天数')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不移动或删除文件')
+    args = parser.parse_args(argv)
+
+    repo = InvoiceRepository(args.db)
+    try:
+        result = PdfReconciler(repo, args.pdf_dir, retention_days=args.retention_days).run(args.dry_run)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    finally:
+        repo.close()
+    print(f"移入回收区 {result['orphaned']} 个，移回 {result['restored']} 个，永久删除 {result['purged']} 个")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
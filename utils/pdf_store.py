@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import uuid
+
+# Linux 上的 FICLONE ioctl（btrfs/xfs 等文件系统支持写时复制克隆）
+FICLONE = 0x40049409
+
+
+class PdfStore:
+    """按SHA-256内容寻址的PDF存储：<root>/ab/cd/<sha256>.pdf，相同内容的PDF只存一份"""
+
+    # 流式复制/计算哈希的缓冲区大小
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, root='./invoices_pdf'):
+        self.root = root
+
+    def path_for(self, digest):
+        """哈希值对应的存储路径（两级目录分散文件）"""
+        return os.path.join(self.root, digest[:2], digest[2:4], f'{digest}.pdf')
+
+    @staticmethod
+    def digest_from_path(path):
+        """从存储路径中取出哈希值；不是内容寻址路径时返回 None"""
+        if not path:
+            return None
+        name = os.path.basename(path)
+        digest = name[:-len('.pdf')] if name.endswith('.pdf') else ''
+        if len(digest) == 64 and all(c in '0123456789abcdef' for c in digest):
+            return digest
+        return None
+
+    def is_stored(self, path):
+        """判断路径是否已经是本存储中的内容寻址路径"""
+        digest = self.digest_from_path(path)
+        return digest is not None and os.path.normpath(path) == os.path.normpath(self.path_for(digest))
+
+    def contains(self, path):
+        """判断文件是否位于存储目录之下"""
+        root = os.path.abspath(self.root)
+        return os.path.commonpath([root, os.path.abspath(path)]) == root
+
+    def hash_file(self, path):
+        """流式计算文件的SHA-256"""
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(self.BUFFER_SIZE)
+                if not data:
+                    break
+                sha256.update(data)
+        return sha256.hexdigest()
+
+    def _same_filesystem(self, source_path):
+        try:
+            return os.stat(source_path).st_dev == os.stat(self.root).st_dev
+        except OSError:
+            return False
+
+    def _reflink(self, source_path, temp_path):
+        """尝试写时复制克隆，成功返回 True"""
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            import fcntl
+            with open(source_path, 'rb') as source, open(temp_path, 'wb') as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return True
+        except (ImportError, OSError):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+    def _copy_and_hash(self, source_path, temp_path):
+        """流式复制文件并同时计算哈希"""
+        sha256 = hashlib.sha256()
+        with open(source_path, 'rb') as source, open(temp_path, 'wb') as target:
+            while True:
+                data = source.read(self.BUFFER_SIZE)
+                if not data:
+                    break
+                sha256.update(data)
+                target.write(data)
+        return sha256.hexdigest()
+
+    def _hardlink(self, source_path, temp_path):
+        """尝试创建硬链接，成功返回 True"""
+        try:
+            os.link(source_path, temp_path)
+            return True
+        except OSError:
+            return False
+
+    def add(self, source_path, link=False):
+        """把PDF存入存储，返回存储路径；link 为 True 表示源文件随后会被删除（如迁移），可直接硬链接"""
+        if self.is_stored(source_path) and os.path.exists(source_path):
+            return source_path
+
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = os.path.join(self.root, f'.incoming-{uuid.uuid4().hex}.tmp')
+        try:
+            # 同一文件系统上优先使用硬链接（仅限源文件随后删除的情况，否则之后修改原文件会
+            # 悄悄改变已存储的内容）或写时复制克隆，都不行时流式复制
+            same_filesystem = self._same_filesystem(source_path)
+            if same_filesystem and ((link and self._hardlink(source_path, temp_path))
+                                    or self._reflink(source_path, temp_path)):
+                digest = self.hash_file(temp_path)
+            else:
+                digest = self._copy_and_hash(source_path, temp_path)
+
+            target_path = self.path_for(digest)
+            if os.path.exists(target_path):
+                # 相同内容已存在，去重；更新修改时间，避免在发票保存前被当作孤立文件移入回收区
+                os.utime(target_path)
+                return target_path
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            # 以存入时间作为修改时间（硬链接会沿用源文件的旧时间），孤立文件的宽限期从存入时算起
+            os.utime(temp_path)
+            os.replace(temp_path, target_path)
+            return target_path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def add_async(self, source_path, callback):
+        """在工作线程中存入PDF，完成后在工作线程中调用 callback(存储路径, 错误)"""
+        def run():
+            try:
+                path = self.add(source_path)
+            except OSError as e:
+                callback(None, e)
+                return
+            callback(path, None)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def migrate_legacy_paths(repo, store, progress=None):
+    """把数据库中的旧式PDF路径迁移到内容寻址存储，返回 (已迁移数, 缺失文件列表)"""
+    # 每个文件先存入存储并更新数据库，提交后才删除旧文件，中断后可以重新运行
+    legacy_paths = [path for path in repo.list_pdf_paths() if not store.is_stored(path)]
+    migrated = 0
+    missing = []
+    for index, old_path in enumerate(legacy_paths, start=1):
+        if not os.path.exists(old_path):
+            missing.append(old_path)
+            continue
+        # 只有存储目录内的旧文件会在迁移后删除，可以硬链接；目录外的文件必须复制，
+        # 否则之后修改原文件会改变已存储的内容
+        in_store = store.contains(old_path)
+        new_path = store.add(old_path, link=in_store)
+        repo.replace_pdf_path(old_path, new_path)
+        migrated += 1
+        if in_store:
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                print(f"Cannot remove legacy PDF {old_path}: {str(e)}")
+        if progress:
+            progress(index, len(legacy_paths))
+    return migrated, missing
+
+
+def main(argv=None):
+    """PDF存储命令行：迁移旧式路径"""
+    from utils.database import InvoiceRepository, DEFAULT_DB_PATH
+
+    parser = argparse.ArgumentParser(prog='python -m utils.pdf_store', description='PDF存储工具')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='数据库文件')
+    parser.add_argument('--pdf-dir', default='./invoices_pdf', help='PDF存储目录')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='把旧式 内容_金额.pdf 路径迁移到内容寻址存储')
+    args = parser.parse_args(argv)
+
+    repo = InvoiceRepository(args.db)
+    try:
+        migrated, missing = migrate_legacy_paths(
+            repo, PdfStore(args.pdf_dir),
+            progress=lambda done, total: print(f"\r{done}/{total}", end='', file=sys.stderr))
+    finally:
+        repo.close()
+    print(f"\n已迁移 {migrated} 个PDF")
+    for path in missing:
+        print(f"文件不存在：{path}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,167 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+from utils.pdf_store import PdfStore
+
+# 单个PDF最多保存的文本长度（字符），防止异常文件撑大索引
+MAX_TEXT_LENGTH = 200000
+
+
+def _extract_with_pypdf(path):
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def _extract_with_pdftotext(path):
+    result = subprocess.run(['pdftotext', '-layout', '-q', path, '-'],
+                            stdin=subprocess.DEVNULL, capture_output=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"pdftotext 退出码 {result.returncode}")
+    return result.stdout.decode('utf-8', errors='replace')
+
+
+def extractor_available():
+    """是否有可用的文字提取方式"""
+    try:
+        import pypdf  # noqa: F401
+        return True
+    except ImportError:
+        return shutil.which('pdftotext') is not None
+
+
+def extract_text(path):
+    """提取PDF的文本层：优先使用 pypdf，未安装时使用 pdftotext 命令"""
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        return _extract_with_pdftotext(path)
+    return _extract_with_pypdf(path)
+
+
+def hash_and_extract(path, digest=None):
+    """在子进程中执行：返回 (pdf_path, sha256, 文本, 错误)；文件无法读取时 sha256 为 None"""
+    try:
+        if digest is None:
+            digest = PdfStore().hash_file(path)
+        elif not os.path.exists(path):
+            return path, None, None, "文件不存在"
+    except OSError as e:
+        return path, None, None, str(e)
+    try:
+        text = ' '.join(extract_text(path).split())[:MAX_TEXT_LENGTH]
+        return path, digest, text, None
+    except Exception as e:
+        # 损坏或加密的PDF也记录下来（文本为空），避免每次都重新解析
+        return path, digest, '', str(e)
+
+
+class PdfTextIndexer:
+    """后台提取所有附件PDF的文字：多进程并行，按文件哈希缓存，分批提交，中断后可继续"""
+
+    # 每批提交的文件数
+    BATCH_SIZE = 50
+
+    def __init__(self, repo, max_workers=None):
+        self.repo = repo
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._running = False
+        self._rerun = False
+
+    def run(self, progress=None):
+        """提取所有尚未索引的PDF，返回处理的文件数；progress(已完成, 总数)"""
+        if not extractor_available():
+            raise RuntimeError("提取PDF文字需要安装 pypdf（pip install pypdf）或 poppler-utils")
+        with self.repo.pool.connection() as conn:
+            pending = self.repo.pending_pdf_paths(conn)
+            # 内容寻址路径的文件名就是哈希，已缓存文本的文件无需再读取
+            digests = {path: PdfStore.digest_from_path(path) for path in pending}
+            known = self.repo.known_pdf_digests((d for d in digests.values() if d), conn)
+        if not pending:
+            return 0
+        from concurrent.futures import ProcessPoolExecutor
+
+        cached = [(path, digests[path], None, None) for path in pending if digests[path] in known]
+        if cached:
+            self._save(cached)
+        # 文件缺失的不交给进程池（只为它们启动进程池不值得），留到文件出现后再提取
+        to_extract = [path for path in pending if digests[path] not in known and os.path.exists(path)]
+        total = len(cached) + len(to_extract)
+        done = len(cached)
+        batch = []
+        if to_extract:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(to_extract))) as executor:
+                futures = [executor.submit(hash_and_extract, path, digests[path]) for path in to_extract]
+                for future in futures:
+                    result = future.result()
+                    if result[1] is not None:  # 文件缺失的留到下次再试
+                        batch.append(result)
+                    done += 1
+                    if len(batch) >= self.BATCH_SIZE:
+                        self._save(batch)
+                        batch = []
+                    if progress:
+                        progress(done, total)
+        if batch:
+            self._save(batch)
+        return done
+
+    def _save(self, results):
+        """每批单独提交，中断后已提交的结果不会丢失"""
+        with self.repo.pool.connection() as conn:
+            self.repo.save_pdf_text(results, conn)
+
+    def start(self, on_done=None):
+        """在后台线程中运行；已在运行时，结束后再运行一轮以包含新增的PDF"""
+        with self._lock:
+            if self._running:
+                self._rerun = True
+                return
+            self._running = True
+
+        def worker():
+            while True:
+                try:
+                    count = self.run()
+                except Exception as e:
+                    count = 0
+                    print(f"PDF text indexing failed: {str(e)}")
+                with self._lock:
+                    if not self._rerun:
+                        self._running = False
+                        break
+                    self._rerun = False
+            if on_done and count:
+                on_done(count)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+
+def main(argv=None):
+    """PDF文字索引命令行"""
+    from utils.database import InvoiceRepository, DEFAULT_DB_PATH
+
+    parser = argparse.ArgumentParser(prog='python -m utils.pdf_text', description='PDF文字索引工具')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='数据库文件')
+    commands = parser.add_subparsers(dest='command', required=True)
+    index_parser = commands.add_parser('index', help='提取所有尚未索引的PDF文字（可随时中断后继续）')
+    index_parser.add_argument('--workers', type=int, default=None, help='进程数（默认CPU核数）')
+    args = parser.parse_args(argv)
+
+    repo = InvoiceRepository(args.db)
+    try:
+        count = PdfTextIndexer(repo, args.workers).run(
+            progress=lambda done, total: print(f"\r{done}/{total}", end='', file=sys.stderr))
+    finally:
+        repo.close()
+    print(f"\n已索引 {count} 个PDF")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
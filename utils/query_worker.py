@@ -0,0 +1,86 @@
+import queue
+import sqlite3
+import threading
+
+
+class QueryWorker:
+    """后台查询线程：只执行最新提交的查询，新的查询会中断正在执行的旧查询"""
+
+    def __init__(self, pool, deliver):
+        # pool: ConnectionPool；deliver(callback) 负责把回调交回界面线程执行
+        self.pool = pool
+        self.deliver = deliver
+        self._jobs = queue.Queue()
+        self._generation = 0
+        self._active_conn = None
+        self._lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, job, on_done, on_error=None):
+        """提交查询 job(conn)；结果在界面线程中通过 on_done(result) 返回"""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            # 取消仍在执行的旧查询
+            if self._active_conn is not None:
+                self._active_conn.interrupt()
+        self._jobs.put((generation, job, on_done, on_error))
+
+    def cancel(self):
+        """取消所有未完成的查询"""
+        self.submit(None, None)
+
+    def stop(self):
+        """停止后台线程"""
+        self.cancel()
+        self._jobs.put(None)
+
+    def _is_current(self, generation):
+        return generation == self._generation
+
+    def _run(self):
+        """后台线程主循环"""
+        while True:
+            task = self._jobs.get()
+            if task is None:
+                break
+            generation, job, on_done, on_error = task
+            # 已被更新的查询取代，直接跳过
+            if job is None or not self._is_current(generation):
+                continue
+
+            with self.pool.connection() as conn:
+                with self._lock:
+                    if not self._is_current(generation):
+                        continue
+                    self._active_conn = conn
+                try:
+                    result = job(conn)
+                except sqlite3.OperationalError as e:
+                    if not self._is_current(generation):
+                        continue  # 被新查询中断
+                    self._deliver_error(generation, on_error, e)
+                    continue
+                except Exception as e:
+                    self._deliver_error(generation, on_error, e)
+                    continue
+                finally:
+                    with self._lock:
+                        self._active_conn = None
+
+            self._deliver(generation, on_done, result)
+
+    def _deliver(self, generation, callback, value):
+        """把结果交回界面线程；交付时若已有更新的查询则丢弃"""
+        def finish():
+            if self._is_current(generation):
+                callback(value)
+        self.deliver(finish)
+
+    def _deliver_error(self, generation, on_error, error):
+        if on_error is not None:
+            self._deliver(generation, on_error, error)
+        else:
+            print(f"Query error: {str(error)}")
@@ -0,0 +1,141 @@
+from array import array
+
+from utils.database import amount_to_cents, normalize_sort_keys, sort_value
+
+_numpy = None
+
+
+def numpy_module():
+    """第一次使用时才导入 NumPy（可选依赖，导入较慢）；不可用时返回 None"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+class RowModel:
+    """已加载列表行的列式存储：编号、金额（原值和分）、报销状态存放在定长数组中，
+    文本列存放在列表中；视图内的排序和小计直接在数组上计算（有 NumPy 时向量化），不经过Tcl"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ids = array('q')
+        self.amounts = array('d')   # 原始金额，还原的行可直接作为键集分页位置
+        self.cents = array('q')
+        self.flags = array('b')
+        self.contents = []
+        self.platforms = []
+        self.expense_types = []
+        self.created_at = []
+        self.positions = {}     # 编号 -> 在数组中的位置
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, invoice_id):
+        return invoice_id in self.positions
+
+    def _set(self, position, row):
+        invoice_id, content, platform, expense_type, amount, reimbursed, created_at = row
+        self.amounts[position] = amount
+        self.cents[position] = amount_to_cents(amount)
+        self.flags[position] = 1 if reimbursed else 0
+        self.contents[position] = content
+        self.platforms[position] = platform
+        self.expense_types[position] = expense_type
+        self.created_at[position] = created_at
+
+    def upsert(self, row):
+        """新增或更新一行（按 LIST_COLUMNS 顺序的原始列表行）"""
+        invoice_id = row[0]
+        position = self.positions.get(invoice_id)
+        if position is None:
+            position = len(self.ids)
+            self.positions[invoice_id] = position
+            self.ids.append(invoice_id)
+            for column in (self.amounts, self.cents, self.flags):
+                column.append(0)
+            for column in (self.contents, self.platforms, self.expense_types, self.created_at):
+                column.append(None)
+        self._set(position, row)
+
+    def extend(self, rows):
+        for row in rows:
+            self.upsert(row)
+
+    def remove(self, invoice_id):
+        """删除一行：用最后一行填补空位，O(1)"""
+        position = self.positions.pop(invoice_id, None)
+        if position is None:
+            return
+        last = len(self.ids) - 1
+        columns = (self.ids, self.amounts, self.cents, self.flags,
+                   self.contents, self.platforms, self.expense_types, self.created_at)
+        if position != last:
+            for column in columns:
+                column[position] = column[last]
+            self.positions[self.ids[position]] = position
+        for column in columns:
+            column.pop()
+
+    def row(self, invoice_id):
+        """还原为原始列表行；不存在时返回 None"""
+        position = self.positions.get(invoice_id)
+        if position is None:
+            return None
+        return (self.ids[position], self.contents[position], self.platforms[position],
+                self.expense_types[position], self.amounts[position], bool(self.flags[position]),
+                self.created_at[position])
+
+    def _ranks(self, values, column):
+        """文本列按 sort_value 的比较规则转换为整数名次（只对不同的取值排序一次）"""
+        distinct = sorted({sort_value(column, value) for value in values})
+        rank = {value: index for index, value in enumerate(distinct)}
+        return array('q', (rank[sort_value(column, value)] for value in values))
+
+    def sort_column(self, column):
+        """返回与 SORT_COLUMNS 排序表达式一致的数值列（金额按原始 REAL 值，文本按名次）"""
+        if column == 'id':
+            return self.ids
+        if column == 'amount':
+            return self.amounts
+        if column == 'reimbursed':
+            return self.flags
+        return self._ranks(getattr(self, {'content': 'contents', 'platform': 'platforms',
+                                          'expense_type': 'expense_types', 'created_at': 'created_at'}[column]),
+                           column)
+
+    def sorted_ids(self, sort_keys):
+        """按排序键返回所有编号（与 ORDER BY 结果一致）"""
+        sort_keys = normalize_sort_keys(sort_keys)
+        columns = [(self.sort_column(column), descending) for column, descending in sort_keys]
+        numpy = numpy_module()
+        if numpy is not None:
+            # lexsort 以最后一个键为主键；降序通过取负实现
+            keys = []
+            for values, descending in reversed(columns):
+                values = numpy.asarray(values)
+                keys.append(-values if descending else values)
+            order = numpy.lexsort(keys)
+            return numpy.frombuffer(self.ids, dtype=numpy.int64)[order].tolist()
+        order = sorted(range(len(self.ids)),
+                       key=lambda i: tuple(-values[i] if descending else values[i] for values, descending in columns))
+        return [self.ids[i] for i in order]
+
+    def subtotal(self, invoice_ids=None):
+        """返回 (数量, 金额合计)；invoice_ids 为 None 时统计全部已加载的行"""
+        if invoice_ids is None:
+            return len(self.ids), sum(self.cents) / 100
+        positions = [self.positions[invoice_id] for invoice_id in invoice_ids if invoice_id in self.positions]
+        numpy = numpy_module()
+        if numpy is not None:
+            total = int(numpy.frombuffer(self.cents, dtype=numpy.int64)[positions].sum())
+        else:
+            total = sum(self.cents[position] for position in positions)
+        return len(positions), total / 100
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+
+# 设置该环境变量后，启动完成时把耗时报告输出到标准错误
+REPORT_ENV_VAR = 'INVOICE_STARTUP_REPORT'
+
+
+class StartupProfile:
+    """记录启动各阶段的耗时（类似 python -X importtime，但按应用的启动阶段统计）"""
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.marks = []             # [(阶段, 距启动的秒数), ...]
+        self.imports = []           # [(模块, 导入耗时秒数), ...]
+        self.finished = False
+
+    def mark(self, label):
+        """记录一个阶段结束的时间点"""
+        self.marks.append((label, time.perf_counter() - self.start))
+
+    def timed_import(self, module_name):
+        """导入模块并记录耗时（用于延迟导入的模块），返回模块对象"""
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        started = time.perf_counter()
+        __import__(module_name)
+        self.imports.append((module_name, time.perf_counter() - started))
+        return sys.modules[module_name]
+
+    def elapsed(self):
+        """最后一个阶段距启动的秒数"""
+        return self.marks[-1][1] if self.marks else 0.0
+
+    def report(self):
+        """生成文本报告：每个阶段的累计耗时和本阶段耗时（毫秒）"""
+        lines = ['启动阶段            累计(ms)  本阶段(ms)']
+        previous = 0.0
+        for label, at in self.marks:
+            lines.append(f'{label:<16}{at * 1000:>10.1f}{(at - previous) * 1000:>12.1f}')
+            previous = at
+        if self.imports:
+            lines.append('')
+            lines.append('延迟导入的模块        耗时(ms)')
+            for module_name, seconds in self.imports:
+                lines.append(f'{module_name:<24}{seconds * 1000:>8.1f}')
+        return '\n'.join(lines)
+
+    def finish(self, label):
+        """记录最后一个阶段；设置了环境变量时输出报告"""
+        if self.finished:
+            return
+        self.finished = True
+        self.mark(label)
+        if os.environ.get(REPORT_ENV_VAR):
+            print(self.report(), file=sys.stderr)
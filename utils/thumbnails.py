@@ -0,0 +1,194 @@
+import collections
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+
+from utils.pdf_store import PdfStore
+
+# 缩略图缓存目录与容量上限
+DEFAULT_CACHE_DIR = './thumbnails'
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def renderer_available():
+    """是否有可用的渲染方式：PyMuPDF 或 pdftoppm 命令"""
+    try:
+        import fitz  # noqa: F401
+        return True
+    except ImportError:
+        return shutil.which('pdftoppm') is not None
+
+
+def _render_with_fitz(pdf_path, target_path, max_size):
+    import fitz
+    with fitz.open(pdf_path) as document:
+        page = document[0]
+        zoom = max_size / max(page.rect.width, page.rect.height)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        pixmap.save(target_path)
+
+
+def _render_with_pdftoppm(pdf_path, target_path, max_size):
+    # pdftoppm 会自动加上 .png 扩展名
+    prefix = target_path[:-len('.png')]
+    subprocess.run(['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+                    '-scale-to', str(max_size), pdf_path, prefix],
+                   stdin=subprocess.DEVNULL, capture_output=True, timeout=60, check=True)
+
+
+def render_first_page(pdf_path, target_path, max_size):
+    """把PDF第一页渲染为PNG（长边为 max_size 像素）"""
+    try:
+        import fitz  # noqa: F401
+    except ImportError:
+        _render_with_pdftoppm(pdf_path, target_path, max_size)
+        return
+    _render_with_fitz(pdf_path, target_path, max_size)
+
+
+class ThumbnailCache:
+    """磁盘上的PDF首页缩略图缓存：按 (文件哈希, 尺寸) 命名，超出容量时删除最久未使用的"""
+    # 超出上限时删到容量的这一比例，之后的多次渲染都不必再扫描缓存目录
+    EVICTION_TARGET = 0.8
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None    # 缓存总大小，第一次渲染后扫描一次，之后累加
+        self._digests = {}          # 非内容寻址路径 -> ((修改时间, 大小), 哈希)
+
+    def key_for(self, pdf_path, max_size):
+        """缓存键：内容寻址路径直接取文件名中的哈希，其他路径的哈希按 (修改时间, 大小) 缓存"""
+        digest = PdfStore.digest_from_path(pdf_path)
+        if digest is None:
+            stat = os.stat(pdf_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = self._digests.get(pdf_path)
+            if cached is not None and cached[0] == signature:
+                digest = cached[1]
+            else:
+                digest = PdfStore().hash_file(pdf_path)
+                self._digests[pdf_path] = (signature, digest)
+        return f'{digest}_{max_size}'
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.png')
+
+    def lookup(self, key):
+        """命中时返回缩略图路径并更新访问时间，否则返回 None"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get(self, pdf_path, max_size):
+        """返回缩略图路径，不存在时渲染并放入缓存"""
+        key = self.key_for(pdf_path, max_size)
+        path = self.lookup(key)
+        if path:
+            return path
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = os.path.join(os.path.dirname(path), f'.render-{uuid.uuid4().hex}.png')
+        try:
+            render_first_page(pdf_path, temp_path, max_size)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+            over_limit = self._total_bytes is None or self._total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+        return path
+
+    def evict(self):
+        """扫描缓存目录得到总大小；超过上限时按访问时间从旧到新删除，直到低于 EVICTION_TARGET"""
+        with self._lock:
+            entries = []
+            total = 0
+            for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+                for name in filenames:
+                    if not name.endswith('.png') or name.startswith('.'):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            if total > self.max_bytes:
+                target = self.max_bytes * self.EVICTION_TARGET
+                entries.sort()
+                for mtime, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except OSError:
+                        pass
+            self._total_bytes = total
+
+
+class PreviewRenderer:
+    """后台渲染缩略图：当前选中的发票优先，相邻发票排在后面预取"""
+
+    def __init__(self, cache, deliver, max_size=360):
+        self.cache = cache
+        self.deliver = deliver
+        self.max_size = max_size
+        self._pending = collections.OrderedDict()   # pdf_path -> callback
+        self._condition = threading.Condition()
+        self._stopped = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def request(self, pdf_path, callback):
+        """渲染选中发票的预览，完成后在界面线程中调用 callback(缩略图路径, 错误)"""
+        with self._condition:
+            # 之前选中但还没渲染的降级为预取，只回调最新的选择
+            for pending_path in self._pending:
+                self._pending[pending_path] = None
+            self._pending[pdf_path] = callback
+            self._pending.move_to_end(pdf_path, last=False)
+            self._condition.notify()
+
+    def prefetch(self, pdf_paths):
+        """预取相邻发票的预览（只写入缓存，不回调）"""
+        with self._condition:
+            for pdf_path in pdf_paths:
+                if pdf_path and pdf_path not in self._pending:
+                    self._pending[pdf_path] = None
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                pdf_path, callback = self._pending.popitem(last=False)
+            try:
+                if not os.path.exists(pdf_path):
+                    raise FileNotFoundError(pdf_path)
+                path, error = self.cache.get(pdf_path, self.max_size), None
+            except Exception as e:
+                path, error = None, e
+            if callback is not None:
+                self.deliver(lambda cb=callback, p=path, e=error: cb(p, e))
@@ -0,0 +1,236 @@
+import collections
+import functools
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# 环内最多保留的事件数与慢查询数
+MAX_EVENTS = 5000
+MAX_SLOW_QUERIES = 100
+
+# 超过该耗时（毫秒）的语句记录 EXPLAIN QUERY PLAN
+SLOW_QUERY_MS = 50
+
+# 设置为 0 时关闭追踪
+TRACE_ENV_VAR = 'INVOICE_TRACE'
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Span:
+    """一次界面操作的计时，结束时记录到追踪器"""
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.rows = None
+        self.started = time.perf_counter()
+        self.finished = False
+
+    def finish(self, rows=None):
+        if self.finished:
+            return
+        self.finished = True
+        if rows is not None:
+            self.rows = rows
+        self.tracer.record('ui', self.name, time.perf_counter() - self.started, self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
+
+
+class TracedCursor:
+    """包装 sqlite3.Cursor：把取结果的时间和行数计入对应的语句事件"""
+
+    def __init__(self, tracer, cursor, event, sql, params, database):
+        self._tracer = tracer
+        self._cursor = cursor
+        self._event = event
+        self._sql = sql
+        self._params = params
+        self._database = database
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _add(self, seconds, rows):
+        self._event['duration_ms'] += seconds * 1000
+        self._event['rows'] = (self._event['rows'] or 0) + rows
+        self._tracer.check_slow(self._event, self._sql, self._params, self._database)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._add(time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._add(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._add(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(100)
+            if not rows:
+                return
+            yield from rows
+
+
+class Tracer:
+    """轻量追踪：SQL语句与界面操作的耗时、行数写入环形缓冲区，慢查询附带执行计划"""
+
+    def __init__(self, max_events=MAX_EVENTS, slow_query_ms=SLOW_QUERY_MS, enabled=True):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.events = collections.deque(maxlen=max_events)
+        self.slow_queries = collections.deque(maxlen=MAX_SLOW_QUERIES)
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, seconds, rows=None):
+        """记录一个事件，返回事件字典"""
+        event = {
+            'kind': kind,
+            'name': name,
+            'at': time.time(),
+            'duration_ms': seconds * 1000,
+            'rows': rows,
+            'thread': threading.current_thread().name,
+        }
+        if self.enabled:
+            self.events.append(event)
+        return event
+
+    def span(self, name):
+        """界面操作计时：with tracer.span('name') as span: ... 或手动 span.finish(rows)"""
+        return Span(self, name)
+
+    def traced(self, name):
+        """装饰器：记录函数每次调用的耗时"""
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def execute(self, conn, sql, params=(), database=None):
+        """执行语句并记录耗时；返回的游标在取结果时继续累计耗时和行数
+
+        database 为数据库文件路径，慢查询的执行计划在该文件的单独连接上获取
+        """
+        if not self.enabled:
+            return conn.execute(sql, params)
+        started = time.perf_counter()
+        cursor = conn.execute(sql, params)
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        event = self.record('sql', ' '.join(sql.split()), time.perf_counter() - started, rows)
+        self.check_slow(event, sql, params, database)
+        return TracedCursor(self, cursor, event, sql, params, database)
+
+    def executemany(self, conn, sql, seq_of_params):
+        """批量执行并记录耗时与影响的行数"""
+        if not self.enabled:
+            return conn.executemany(sql, seq_of_params)
+        started = time.perf_counter()
+        cursor = conn.executemany(sql, seq_of_params)
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        self.record('sql', ' '.join(sql.split()), time.perf_counter() - started, rows)
+        return cursor
+
+    def check_slow(self, event, sql, params, database):
+        """语句累计耗时超过阈值时记录一次执行计划（使用原始SQL文本和参数）"""
+        if event['duration_ms'] < self.slow_query_ms or event.get('slow'):
+            return
+        event['slow'] = True
+        self.slow_queries.append({
+            'sql': sql,
+            'params': [repr(value)[:100] for value in params] if isinstance(params, (list, tuple)) else repr(params),
+            'duration_ms': event['duration_ms'],
+            'rows': event['rows'],
+            'at': event['at'],
+            'plan': self.explain(sql, params, database),
+        })
+
+    def explain(self, sql, params, database):
+        """在单独的连接上获取执行计划：执行语句的连接可能还在取结果，不能在其上执行其他语句"""
+        if database is None:
+            return ['无法获取执行计划：未知数据库文件']
+        try:
+            conn = sqlite3.connect(database, timeout=1)
+            try:
+                return [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return [f'无法获取执行计划：{str(e)}']
+
+    def summary(self):
+        """按名称汇总：次数、总耗时、中位数、p95、最大值（毫秒）"""
+        groups = {}
+        for event in list(self.events):
+            groups.setdefault((event['kind'], event['name']), []).append(event)
+        result = []
+        for (kind, name), events in groups.items():
+            durations = sorted(event['duration_ms'] for event in events)
+            rows = [event['rows'] for event in events if event['rows'] is not None]
+            result.append({
+                'kind': kind,
+                'name': name,
+                'count': len(durations),
+                'total_ms': round(sum(durations), 3),
+                'median_ms': round(_percentile(durations, 0.5), 3),
+                'p95_ms': round(_percentile(durations, 0.95), 3),
+                'max_ms': round(durations[-1], 3),
+                'avg_rows': round(sum(rows) / len(rows), 1) if rows else None,
+            })
+        result.sort(key=lambda item: item['total_ms'], reverse=True)
+        return result
+
+    def clear(self):
+        self.events.clear()
+        self.slow_queries.clear()
+
+    def to_dict(self, extra=None):
+        import platform
+
+        data = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'slow_query_ms': self.slow_query_ms,
+            'summary': self.summary(),
+            'slow_queries': list(self.slow_queries),
+            'events': list(self.events),
+        }
+        data.update(extra or {})
+        return data
+
+    def dump(self, path, extra=None):
+        """把追踪数据写成JSON文件（可附在问题报告中）"""
+        import json
+
+        with self._lock:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(extra), f, ensure_ascii=False, indent=2)
+
+
+# 进程内共用的追踪器
+tracer = Tracer(enabled=os.environ.get(TRACE_ENV_VAR, '1') != '0')
@@ -0,0 +1,29 @@
+import math
+
+from utils.database import MAX_AMOUNT
+
+# 费用类型
+EXPENSE_TYPES = ('垫付', '自费')
+
+
+def validate_invoice_fields(content, amount):
+    """校验发票的必填字段，返回错误信息；校验通过时返回 None"""
+    if not str(content or '').strip():
+        return "请填写报销内容"
+
+    try:
+        amount = float(amount)
+        # 拒绝 "inf"、"nan" 以及大到会使整数分求和溢出的金额
+        if not math.isfinite(amount) or not 0 < amount <= MAX_AMOUNT:
+            raise ValueError
+    except (TypeError, ValueError):
+        return f"请输入有效的金额（大于 0 且不超过 {MAX_AMOUNT:,} 元）"
+
+    return None
+
+
+def validate_expense_type(expense_type):
+    """校验费用类型，返回错误信息；校验通过时返回 None"""
+    if expense_type not in EXPENSE_TYPES:
+        return f"费用类型必须是：{'、'.join(EXPENSE_TYPES)}"
+    return None